@@ -18,6 +18,10 @@ class MessagePreparerExample:
 class ExporterAppExample:
     '''
     Application exporting the message.
+    "export_batch" is optional: without it Logger passes messages to "export" one by one. It returns the messages
+        it could not export (or None), so one bad message does not fail the whole batch.
+    "flush" and "close" are optional too: Logger calls "flush" when the queue is idle and "close"
+        in finish() and stop(). The worker must accept messages after "close", as Logger can be restarted.
     '''
     def __init__(self, preparer: MessagePreparerExample = MessagePreparerExample(),
                  logging_level: str or int = 'DEBUG',
@@ -43,4 +47,15 @@ class ExporterAppExample:
         with self.__mutex:
             export_message = self.__preparer.prepare(message)
             print(export_message)
-            return
\ No newline at end of file
+            return
+
+    def export_batch(self, messages: list,
+                     **kwargs):
+        export_messages = [self.__preparer.prepare(message) for message in messages
+                           if message.logging_level >= self.logging_level]
+        if not export_messages:
+            return
+
+        with self.__mutex:
+            print('\n'.join(export_messages))
+            return
@@ -1,11 +1,21 @@
-from Exceptions.ExceptionTypes import MethodPropertyError
-from FilesSystem.FilesReaders.JSONL import JSONL
+from Exceptions.ExceptionTypes import MethodPropertyError, ProcessingError, ValidationError
+from FilesSystem.NamesParameters import file_name_expander, file_name_preparer
 
 from ..Message.Message import Message
 from ..AppsExamples import MessagePreparerExample
 from ..Message.LoggingLevels import int_logging_level
 
+import concurrent.futures
+import gzip
+import importlib
+import json
+import os
+import shutil
 import threading
+import time
+
+
+compressions = {'gzip': '.gz', 'zstd': '.zst'}  # {сжатие: расширение}
 
 
 class JSONpreparer:
@@ -14,20 +24,129 @@ class JSONpreparer:
         return message.get_dict()
 
 
+def compress_file(full_path: str,
+                  compression: str) -> str:
+    '''
+    Сжимает файл рядом с ним и удаляет исходный.
+
+    :param full_path: путь к файлу
+    :param compression: 'gzip' или 'zstd' (нужен пакет zstandard)
+    :return: путь к сжатому файлу
+    '''
+    compressed_path = full_path + compressions[compression]
+    with open(full_path, mode='rb') as source, open(compressed_path, mode='wb') as target:
+        if compression == 'gzip':
+            with gzip.GzipFile(filename=os.path.basename(full_path), mode='wb', fileobj=target) as archive:
+                shutil.copyfileobj(source, archive)
+        else:
+            importlib.import_module('zstandard').ZstdCompressor().copy_stream(source, target)
+    os.remove(full_path)
+    return compressed_path
+
+
+def rotated_files(file_path: str) -> list:
+    '''
+    Ротированные копии файла лога: "<имя>{time=...}.jsonl", в том числе сжатые.
+
+    :param file_path: путь к активному файлу лога
+    :return: список путей от старых к новым
+    '''
+    directory, name = os.path.split(os.path.abspath(file_path))
+    start = name[:-len('.jsonl')] + '{time='
+    files = []
+    for file_name in os.listdir(directory):
+        if file_name.startswith(start) and '.jsonl' in file_name:
+            files.append((file_name_expander(parameter='time', file_name=file_name), file_name))
+    return [os.path.join(directory, file_name) for _, file_name in sorted(files)]
+
+
 # передаём путь или райтер
 class JsonLogger:
+    '''
+    Пишет сообщения в .jsonl файл, по строке на сообщение.
+    Файл открывается при первой записи и остаётся открытым, а строки копятся в буфере. На диск они сбрасываются
+        каждые flush_every записей, если с прошлого сброса прошло flush_interval секунд, сразу для сообщений
+        уровня flush_level и выше, а также в flush() и close() (их вызывает Logger).
+    Ротация: когда файл дорастает до rotate_bytes или живёт дольше rotate_interval, он переименовывается в
+        "<имя>{time=...}.jsonl" (см. FilesSystem.NamesParameters), а запись продолжается в новый файл.
+        Сжатие ротированного файла и удаление старых копий сверх retention идут в фоновом потоке.
+
+    Методы и свойства:
+        file_path - путь к файлу
+
+        logging_level - минимальный уровень сообщений
+
+        export() - записать сообщение
+
+        export_batch() - записать несколько сообщений
+
+        flush() - сбросить буфер на диск
+
+        close() - сбросить буфер и закрыть файл. Следующая запись откроет его снова.
+
+        rotate() - ротировать файл
+    '''
 
     def __init__(self,
                  file_path: str,
                  logging_level: str or int = 'DEBUG',
-                 preparer: MessagePreparerExample = JSONpreparer()):
+                 preparer: MessagePreparerExample = JSONpreparer(),
+                 buffer_size: int = 65536,
+                 flush_every: int = 100,
+                 flush_interval: float or None = 1.0,
+                 flush_level: str or int = 'ERROR',
+                 encoding: str = 'utf-8',
+                 rotate_bytes: int = None,
+                 rotate_interval: float = None,
+                 compression: str = None,
+                 retention: int = None):
+        '''
 
-        self.__preparer = preparer
-        self.__file_path = file_path
+        :param file_path: путь к .jsonl файлу. Строки дописываются в конец.
+        :param logging_level: минимальный уровень сообщений
+        :param preparer: объект с методом prepare(message), отдающим объект для json
+        :param buffer_size: размер буфера файла в байтах
+        :param flush_every: сбрасывать буфер каждые столько записей. 1 - после каждой.
+        :param flush_interval: сбрасывать буфер, если с прошлого сброса прошло столько секунд. None - не по времени.
+        :param flush_level: сообщения этого уровня и выше сбрасываются сразу, чтобы не потеряться при падении
+        :param encoding: кодировка файла
+        :param rotate_bytes: ротировать файл, когда он дорастает до стольких байт. None - не по размеру.
+        :param rotate_interval: ротировать файл раз в столько секунд с его открытия. None - не по времени.
+        :param compression: сжатие ротированных файлов: 'gzip', 'zstd' (нужен пакет zstandard) или None
+        :param retention: сколько ротированных файлов хранить, старые удаляются. None - все.
+        '''
+        if not file_path.endswith('.jsonl'):
+            raise ValidationError("Incorrect file extension. Only '.jsonl' is available.")
         if not hasattr(preparer, 'prepare'):
             raise MethodPropertyError(f'Worker {type(preparer)} have no "prepare" method.')
+        if flush_every < 1:
+            raise ValueError(f'flush_every must be positive: {flush_every}')
+        if compression is not None and compression not in compressions:
+            raise ValueError(f'Wrong compression: {compression}. Allowed: {", ".join(compressions)}.')
+        if compression == 'zstd':
+            try:
+                importlib.import_module('zstandard')
+            except ImportError as miss:
+                raise ProcessingError('zstd compression needs the "zstandard" package.') from miss
+
+        self.__preparer = preparer
+        self.__file_path = file_path
+        self.__buffer_size = buffer_size
+        self.__flush_every = flush_every
+        self.__flush_interval = flush_interval
+        self.__flush_level = int_logging_level(logging_level=flush_level)
+        self.__encoding = encoding
+        self.__rotate_bytes = rotate_bytes
+        self.__rotate_interval = rotate_interval
+        self.__compression = compression
+        self.__retention = retention
 
-        self.__writer = JSONL()
+        self.__file = None
+        self.__pending = 0  # записей в буфере
+        self.__flushed = time.monotonic()  # время прошлого сброса
+        self.__size = 0  # размер файла в байтах
+        self.__opened = time.monotonic()  # время открытия файла
+        self.__executor = None  # фоновый поток сжатия и удаления старых копий
 
         self.__mutex = threading.RLock()
 
@@ -50,8 +169,175 @@ class JsonLogger:
         if message.logging_level < self.logging_level:
             return
 
+        line = json.dumps(self.__preparer.prepare(message))
         with self.__mutex:
-            export_message = self.__preparer.prepare(message)
-            self.__writer.write_line(file_data=export_message,
-                                     full_path=self.__file_path)
+            self.__write(lines=[line],
+                         logging_level=message.logging_level)
             return
+
+    def export_batch(self, messages: list) -> list:
+        '''
+        Записывает сообщения одной порцией. Сообщение, которое не удалось подготовить или перевести в json,
+            не мешает остальным: оно возвращается вызывающему (Logger отправит его в аварийную доставку).
+
+        :param messages: список сообщений
+        :return: список сообщений, которые не удалось записать
+        '''
+        lines = []
+        failed = []
+        logging_level = None
+        for message in messages:
+            if message.logging_level < self.logging_level:
+                continue
+            try:
+                lines.append(json.dumps(self.__preparer.prepare(message)))
+            except BaseException:
+                failed.append(message)
+                continue
+            if logging_level is None or message.logging_level > logging_level:
+                logging_level = message.logging_level
+
+        if lines:
+            with self.__mutex:
+                self.__write(lines=lines,
+                             logging_level=logging_level)
+        return failed
+
+    def flush(self):
+        '''
+        Сбрасывает накопленные строки на диск.
+
+        :return: ничего
+        '''
+        with self.__mutex:
+            if self.__file is not None and self.__pending > 0:
+                self.__flush()
+            if self.__file is not None and self.__rotation_due():  # Ротация по времени в тихие периоды
+                self.rotate()
+        return
+
+    def close(self):
+        '''
+        Сбрасывает накопленные строки и закрывает файл. Следующая запись откроет его снова.
+
+        :return: ничего
+        '''
+        with self.__mutex:
+            executor, self.__executor = self.__executor, None
+            self.__close_file()
+        if executor is not None:  # Дождёмся сжатия
+            executor.shutdown(wait=True)
+        return
+
+    def rotate(self):
+        '''
+        Переименовывает текущий файл в "<имя>{time=...}.jsonl" и отдаёт в фоновый поток на сжатие и
+            удаление старых копий. Следующая запись создаст новый файл.
+
+        :return: ничего
+        '''
+        with self.__mutex:
+            self.__close_file()
+            if not os.path.exists(self.__file_path):
+                return
+
+            directory, name = os.path.split(os.path.abspath(self.__file_path))
+            start_of_name = name[:-len('.jsonl')]
+            rotated_path = os.path.join(directory, file_name_preparer(start_of_name=start_of_name,
+                                                                      extension='jsonl'))
+            part = 1
+            while os.path.exists(rotated_path):  # Две ротации в одну микросекунду
+                rotated_path = os.path.join(directory, file_name_preparer(start_of_name=start_of_name,
+                                                                          extension='jsonl', part=part))
+                part += 1
+            try:
+                os.replace(self.__file_path, rotated_path)
+            except BaseException as miss:
+                raise ProcessingError(f'File rotation failed.\nfull_path: {self.__file_path}') from miss
+
+            if self.__compression is not None or self.__retention is not None:
+                if self.__executor is None:
+                    self.__executor = concurrent.futures.ThreadPoolExecutor(max_workers=1,
+                                                                            thread_name_prefix='JsonLogger')
+                self.__executor.submit(self.__after_rotation, rotated_path)
+        return
+
+    def __after_rotation(self, rotated_path: str):
+        '''
+        Выполняется в фоновом потоке: сжимает ротированный файл и удаляет старые копии сверх retention.
+
+        :param rotated_path: путь к ротированному файлу
+        :return: ничего
+        '''
+        if self.__compression is not None:
+            compress_file(full_path=rotated_path, compression=self.__compression)
+        if self.__retention is not None:
+            files = rotated_files(self.__file_path)
+            for path in files[:max(len(files) - self.__retention, 0)]:
+                os.remove(path)
+        return
+
+    # ---------------------------------------------------------------------------------------------
+    # Запись --------------------------------------------------------------------------------------
+    # ---------------------------------------------------------------------------------------------
+    def __write(self, lines: list,
+                logging_level: int):
+        '''
+        Дописывает строки в буфер файла и сбрасывает его по правилам из __init__. Вызывается под блокировкой.
+
+        :param lines: строки json без перевода строки
+        :param logging_level: наибольший уровень среди записываемых сообщений
+        :return: ничего
+        '''
+        if self.__file is None:
+            try:
+                self.__file = open(self.__file_path, mode='a', encoding=self.__encoding,
+                                   buffering=self.__buffer_size)
+            except BaseException as miss:
+                raise ProcessingError(f'File opening failed.\nfull_path: {self.__file_path}\n'
+                                      f'encoding: {self.__encoding}') from miss
+            self.__flushed = time.monotonic()
+            self.__opened = self.__flushed
+            self.__size = os.path.getsize(self.__file_path)
+
+        text = ''.join([line + '\n' for line in lines])  # json.dumps отдаёт ASCII: символ - байт
+        try:
+            self.__file.write(text)
+        except BaseException as miss:
+            raise ProcessingError(f'Line export failed.\nfull_path: {self.__file_path}\n'
+                                  f'encoding: {self.__encoding}') from miss
+        self.__pending += len(lines)
+        self.__size += len(text)
+
+        if self.__pending >= self.__flush_every or logging_level >= self.__flush_level or \
+                (self.__flush_interval is not None and time.monotonic() - self.__flushed >= self.__flush_interval):
+            self.__flush()
+
+        if self.__rotation_due():  # Файл может превысить rotate_bytes на одну пачку строк
+            self.rotate()
+        return
+
+    def __rotation_due(self) -> bool:
+        if self.__rotate_bytes is not None and self.__size >= self.__rotate_bytes:
+            return True
+        return self.__rotate_interval is not None and time.monotonic() - self.__opened >= self.__rotate_interval
+
+    def __close_file(self):
+        if self.__file is None:
+            return
+        file, self.__file = self.__file, None
+        self.__pending = 0
+        try:
+            file.close()  # close() сбрасывает буфер
+        except BaseException as miss:
+            raise ProcessingError(f'File closing failed.\nfull_path: {self.__file_path}') from miss
+        return
+
+    def __flush(self):
+        try:
+            self.__file.flush()
+        except BaseException as miss:
+            raise ProcessingError(f'File flush failed.\nfull_path: {self.__file_path}') from miss
+        self.__pending = 0
+        self.__flushed = time.monotonic()
+        return
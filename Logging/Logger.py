@@ -1,17 +1,88 @@
+import functools
 import queue
 import threading
+import time
+import weakref
 
 
 from Exceptions.ExceptionTypes import MethodPropertyError, ProcessingError
 from Logging.AppsExamples import ExporterAppExample
 from Logging.Message.Message import Message
-from Logging.Message.LoggingLevels import int_logging_level
+from Logging.Message.LoggingLevels import int_logging_level, logging_levels_int
 
 
 default_logging_level = 10
+_wake = object()  # Wakes up the queue thread without a message (see stop())
+_preset = object()  # Parameter of LoggingFunction not passed: take the preset one
+level_functions = {name.lower(): level for name, level in logging_levels_int.items()}  # {'debug': 10, ...}
+
+
+def _disabled(*args, **kwargs):
+    '''
+    Logging function of a disabled level.
+    '''
+    return
+
+
+class LoggingFunction:
+    '''
+    Logging function with preset parameters, see Logger.create_logging_function().
+    Call it as Logger.log(), parameters not passed are taken from create_logging_function().
+    Level functions debug(), info(), warning(), error(), critical() are bound by the logger and rebound, when its
+        logging level changes.
+    '''
+
+    def __init__(self, logger,
+                 function_name: str or bool = True,
+                 submodule_name: str = None,
+                 processing_key: str = None,
+                 **kwargs):
+        self.__logger = logger
+        self.__function_name = function_name
+        self.__submodule_name = submodule_name
+        self.__processing_key = processing_key
+        self.__kwargs = kwargs
+
+    def __call__(self, message: str,
+                 function_name: str or bool = _preset,
+                 submodule_name: str = _preset,
+                 processing_key: str = _preset,
+                 logging_level: int or str = 'DEBUG',
+                 error_type: type or None = None,
+                 logging_data: object = None,
+                 exception: tuple or bool = True,
+                 trace: list or bool = False,
+                 **kwargs_new):
+        if type(logging_level) is not int:
+            logging_level = int_logging_level(logging_level=logging_level)
+        if logging_level < self.__logger.logging_level:  # Before any preparation
+            return
+
+        if kwargs_new:
+            kwargs_new = {**self.__kwargs, **kwargs_new}
+        else:
+            kwargs_new = self.__kwargs
+
+        self.__logger.log(message=message,
+                          function_name=self.__function_name if function_name is _preset else function_name,
+                          submodule_name=self.__submodule_name if submodule_name is _preset else submodule_name,
+                          processing_key=self.__processing_key if processing_key is _preset else processing_key,
+                          logging_level=logging_level,
+                          error_type=error_type,
+                          logging_data=logging_data,
+                          exception=exception,
+                          trace=trace,
+                          drop_in_trace=3,  # + this function
+                          **kwargs_new)
+        return
 
 
 class Logger:
+    '''
+    Level functions debug(), info(), warning(), error(), critical() are Logger.log() with a fixed level. The levels
+        below logging_level are bound to a function that does nothing, so a disabled call costs an attribute
+        lookup. set_logging_level() rebinds them, and the ones of the functions from create_logging_function().
+    '''
 
     def __init__(self,
                  app_name: str,
@@ -19,7 +90,10 @@ class Logger:
                  log_launch: bool = False,
                  logging_level: str or int = 'DEBUG',
                  emergency_worker: ExporterAppExample = None,
-                 daemon: bool = True
+                 daemon: bool = True,
+                 batch_size: int = 100,
+                 batch_interval: float = 0.05,
+                 flush_interval: float = 1.0
                  ):
         '''
 
@@ -29,14 +103,22 @@ class Logger:
         :param logging_level: minimal logging level
         :param emergency_worker: logger for messages with failed export
         :param daemon: daemon parameter for Thread
-        :param timeout: Time to try to re-export messages in case of errors.
+        :param batch_size: max messages passed to workers at once (see __process_queue)
+        :param batch_interval: max seconds to wait for more messages after the first one. 0 - take only
+            the messages that are already in the queue.
+        :param flush_interval: if the queue is idle for so many seconds, workers with a "flush" method are flushed
         '''
+        if batch_size < 1:
+            raise ValueError(f'batch_size must be positive: {batch_size}')
 
         self.__app_name = app_name
         self.__launch_key = launch_key
 
         self.__queue = queue.Queue()
         self.__daemon = daemon
+        self.__batch_size = batch_size
+        self.__batch_interval = batch_interval
+        self.__flush_interval = flush_interval
 
         self.__mutex = threading.RLock()
         self.__workers = {}  # словарь с исполнителями
@@ -47,6 +129,8 @@ class Logger:
 
         self.__logging_level = int_logging_level(logging_level=logging_level,
                                                  default_level=10)  # Установим уровень лога
+        self.__logging_functions = weakref.WeakSet()  # from create_logging_function()
+        self._bind_levels(self, self.log, self.__logging_level)
 
         self.__are_we_cool_yet = True  # exceptions detector
 
@@ -75,6 +159,7 @@ class Logger:
     def finish(self, redirect_to_queue: queue.Queue = None):
         '''
         Stops receiving messages on the queue and waits for the message export to complete.
+        Then workers with a "close" method are closed (buffered files are flushed).
         You can restart it later or redirect messages to another logger.
 
         :return:
@@ -84,6 +169,7 @@ class Logger:
             self.__redirect_to_queue = redirect_to_queue
 
         self.__queue.join()
+        self.__call_workers('close')
         return
 
     def stop(self):
@@ -97,7 +183,9 @@ class Logger:
             self.__works = False
             self.__kill = True
 
+        self.__queue.put(_wake)
         self.__thread.join()
+        self.__call_workers('close')
         return
 
     def stop_redirecting(self) -> queue.Queue or None:
@@ -115,6 +203,9 @@ class Logger:
     # ------------------------------------------------------------------------------------------------
     def __process_queue(self):
         '''
+        Takes messages off the queue in batches: up to batch_size messages or batch_interval seconds after the first
+            one. Workers with an "export_batch" method get the whole batch at once, so they pay for opening a file,
+            a transaction or a request once per batch. Other workers get the messages one by one via "export".
 
         :return:
         '''
@@ -123,26 +214,98 @@ class Logger:
                 if self.__kill:
                     break
 
-            message = self.__queue.get()
-            successful_exports = len(self.__workers)
+            batch = self.__take_batch()
+            if batch is None:  # The queue is idle
+                self.__call_workers('flush')
+                continue
+            messages = [message for message in batch if message is not _wake]
 
-            for worker_id in self.__workers.keys():
+            for worker_id, worker in self.workers.items():
+                self.__export(worker_id=worker_id,
+                              worker=worker,
+                              messages=messages)
 
-                try:
-                    self.__workers[worker_id].export(message)
-                except BaseException:
-                    try:
-                        self._emergency_delivery(worker_id=worker_id,
-                                                 message=message)
-                    except BaseException:
-                        successful_exports -= 1
+            for _ in batch:
+                self.__queue.task_done()  # any way delivery is done
 
-            self.__queue.task_done()  # any way delivery is done
+        return
+
+    def __take_batch(self) -> list or None:
+        '''
+        Waits for a message and then collects the following ones.
+
+        :return: list of messages or None, if there were no messages for flush_interval seconds
+        '''
+        try:
+            messages = [self.__queue.get(timeout=self.__flush_interval)]
+        except queue.Empty:
+            return None
+        deadline = time.monotonic() + self.__batch_interval
+        while len(messages) < self.__batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    messages.append(self.__queue.get(timeout=remaining))
+                else:  # Time is up: take only what is already in the queue
+                    messages.append(self.__queue.get_nowait())
+            except queue.Empty:
+                break
+        return messages
+
+    def __call_workers(self, method: str):
+        '''
+        Calls an optional method ("flush", "close") of the workers and the emergency worker that have it.
 
-            # If all workers fail export and no emergency worker is set
-            if successful_exports is 0:
+        :param method: method name
+        :return: nothing
+        '''
+        workers = list(self.workers.values())
+        if self.emergency_worker is not None:
+            workers.append(self.emergency_worker)
+
+        for worker in workers:
+            function = getattr(worker, method, None)
+            if function is None:
+                continue
+            try:
+                function()
+            except BaseException:
                 pass
+        return
+
+    def __export(self, worker_id: int,
+                 worker: ExporterAppExample,
+                 messages: list):
+        '''
+        Passes messages to the worker. Failed messages go to _emergency_delivery.
+        export_batch returns the messages it could not export (or None, if all were exported). If it raises,
+            it is unknown which messages were exported, so the whole batch goes there.
+
+        :param worker_id: worker id
+        :param worker: worker
+        :param messages: list of messages
+        :return: nothing
+        '''
+        export_batch = getattr(worker, 'export_batch', None)
+        if export_batch is not None:
+            try:
+                failed = export_batch(messages) or []
+            except BaseException:
+                failed = messages
+        else:
+            failed = []
+            for message in messages:
+                try:
+                    worker.export(message)
+                except BaseException:
+                    failed.append(message)
 
+        for message in failed:
+            try:
+                self._emergency_delivery(worker_id=worker_id,
+                                         message=message)
+            except BaseException:
+                pass
         return
 
     def _emergency_delivery(self,worker_id: int, message: Message):
@@ -245,6 +408,40 @@ class Logger:
     def logging_level(self) -> int:
         return self.__logging_level
 
+    def set_logging_level(self, logging_level: str or int):
+        '''
+        Changes minimal logging level and rebinds level functions: of the logger and of the functions from
+            create_logging_function().
+
+        :param logging_level: minimal logging level
+        :return: nothing
+        '''
+        with self.__mutex:
+            self.__logging_level = int_logging_level(logging_level=logging_level,
+                                                     default_level=10)
+            self._bind_levels(self, self.log, self.__logging_level)
+            for logging_function in list(self.__logging_functions):
+                self._bind_levels(logging_function, logging_function, self.__logging_level)
+        return
+
+    @staticmethod
+    def _bind_levels(target, function, logging_level: int):
+        '''
+        Sets level functions (debug, info, ...) as attributes of the target: function with the level fixed
+            or _disabled, if the level is below logging_level.
+
+        :param target: Logger or LoggingFunction
+        :param function: logging function with logging_level parameter
+        :param logging_level: minimal logging level
+        :return: nothing
+        '''
+        for name, level in level_functions.items():
+            if level < logging_level:
+                setattr(target, name, _disabled)
+            else:  # partial adds no frame, so Message still finds the caller's function name
+                setattr(target, name, functools.partial(function, logging_level=level))
+        return
+
     @property
     def are_we_cool_yet(self) -> bool:
         '''
@@ -358,7 +555,9 @@ class Logger:
             совпадут  с индексами в data, то индексы, находившиеся в data будут перезаписаны значениями kwargs
         :return:
         '''
-        if int_logging_level(logging_level=logging_level) < self.__logging_level:
+        if type(logging_level) is not int:
+            logging_level = int_logging_level(logging_level=logging_level)
+        if logging_level < self.__logging_level:
             return
 
         if self.works:
@@ -472,7 +671,7 @@ class Logger:
                                 function_name: str or bool = True,
                                 submodule_name: str = None,
                                 processing_key: str = None,
-                                **kwargs) -> bool or None:
+                                **kwargs) -> LoggingFunction:
         '''
         Функция для отправки сообщений на сервер логирования.
         Без мьютекса, чтобы не блокировать работающие потоки на время "ожидания" добавления сообщенияв очередь.
@@ -483,31 +682,15 @@ class Logger:
         :param kwargs: дополнительные параметры, который уйдeт на логирование в json. Если названия параметров
             совпадут  с индексами в data, то индексы, находившиеся в data будут перезаписаны значениями kwargs.
             Параметры не должны пересекаться названиями с параметрами функции .log() !
-        :return:
+        :return: LoggingFunction - вызывается как .log(), а также имеет debug(), info() и т.д.
         '''
+        logging_function = LoggingFunction(logger=self,
+                                           function_name=function_name,
+                                           submodule_name=submodule_name,
+                                           processing_key=processing_key,
+                                           **kwargs)
+        with self.__mutex:
+            self.__logging_functions.add(logging_function)
+            self._bind_levels(logging_function, logging_function, self.__logging_level)
+        return logging_function
 
-        def log(message: str,
-                function_name: str or bool = function_name,
-                submodule_name: str = submodule_name,
-                processing_key: str = processing_key,
-                logging_level: int or str = 'DEBUG',
-                error_type: type or None = None,
-                logging_data: object = None,
-                exception: tuple or bool = True,
-                trace: list or bool = False,
-                **kwargs_new):
-            kwargs_new = {**kwargs, **kwargs_new}
-
-            self.log(message=message,
-                     function_name=function_name,
-                     submodule_name=submodule_name,
-                     processing_key=processing_key,
-                     logging_level=logging_level,
-                     error_type=error_type,
-                     logging_data=logging_data,
-                     exception=exception,
-                     trace=trace,
-                     **kwargs_new)
-            return
-
-        return log
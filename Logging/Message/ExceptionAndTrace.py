@@ -24,6 +24,39 @@ def get_traceback() -> list:
     return trace
 
 
+def capture_stack(depth: int = 0) -> list:
+    '''
+    Быстрый снимок стека для отложенного следа: только код и номер строки каждого кадра, без чтения исходников
+        и форматирования (их делает stack_summary(), когда след действительно нужен).
+        Номер строки берётся сразу: у кадра он меняется, пока функция работает.
+
+    :param depth: сколько вызывающих функций пропустить (кроме этой)
+    :return: список (код, номер строки) от вызывающей функции к корню
+    '''
+    try:
+        frame = sys._getframe(depth + 1)
+    except ValueError:  # Стек короче depth
+        return []
+
+    stack = []
+    while frame is not None:
+        stack.append((frame.f_code, frame.f_lineno))
+        frame = frame.f_back
+    return stack
+
+
+def stack_summary(stack: list) -> list:
+    '''
+    Превращает снимок capture_stack() в след, как от traceback.extract_stack(). Строки исходников читаются
+        при обращении к FrameSummary.line.
+
+    :param stack: список (код, номер строки) от вызывающей функции к корню
+    :return: список traceback.FrameSummary от корня к вызывающей функции
+    '''
+    return [traceback.FrameSummary(code.co_filename, lineno, code.co_name, lookup_line=False)
+            for code, lineno in reversed(stack)]
+
+
 def expand_traceback(trace: list) -> list:
     '''
     Разворачивает "след" в список форматных строк, которые будет удобно обрабатывать в будущем.
@@ -10,6 +10,13 @@ logging_levels_int = {'DEBUG': 10,
                       'CRITICAL': 50}
 default_logging_level = 10
 
+# Числовые уровни для "горячих" вызовов: без поиска по словарю
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+CRITICAL = 50
+
 def int_logging_level(logging_level: str or int or  float, default_level: int = default_logging_level) -> int:
         '''
         Получение форматного целочисленного значения урвоня логирования.
@@ -20,6 +27,9 @@ def int_logging_level(logging_level: str or int or  float, default_level: int =
             10 - DEBUG; 20 - INFO; 30 - WARNING; 40 - ERROR; 50 - CRITICAL.
             Если уровень логирования не опознан, вернётся "дефолтный" - default_logging_level.
         '''
+        if type(logging_level) is int:  # Самый частый случай - уже число
+            return logging_level
+
         if isinstance(logging_level, str):
             try:  # Отдадим значение из словаря
                 return logging_levels_int[logging_level]
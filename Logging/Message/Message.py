@@ -1,6 +1,8 @@
 import datetime
+import sys
+import traceback
 
-from Logging.Message.ExceptionAndTrace import prepare_exception, prepare_trace
+from Logging.Message.ExceptionAndTrace import capture_stack, expand_traceback, stack_summary
 
 # ------------------------------------------------------------------------------------------------
 # Вспомогательные функции ------------------------------------------------------------------------
@@ -12,12 +14,29 @@ def get_function_name(drop_last: int = 0) -> str:
     :param drop_last: сколько вызывающих функций скинуть с конца следа? (кроме этой)
     :return: фортманая строка вида:  obj1.obj2...func
     '''
-    trace = prepare_trace(trace=True, drop_last=drop_last + 1)  # Скидываем сколько сказано + себя
-    export_str = ''
-    for el in trace:
-        export_str += str(el.name) + '.'
-    export_str = export_str[:-1]  # Дропаем последнюю точку
-    return export_str
+    try:
+        frame = sys._getframe(drop_last + 1)  # Скидываем сколько сказано + себя
+    except ValueError:  # Стек короче drop_last
+        return ''
+    return frame_function_name(frame)
+
+
+def frame_function_name(frame) -> str:
+    '''
+    Имя функции по кадру: имена функций всех кадров от корня до этого.
+
+    :param frame: кадр (sys._getframe())
+    :return: фортманая строка вида:  obj1.obj2...func
+    '''
+    names = []
+    while frame is not None:
+        names.append(frame.f_code.co_name)
+        frame = frame.f_back
+    names.reverse()
+    return '.'.join(names)
+
+
+_deferred = object()  # Значение ещё не собрано из снимка стека или исключения
 
 
 # ------------------------------------------------------------------------------------------------
@@ -83,6 +102,11 @@ class Message:
 
         Экспорт
             get_dict() - получить словарь с данными
+
+    Имя функции и след собираются в строки при первом обращении к function_name и trace, то есть только если
+        экспортёр их читает. При создании сообщения для имени функции запоминается только кадр вызывающей функции,
+        для следа - код и номер строки каждого кадра (номера строк меняются, пока функции работают),
+        для исключения - объект его следа. До сборки сообщение держит эти кадры, а с ними и их переменные.
     '''
 
     def __init__(self, message: str,
@@ -136,11 +160,17 @@ class Message:
         :param error_type: тип ошибки, если требуется. Игнорируется, если используется exception.
         :param kwargs: дополнительные параметры, который уйдeт на логирование в json. Если названия параметров
             совпадут  с индексами в data, то индексы, находившиеся в data будут перезаписаны значениями kwargs
-        :param drop_in_trace: сколько скинуть объектов с конца следа?
+        :param drop_in_trace: сколько скинуть объектов с конца следа? По умолчанию 2 - функции логера
+            (Logger.log и Logger._create_message), так что след и имя функции заканчиваются на вызвавшей логер функции.
         '''
 
         self.__message = message
         self.__logging_level = logging_level
+        self.__drop_in_trace = drop_in_trace
+        self.__frame = None  # кадр вызывающей функции для имени функции
+        self.__trace_stack = None  # снимок стека для следа
+        self.__exception_trace = None  # след исключения (traceback)
+        self.__trace_of_exception = False  # след собирается из исключения, а не из снимка стека
 
         # Установим след и исключение
         error_type, exception_message, trace = self.__prepare_exception_and_trace(exception=exception,
@@ -166,9 +196,6 @@ class Message:
         self.__logging_data = logging_data
         self.__additional_data = kwargs
 
-        self.__drop_in_trace = drop_in_trace
-
-
     # ---------------------------------------------------------------------------------------------
     # Подготовка параметров -----------------------------------------------------------------------
     # ---------------------------------------------------------------------------------------------
@@ -185,32 +212,31 @@ class Message:
         :param trace: error_type явно переданный тип ошибки. Игнорируется, если используется exception
         :param trace: список объектов следа, полученный через traceback.extract_stack(), или указание на запрос
             следа внутри функции. Если задан exception_mistake, то trace игнорируется.
-        :return: error_type, exception_message - данные исключения (строка или None), trace - след (список или None).
+        :return: error_type, exception_message - данные исключения (строка или None),
+            trace - след (список, None или _deferred - соберётся при обращении к trace).
         '''
-        if exception is False:  # Если не требуется брать исключение
-            exception = None  # Укажем его отсутствие
+        if exception is True:  # Если ошибку надо запросить тут
+            exception = sys.exc_info()
+        elif not isinstance(exception, tuple):
+            exception = None
 
-        # Выполним развёртку exception_message и traceback
-        exception = prepare_exception(exception_mistake=exception)
-
-        if exception is not None:  # Если исключение есть
+        if exception is not None and exception[0] is not None:  # Если исключение есть
             error_type = exception[0]
             exception_message = exception[1].args[0]
-            trace = exception[2]  # отделили след
-
-        else:  # Если исключения нет
-            exception_message = None
-
-            # Делаем след опционально
-            if isinstance(trace, list):  # Если подан уже след
-                pass
-            elif trace is True:  # Если след набо брать
-                # 3 - эта функция, и функции "вызова" сообщения кроме функции логирования
-                trace = prepare_trace(trace=trace, drop_last=3 + self.__drop_in_trace)
-            else:  # Если False
-                trace = None
-
-        return error_type, exception_message, trace
+            self.__exception_trace = exception[2]  # след развернём при обращении
+            self.__trace_of_exception = True
+            return error_type, exception_message, _deferred
+
+        # Если исключения нет - делаем след опционально
+        if isinstance(trace, list):  # Если подан уже след
+            pass
+        elif trace is True:  # Если след набо брать
+            # 2 - эта функция и __init__
+            self.__trace_stack = capture_stack(depth=2 + self.__drop_in_trace)
+            trace = _deferred
+        else:  # Если False
+            trace = None
+        return error_type, None, trace
 
     def __prepare_function_name(self, function_name: str or bool = True) -> str or None:
         '''
@@ -220,7 +246,11 @@ class Message:
         :return: имя функции
         '''
         if function_name is True:  # Если надо определить имя функции
-            return get_function_name(drop_last=2)  # Берём имя "без себя" и "без функции логирования"
+            try:  # 2 - эта функция и __init__
+                self.__frame = sys._getframe(2 + self.__drop_in_trace)
+            except ValueError:  # Стек короче drop_in_trace
+                return None
+            return _deferred
         elif isinstance(function_name, str):
             return function_name
         else:
@@ -272,6 +302,9 @@ class Message:
 
         :return:
         '''
+        if self.__function_name is _deferred:
+            self.__function_name = frame_function_name(self.__frame)
+            self.__frame = None
         return self.__function_name
 
     def identification(self) -> dict:
@@ -379,6 +412,13 @@ class Message:
 
         :return:
         '''
+        if self.__trace is _deferred:
+            if self.__trace_of_exception:
+                self.__trace = expand_traceback(trace=traceback.extract_tb(self.__exception_trace))
+                self.__exception_trace = None  # Кадры исключения больше не нужны
+            else:  # Снимок стека
+                self.__trace = expand_traceback(trace=stack_summary(self.__trace_stack))
+                self.__trace_stack = None
         return self.__trace
 
     def exception_data(self) -> dict:
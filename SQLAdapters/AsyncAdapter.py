@@ -0,0 +1,246 @@
+from .CommomAdapter import CommonAdapterInterface
+from .ConnectionData import RemoteConnectionData
+
+import asyncio
+import concurrent.futures
+import functools
+
+
+class AsyncAdapter:
+    '''
+    Асинхронная обёртка над CommonAdapterInterface для asyncio.
+    Запросы выполняются существующими драйверами в ограниченном пуле потоков и не блокируют цикл событий.
+    Количество потоков равно размеру пула соединений, поэтому каждый поток работает со своим соединением,
+        а остальные запросы ждут в очереди исполнителя.
+
+    Methods
+        Access
+            engine
+            ConnectionData
+            Adapter - synchronous adapter
+            open
+
+        Standard Methods
+            close()
+
+        Requests
+            request_commit()
+            request_fetch_all()
+            request_fetch_many()
+            request_fetch_value()
+            request_stream()
+            request_fetch_frame()
+
+        Simple Functions
+            simple_check()
+            simple_insert_string()
+            simple_update()
+            simple_insert()
+            simple_upsert()
+            simple_expanded_strings()
+
+        Parameterised Functions
+            param_check()
+            param_insert_string()
+            param_update()
+            bulk_insert()
+            bulk_upsert()
+    '''
+
+    def __init__(self,
+                 connection_data: RemoteConnectionData,
+                 max_connections: int = 10,
+                 **kwargs):
+        '''
+
+        :param connection_data: данные подключения
+        :param max_connections: размер пула соединений и количество потоков исполнителя
+        :param kwargs: прочие параметры CommonAdapterInterface (min_connections, checkout_timeout и т.п.)
+        '''
+        self.__Adapter = CommonAdapterInterface.from_connection_data(connection_data=connection_data,
+                                                                     max_connections=max_connections,
+                                                                     **kwargs)
+        self.__executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_connections,
+                                                                thread_name_prefix='AsyncAdapter')
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def _run(self, function, *args, **kwargs):
+        '''
+        Выполняет синхронную функцию адаптера в пуле потоков.
+
+        :param function: функция
+        :param args: позиционные аргументы
+        :param kwargs: именованные аргументы
+        :return: результат функции
+        '''
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.__executor, functools.partial(function, *args, **kwargs))
+
+    # ------------------------------------------------------------------------------------------------
+    # Access -----------------------------------------------------------------------------------------
+    # ------------------------------------------------------------------------------------------------
+    @property
+    def engine(self) -> str:
+        return self.__Adapter.engine
+
+    @property
+    def ConnectionData(self) -> RemoteConnectionData:
+        return self.__Adapter.ConnectionData
+
+    @property
+    def Adapter(self) -> CommonAdapterInterface:
+        return self.__Adapter
+
+    @property
+    def open(self) -> bool:
+        return self.__Adapter.open
+
+    # ------------------------------------------------------------------------------------------------
+    # Standard Methods -------------------------------------------------------------------------------
+    # ------------------------------------------------------------------------------------------------
+    async def close(self):
+        '''
+        Дожидается выполнения запросов из очереди, закрывает соединения и пул потоков.
+
+        :return: ничего
+        '''
+        await self._run(self.__Adapter.close)
+        self.__executor.shutdown(wait=False)
+        return
+
+    # ------------------------------------------------------------------------------------------------
+    # Requests ---------------------------------------------------------------------------------------
+    # ------------------------------------------------------------------------------------------------
+    async def request_commit(self, request: str,
+                             params: tuple or list or dict = None,
+                             timeout: float = None) -> None:
+        return await self._run(self.__Adapter.request_commit, request=request, params=params, timeout=timeout)
+
+    async def request_fetch_all(self, request: str,
+                                params: tuple or list or dict = None,
+                                timeout: float = None) -> list:
+        return await self._run(self.__Adapter.request_fetch_all, request=request, params=params, timeout=timeout)
+
+    async def request_fetch_many(self, request: str,
+                                 size: int = 1,
+                                 params: tuple or list or dict = None,
+                                 timeout: float = None) -> list:
+        return await self._run(self.__Adapter.request_fetch_many, request=request, size=size, params=params,
+                               timeout=timeout)
+
+    async def request_fetch_value(self, request: str,
+                                  params: tuple or list or dict = None,
+                                  timeout: float = None) -> object:
+        return await self._run(self.__Adapter.request_fetch_value, request=request, params=params, timeout=timeout)
+
+    async def request_stream(self, request: str,
+                             batch_size: int = 1000,
+                             params: tuple or list or dict = None,
+                             batches: bool = False):
+        '''
+        Асинхронный генератор поверх CommonAdapterInterface.request_stream: порции забираются в пуле потоков.
+
+        :param request: запрос
+        :param batch_size: сколько строк забирать с сервера за раз
+        :param params: параметры запроса
+        :param batches: True - отдавать порции, False - строки по одной
+        :return: асинхронный генератор строк или порций
+        '''
+        generator = self.__Adapter.request_stream(request=request, batch_size=batch_size,
+                                                  params=params, batches=True)
+        try:
+            while True:
+                batch = await self._run(next, generator, None)
+                if batch is None:
+                    break
+                if batches:
+                    yield batch
+                else:
+                    for row in batch:
+                        yield row
+        finally:
+            await self._run(generator.close)
+
+    async def request_fetch_frame(self, request: str,
+                                  params: tuple or list or dict = None,
+                                  batch_size: int = 10000):
+        '''
+        Один DataFrame на весь ответ (см. CommonAdapterInterface.request_fetch_frame). По частям - через
+            request_stream.
+
+        :param request: запрос
+        :param params: параметры запроса
+        :param batch_size: сколько строк забирать с сервера за раз
+        :return: pandas.DataFrame
+        '''
+        return await self._run(self.__Adapter.request_fetch_frame, request=request,
+                               params=params, batch_size=batch_size)
+
+    # ------------------------------------------------------------------------------------------------
+    # Simple requests --------------------------------------------------------------------------------
+    # ------------------------------------------------------------------------------------------------
+    async def simple_check(self, table: str, **kwargs) -> bool:
+        return await self._run(self.__Adapter.simple_check, table, **kwargs)
+
+    async def simple_insert_string(self, table: str, **kwargs):
+        return await self._run(self.__Adapter.simple_insert_string, table, **kwargs)
+
+    async def simple_update(self, table: str,
+                            set_values: dict,
+                            where: dict = None):
+        return await self._run(self.__Adapter.simple_update, table=table, set_values=set_values, where=where)
+
+    async def simple_insert(self, table: str,
+                            columns_names: list,
+                            values_list: list,
+                            step: int = 500,
+                            single_commit: bool = True):
+        return await self._run(self.__Adapter.simple_insert, table=table, columns_names=columns_names,
+                               values_list=values_list, step=step, single_commit=single_commit)
+
+    async def simple_upsert(self, table: str,
+                            key_columns: list,
+                            update_columns: list = None,
+                            **kwargs):
+        return await self._run(self.__Adapter.simple_upsert, table, key_columns, update_columns, **kwargs)
+
+    async def simple_expanded_strings(self, table: str, **kwargs) -> list or dict:
+        return await self._run(self.__Adapter.simple_expanded_strings, table, **kwargs)
+
+    # ------------------------------------------------------------------------------------------------
+    # Parameterised requests -------------------------------------------------------------------------
+    # ------------------------------------------------------------------------------------------------
+    async def param_check(self, table: str, **kwargs) -> bool:
+        return await self._run(self.__Adapter.param_check, table, **kwargs)
+
+    async def param_insert_string(self, table: str, **kwargs):
+        return await self._run(self.__Adapter.param_insert_string, table, **kwargs)
+
+    async def param_update(self, table: str,
+                           set_values: dict or list,
+                           where: dict or list = None):
+        return await self._run(self.__Adapter.param_update, table=table, set_values=set_values, where=where)
+
+    async def bulk_insert(self, table: str,
+                          columns_names: list,
+                          rows,
+                          step: int = 10000,
+                          single_commit: bool = True):
+        return await self._run(self.__Adapter.bulk_insert, table=table, columns_names=columns_names,
+                               rows=rows, step=step, single_commit=single_commit)
+
+    async def bulk_upsert(self, table: str,
+                          columns_names: list,
+                          rows,
+                          key_columns: list,
+                          update_columns: list = None,
+                          step: int = 500,
+                          single_commit: bool = True):
+        return await self._run(self.__Adapter.bulk_upsert, table=table, columns_names=columns_names, rows=rows,
+                               key_columns=key_columns, update_columns=update_columns,
+                               step=step, single_commit=single_commit)
@@ -0,0 +1,287 @@
+'''
+Замеры накладных расходов адаптера на временной базе SQLite (не нужен ни один сервис).
+
+Запуск:
+    python -m SQLAdapters.Benchmarks [--rows 100000] [--repeat 5] [--threads 1,4,16] [--materialise-rows 1000000]
+                                     [--output results.jsonl]
+
+Результат - JSONL: первая строка описывает окружение, дальше по строке на замер:
+    {"benchmark": ..., "parameters": {...}, "samples": ..., "units": ..., "throughput": единиц в секунду,
+     "latency": {"mean", "p50", "p95", "p99", "max"} - время одного прогона в секундах}
+Строки удобно сравнивать между версиями, чтобы регрессия была видна до выкладки.
+'''
+
+from .CommomAdapter import CommonAdapterInterface, prepare_equality
+from .Rows import materialise
+
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+
+def percentile(samples: list, q: float) -> float or None:
+    '''
+    Перцентиль с линейной интерполяцией между соседними значениями.
+
+    :param samples: отсортированный список значений
+    :param q: перцентиль от 0 до 100
+    :return: значение или None, если значений нет
+    '''
+    if not samples:
+        return None
+    position = (len(samples) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(samples) - 1)
+    return samples[lower] + (samples[upper] - samples[lower]) * (position - lower)
+
+
+def describe(name: str,
+             durations: list,
+             units: int,
+             **parameters) -> dict:
+    '''
+
+    :param name: название замера
+    :param durations: время прогонов в секундах
+    :param units: сколько единиц работы (строк, вызовов) в одном прогоне
+    :param parameters: параметры замера
+    :return: запись результата
+    '''
+    samples = sorted(durations)
+    total = sum(samples)
+    return {'benchmark': name,
+            'parameters': parameters,
+            'samples': len(samples),
+            'units': units,
+            'throughput': units * len(samples) / total if total > 0 else None,
+            'latency': {'mean': total / len(samples),
+                        'p50': percentile(samples, 50),
+                        'p95': percentile(samples, 95),
+                        'p99': percentile(samples, 99),
+                        'max': samples[-1]}}
+
+
+def measure(name: str,
+            function,
+            units: int,
+            repeat: int,
+            setup=None,
+            **parameters) -> dict:
+    '''
+    Прогоняет function repeat раз после одного прогрева. setup выполняется перед каждым прогоном вне замера.
+
+    :param name: название замера
+    :param function: функция без аргументов
+    :param units: сколько единиц работы в одном прогоне
+    :param repeat: количество прогонов
+    :param setup: функция без аргументов или None
+    :param parameters: параметры замера
+    :return: запись результата
+    '''
+    durations = []
+    for sample in range(repeat + 1):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - started
+        if sample > 0:  # Первый прогон - прогрев
+            durations.append(elapsed)
+    return describe(name, durations, units, **parameters)
+
+
+# ------------------------------------------------------------------------------------------------
+# Замеры -----------------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------------------------
+def bench_inserts(adapter: CommonAdapterInterface,
+                  database: str,
+                  rows: int,
+                  repeat: int) -> list:
+    values = [(number, f'name {number}', number / 3) for number in range(rows)]
+    strings = [f"({number}, 'name {number}', {number / 3})" for number, _, _ in values]
+    columns = ['id', 'name', 'value']
+
+    def clean():
+        adapter.request_commit('DELETE FROM bench_insert')
+
+    def raw_executemany():
+        connection = sqlite3.connect(database)
+        try:
+            connection.executemany('INSERT INTO bench_insert (id, name, value) VALUES (?, ?, ?)', values)
+            connection.commit()
+        finally:
+            connection.close()
+
+    return [measure('simple_insert', lambda: adapter.simple_insert('bench_insert', columns, strings),
+                    units=rows, repeat=repeat, setup=clean, rows=rows, values='quoted strings'),
+            measure('bulk_insert', lambda: adapter.bulk_insert('bench_insert', columns, values),
+                    units=rows, repeat=repeat, setup=clean, rows=rows, values='tuples'),
+            measure('sqlite3_executemany', raw_executemany,
+                    units=rows, repeat=repeat, setup=clean, rows=rows, values='tuples')]
+
+
+def bench_reads(adapter: CommonAdapterInterface,
+                rows: int,
+                repeat: int) -> list:
+    adapter.request_commit('DELETE FROM bench_read')
+    adapter.bulk_insert('bench_read', ['id', 'name', 'value'],
+                        ((number, f'name {number}', number / 3) for number in range(rows)))
+
+    def stream():
+        for _ in adapter.request_stream('SELECT id, name, value FROM bench_read', batch_size=1000):
+            pass
+
+    def stream_batches():
+        for _ in adapter.request_stream('SELECT id, name, value FROM bench_read', batch_size=1000, batches=True):
+            pass
+
+    return [measure('request_fetch_all', lambda: adapter.request_fetch_all('SELECT id, name, value FROM bench_read'),
+                    units=rows, repeat=repeat, rows=rows),
+            measure('request_stream', stream,
+                    units=rows, repeat=repeat, rows=rows, batch_size=1000, batches=False),
+            measure('request_stream', stream_batches,
+                    units=rows, repeat=repeat, rows=rows, batch_size=1000, batches=True),
+            measure('simple_expanded_strings', lambda: adapter.simple_expanded_strings('bench_read'),
+                    units=rows, repeat=repeat, rows=rows)]
+
+
+def bench_prepare_equality(repeat: int,
+                           calls: int = 100000) -> list:
+    values = {f'column_{number}': f"'value {number}'" for number in range(10)}
+
+    def build():
+        for _ in range(calls):
+            prepare_equality(values=values, sep='AND')
+
+    return [measure('prepare_equality', build, units=calls, repeat=repeat, columns=len(values))]
+
+
+def bench_materialise(rows: int,
+                      repeat: int,
+                      columns: int = 8) -> list:
+    '''
+    Сборка строк с именами столбцов без базы: прежний цикл по индексам против Rows.materialise.
+
+    :return: список записей
+    '''
+    names = [f'column_{number}' for number in range(columns)]
+    data = [tuple(range(number, number + columns)) for number in range(rows)]
+
+    def index_loop():  # Как simple_expanded_strings собирал словари раньше
+        export_list = []
+        for result_string in data:
+            export_dict = {}
+            for j in range(0, len(result_string)):
+                export_dict[names[j]] = result_string[j]
+            export_list.append(export_dict)
+        return export_list
+
+    results = [measure('materialise', index_loop, units=rows, repeat=repeat,
+                       rows=rows, columns=columns, row_type='dict', method='index loop')]
+    for row_type in ('dict', 'namedtuple', 'columns'):
+        results.append(measure('materialise', lambda: materialise(names, data, row_type), units=rows, repeat=repeat,
+                               rows=rows, columns=columns, row_type=row_type, method='Rows.materialise'))
+    return results
+
+
+def bench_contention(database: str,
+                     threads_counts: list,
+                     repeat: int,
+                     calls: int = 2000) -> list:
+    '''
+    Одинаковые короткие запросы из нескольких потоков: через один общий адаптер с пулом по числу потоков
+        и через адаптер с единственным соединением, за которое потоки соревнуются.
+
+    :return: список записей
+    '''
+    results = []
+    for threads_count in threads_counts:
+        for max_connections in sorted({threads_count, 1}, reverse=True):
+            adapter = CommonAdapterInterface(engine='SQLite', catalog=database,
+                                             min_connections=max_connections,
+                                             max_connections=max_connections)
+
+            def work():
+                for _ in range(calls):
+                    adapter.request_fetch_value('SELECT 1')
+
+            def run():
+                workers = [threading.Thread(target=work) for _ in range(threads_count)]
+                for worker in workers:
+                    worker.start()
+                for worker in workers:
+                    worker.join()
+
+            results.append(measure('contention', run, units=calls * threads_count, repeat=repeat,
+                                   threads=threads_count, max_connections=max_connections,
+                                   calls_per_thread=calls))
+            adapter.close()
+    return results
+
+
+def run(rows: int = 100000,
+        repeat: int = 5,
+        threads_counts: list = (1, 4, 16),
+        materialise_rows: int = 1000000):
+    '''
+    Генератор записей результата: сначала окружение, затем замеры.
+
+    :param rows: строк в замерах вставки и чтения
+    :param repeat: прогонов на замер
+    :param threads_counts: количества потоков для замера конкуренции
+    :param materialise_rows: строк в замере сборки строк. 0 - не замерять.
+    :return: генератор словарей
+    '''
+    yield {'environment': {'python': platform.python_version(),
+                           'implementation': platform.python_implementation(),
+                           'sqlite': sqlite3.sqlite_version,
+                           'platform': platform.platform(),
+                           'cpus': os.cpu_count()}}
+
+    with tempfile.TemporaryDirectory() as directory:
+        database = os.path.join(directory, 'bench.db')
+        adapter = CommonAdapterInterface(engine='SQLite', catalog=database)
+        adapter.request_commit('CREATE TABLE bench_insert (id INTEGER, name TEXT, value REAL)')
+        adapter.request_commit('CREATE TABLE bench_read (id INTEGER, name TEXT, value REAL)')
+        try:
+            yield from bench_inserts(adapter, database, rows, repeat)
+            yield from bench_reads(adapter, rows, repeat)
+            yield from bench_prepare_equality(repeat)
+            if materialise_rows > 0:
+                yield from bench_materialise(materialise_rows, repeat)
+            yield from bench_contention(database, list(threads_counts), repeat)
+        finally:
+            adapter.close()
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description='SQL adapter benchmarks on a temporary SQLite database.')
+    parser.add_argument('--rows', type=int, default=100000, help='rows for insert and read benchmarks')
+    parser.add_argument('--repeat', type=int, default=5, help='samples per benchmark')
+    parser.add_argument('--threads', default='1,4,16', help='comma separated thread counts for contention')
+    parser.add_argument('--materialise-rows', type=int, default=1000000,
+                        help='rows for the row materialisation benchmark, 0 to skip')
+    parser.add_argument('--output', default=None, help='JSONL file, stdout by default')
+    arguments = parser.parse_args(argv)
+
+    threads_counts = [int(count) for count in arguments.threads.split(',') if count.strip()]
+    output = sys.stdout if arguments.output is None else open(arguments.output, 'w', encoding='utf-8')
+    try:
+        for record in run(rows=arguments.rows, repeat=arguments.repeat, threads_counts=threads_counts,
+                          materialise_rows=arguments.materialise_rows):
+            output.write(json.dumps(record, ensure_ascii=False) + '\n')
+            output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    return
+
+
+if __name__ == '__main__':
+    main()
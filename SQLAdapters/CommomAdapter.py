@@ -1,10 +1,22 @@
 from .ConnectionData import RemoteConnectionData
-from Exceptions.ExceptionTypes import ProcessingError
-
-import pymysql
-import psycopg2
-import sqlite3
+from .ConnectionPool import ConnectionPool, PooledConnection, PoolClosedError, PoolTimeoutError, abandon
+from .Drivers import Driver, csv_line, get_driver
+from .Frames import build_frame
+from .Instrumentation import QueryEvent, estimate_size
+from .ResultCache import ResultCache, normalise_request, normalise_table, read_tables, written_tables
+from .Rows import materialise, row_types
+from .SchemaCache import SchemaCache
+from .WriteQueue import WriteQueue
+from Exceptions.ExceptionTypes import MethodPropertyError, ProcessingError
+
+import concurrent.futures
+import contextlib
+import itertools
+import os
+import random
 import threading
+import time
+import weakref
 
 class NotConnected(Exception):
     pass
@@ -12,8 +24,27 @@ class NotConnected(Exception):
 class RequestExecutionError(Exception):
     pass
 
-# Проверь, как работает конект в многопоточном режиме в тестах!
-# Поставь мьютекс на работу, всё равно на сервере 1 коннект - 1 сессия - 1 процесс. И "быстрее" запрос не выполнится.
+class ConnectionLostError(RequestExecutionError):
+    pass
+
+class QueryCancelledError(RequestExecutionError):
+    pass
+
+# Запросы берут соединения из пула: 1 коннект - 1 сессия - 1 процесс на сервере, поэтому параллельные запросы
+# идут через разные соединения, а не ждут друг друга на одном.
+
+# Адаптеры процесса: после fork() дочерний процесс сбрасывает в них всё, что принадлежит родителю (см. _after_fork)
+_adapters = weakref.WeakSet()
+
+
+def _after_fork_in_child():
+    for adapter in list(_adapters):
+        adapter._after_fork()
+    return
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
 
 def prepare_equality(values: dict,
                      sep: str) -> str:
@@ -44,32 +75,190 @@ def prepare_equality(values: dict,
     return export_string
 
 
+def prepare_placeholders(values: dict or list,
+                         sep: str,
+                         placeholder: str = '%s') -> (str, list):
+    '''
+    Параметризованный вариант prepare_equality: собирает строку вида "key1=%s, key2=%s, ..." и список значений
+        для передачи драйверу. Значения не нужно экранировать и ограничивать кавычками.
+        Для условий (sep='AND') значение None превращается в "key IS NULL".
+
+    :param values: словарь или список с элементами ('имя колонки', значение)
+    :param sep: разделитель: ',' для "SET"; 'AND' для "WHERE"
+    :param placeholder: метка параметра в стиле драйвера ('%s' или '?')
+    :return: строка для вставки и список параметров
+    '''
+    if isinstance(values, dict):
+        values = list(values.items())
+
+    is_condition = sep.strip().upper() == 'AND'
+    parts = []
+    params = []
+    for key, value in values:
+        if value is None and is_condition:
+            parts.append(f"{key} IS NULL")
+        else:
+            parts.append(f"{key}={placeholder}")
+            params.append(value)
+
+    return f' {sep} '.join(parts), params
+
+
+def numbered_placeholders(request: str) -> (str, int):
+    '''
+    Переводит запрос с метками "%s" в запрос с метками "$1, $2, ..." для PREPARE в PostgreSQL.
+        Разбор повторяет psycopg2: каждая "%s" - параметр, "%%" - знак процента.
+
+    :param request: запрос с метками "%s"
+    :return: запрос с нумерованными метками и количество параметров
+    '''
+    parts = request.split('%%')
+    count = 0
+    for j in range(len(parts)):
+        pieces = parts[j].split('%s')
+        numbered = pieces[0]
+        for piece in pieces[1:]:
+            count += 1
+            numbered += f'${count}' + piece
+        parts[j] = numbered
+
+    return '%'.join(parts), count
+
+
+def chunked(rows, size: int):
+    '''
+    Режет итерируемый набор на списки длиной size (последний может быть короче).
+
+    :param rows: итерируемый набор
+    :param size: размер порции
+    :return: генератор списков
+    '''
+    iterator = iter(rows)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def description_names(cursor) -> list:
+    '''
+    Имена столбцов ответа из cursor.description.
+
+    :param cursor: курсор после execute
+    :return: список имён столбцов
+    '''
+    return [column[0] for column in cursor.description]
+
+
+def cache_key(cache_as: object,
+              request: str,
+              params: tuple or list or dict = None) -> tuple or None:
+    '''
+    Ключ кэша ответов: вид ответа, нормализованный запрос и параметры.
+
+    :param cache_as: вид ответа ('all', ('many', size), 'value')
+    :param request: запрос
+    :param params: параметры запроса
+    :return: ключ или None, если параметры нельзя использовать в ключе
+    '''
+    if isinstance(params, dict):
+        params = tuple(sorted(params.items()))
+    elif params is not None:
+        params = tuple(params)
+
+    key = (cache_as, normalise_request(request), params)
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def backoff_delay(attempt: int,
+                  base_delay: float,
+                  max_delay: float) -> float:
+    '''
+    Пауза перед повтором: экспоненциальный рост с полным случайным разбросом ("full jitter"),
+        чтобы клиенты не повторяли запросы одновременно.
+
+    :param attempt: номер повтора, начиная с 1
+    :param base_delay: пауза перед первым повтором
+    :param max_delay: максимальная пауза
+    :return: пауза в секундах
+    '''
+    return random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+
+
+stream_counter = itertools.count()  # для уникальных имён серверных курсоров
+
+
 class CommonAdapterInterface:
     '''
     Methods
         Access
             engine
             ConnectionData
-            Connection
+            clone() - adapter with the same settings
+            Driver - engine driver (see Drivers)
+            Connection - connection pinned to the current thread
+            Pool
+            Cache - result cache
+            WriteQueue - background write queue
             open - is connection open
+            statement_timeout
 
         Standard Methods
             cursor()
             commit()
             rollback()
+            release()
+            ping()
             close()
 
+        Timeouts
+            timeout() - per-thread statement timeout
+            cancel() - abort running queries
+
+        Instrumentation
+            add_hook()
+            drop_hook()
+            notify_hooks()
+
+        Transactions
+            in_transaction
+            transaction()
+            batch()
+
         Requests
             request_commit()
+            request_commit_async() - Future
+            start_write_queue()
             request_fetch_all()
             request_fetch_many()
             request_fetch_value()
+            request_stream()
+            request_fetch_frame() - pandas.DataFrame
 
         Simple Functions
             simple_check()
             simple_insert_string()
             simple_update()
-
+            simple_insert()
+            simple_upsert()
+            simple_expanded_strings()
+            table_columns()
+            invalidate_schema()
+
+        Parameterised Functions
+            placeholder - parameter mark of the driver
+            param_check()
+            param_insert_string()
+            param_update()
+
+        Bulk load
+            bulk_insert()
+            bulk_upsert()
 
     '''
 
@@ -78,7 +267,21 @@ class CommonAdapterInterface:
                  base_name: str = None,
                  catalog: str = None,
                  host: str = None, port: str or int = None,
-                 user: str = None, password: str = None):
+                 user: str = None, password: str = None,
+                 min_connections: int = 1,
+                 max_connections: int = 1,
+                 checkout_timeout: float = None,
+                 max_idle_time: float = None,
+                 health_check_interval: float or None = 30.0,
+                 statement_cache_size: int = 100,
+                 schema_ttl: float or None = 300.0,
+                 result_cache_size: int = 0,
+                 result_cache_ttl: float or None = 60.0,
+                 retries: int = 2,
+                 retry_delay: float = 0.1,
+                 retry_max_delay: float = 2.0,
+                 statement_timeout: float or None = None,
+                 per_process_pool: bool = False):
         '''
 
         :param engine: название движка, на котором работает база (PostgreSQL, MySQL, SQLite). Без версии
@@ -88,6 +291,30 @@ class CommonAdapterInterface:
         :param port: порт
         :param user: пользователь
         :param password: пароль
+        :param min_connections: минимальный размер пула соединений
+        :param max_connections: максимальный размер пула соединений. По умолчанию 1, как у "одного" соединения:
+            настройки сессии (SET ..., временные таблицы) видны всем запросам адаптера.
+        :param checkout_timeout: сколько секунд ждать свободное соединение. None - бесконечно.
+        :param max_idle_time: через сколько секунд простоя закрывать соединения сверх min_connections.
+            None - не закрывать.
+        :param health_check_interval: проверять соединение перед выдачей, если оно простаивало дольше
+            этого времени. None - не проверять.
+        :param statement_cache_size: сколько параметризованных запросов держать подготовленными на каждом
+            соединении (PREPARE в PostgreSQL, кэш запросов sqlite3). 0 - не подготавливать.
+        :param schema_ttl: сколько секунд хранить имена столбцов таблиц в кэше схемы. None - до явного сброса.
+        :param result_cache_size: размер кэша ответов request_fetch_* в байтах. 0 - кэш выключен.
+            Запись через адаптер сбрасывает ответы, читавшие изменённую таблицу.
+        :param result_cache_ttl: время жизни ответа в кэше в секундах. None - до вытеснения или сброса.
+        :param retries: сколько раз повторять запрос при обрыве соединения (см. __execute_retrying)
+        :param retry_delay: пауза перед первым повтором в секундах, дальше она удваивается
+        :param retry_max_delay: максимальная пауза между повторами
+        :param statement_timeout: ограничение времени запроса в секундах по умолчанию (statement_timeout в
+            PostgreSQL, max_execution_time для SELECT в MySQL, обработчик прогресса в SQLite). None - без ограничения.
+            Прерванный запрос - QueryCancelledError. Для отдельных вызовов - timeout().
+        :param per_process_pool: создавать пул при первом запросе в каждом процессе, а не в конструкторе.
+            Родитель pre-fork сервера тогда не открывает соединений, а каждый дочерний процесс наполняет свой пул
+            до min_connections сам. Без этого дочерний процесс тоже не трогает соединения родителя, но пул
+            наследует пустым и открывает соединения по одному по мере запросов.
         '''
 
         self.__ConnectionData = RemoteConnectionData(engine=engine,
@@ -95,49 +322,310 @@ class CommonAdapterInterface:
                                                      catalog=catalog,
                                                      host=host, port=port,
                                                      user=user, password=password)
-        self.__Connection = None
+        self.__pool_parameters = {'min_size': min_connections,
+                                  'max_size': max_connections,
+                                  'timeout': checkout_timeout,
+                                  'max_idle_time': max_idle_time,
+                                  'health_check': None if health_check_interval is None else self._ping,
+                                  'health_check_interval': health_check_interval or 0}
+        self.__statement_cache_size = statement_cache_size
+        self.__Schema = SchemaCache(ttl=schema_ttl)
+        self.__Cache = None if result_cache_size <= 0 else ResultCache(max_bytes=result_cache_size,
+                                                                       ttl=result_cache_ttl)
+        self.__retries = retries
+        self.__retry_delay = retry_delay
+        self.__retry_max_delay = retry_max_delay
+        self.__statement_timeout = statement_timeout
+        self.__per_process_pool = per_process_pool
+        self.__active = {}  # {id соединения: (поток, соединение)} - соединения, занятые запросами
+        self.__hooks = {}
+        self.__Driver = None
+        self.__WriteQueue = None
+        self.__Pool = None
+        self.__local = threading.local()  # соединение, закреплённое за потоком
         self.__mutex = threading.RLock()
+        self.__connected = False
+        _adapters.add(self)
 
         self.connect()
 
+    @classmethod
+    def from_connection_data(cls, connection_data: RemoteConnectionData,
+                             **kwargs):
+        '''
+        Создаёт адаптер по готовому объекту с данными подключения.
+
+        :param connection_data: данные подключения
+        :param kwargs: прочие параметры адаптера (размер пула, таймауты и т.п.)
+        :return: адаптер
+        '''
+        return cls(engine=connection_data.engine,
+                   base_name=connection_data.base_name,
+                   catalog=connection_data.catalog,
+                   host=connection_data.host, port=connection_data.port,
+                   user=connection_data.user, password=connection_data.password,
+                   **kwargs)
+
+    def clone(self, **kwargs):
+        '''
+        Создаёт новый адаптер к той же базе с теми же настройками: пул, таймауты, повторы, кэш запросов.
+            Соединения, кэш ответов и хуки не переносятся.
+
+        :param kwargs: параметры конструктора, которые нужно заменить (например, max_connections)
+        :return: адаптер
+        '''
+        parameters = {'min_connections': self.__pool_parameters['min_size'],
+                      'max_connections': self.__pool_parameters['max_size'],
+                      'checkout_timeout': self.__pool_parameters['timeout'],
+                      'max_idle_time': self.__pool_parameters['max_idle_time'],
+                      'health_check_interval': self.__pool_parameters['health_check_interval'] or None,
+                      'statement_cache_size': self.__statement_cache_size,
+                      'schema_ttl': self.__Schema.ttl,
+                      'retries': self.__retries,
+                      'retry_delay': self.__retry_delay,
+                      'retry_max_delay': self.__retry_max_delay,
+                      'statement_timeout': self.__statement_timeout,
+                      'per_process_pool': self.__per_process_pool}
+        parameters.update(kwargs)
+        return type(self).from_connection_data(connection_data=self.ConnectionData, **parameters)
 
     def connect(self):
         '''
-        Функция создаёт соединение, устанавливая его в self._connection.
-        Она нужна для того, чтобы обеспечить разные наборы праметров для разных пакетов.
+        Функция создаёт пул соединений, устанавливая его в self.Pool.
+        Если пул уже был, он закрывается. С per_process_pool пул создастся при первом запросе.
 
-        :return: объект соединения.
+        :return: ничего
         '''
 
         with self.__mutex:
-            engine = self.ConnectionData.engine
             try:
-                if engine == 'MySQL':
-                    self.__Connection = pymysql.connect(host=self.ConnectionData.host,
-                                                        port=self.ConnectionData.port,
-                                                        user=self.ConnectionData.user,
-                                                        password=self.ConnectionData.password,
-                                                        database=self.ConnectionData.base_name
-                                                        )  # законектились
-                elif engine == 'PostgreSQL':
-                    self.__Connection = psycopg2.connect(host=self.ConnectionData.host,
-                                                         port=self.ConnectionData.port,
-                                                         user=self.ConnectionData.user,
-                                                         password=self.ConnectionData.password,
-                                                         dbname=self.ConnectionData.base_name
-                                                         )  # законектились
-                elif engine == 'SQLite':
-                    self.__Connection = sqlite3.connect(database=self.ConnectionData.catalog)  # законектились
+                driver = get_driver(self.ConnectionData.engine)
+            except ProcessingError as miss:
+                raise ProcessingError(f'SQL adapter creation failed. {miss}') from None
 
-                else:
-                    raise ProcessingError(f'SQL adapter creation failed. Wrong engine type: {engine}. ' +
-                                          'Allowed: MySQL, PostgreSQL, SQLite.')
-            except BaseException as miss:
-                raise ProcessingError(f'SQL adapter creation failed.') from miss
+            # Закреплённые за потоками соединения старого пула доработают и закроются при возврате
+            if self.__Pool is not None:
+                self.__Pool.close()
+
+            self.__Driver = driver
+            self.__Pool = None
+            if not self.__per_process_pool:
+                try:
+                    self.__Pool = self.__new_pool()
+                except BaseException as miss:
+                    raise ProcessingError(f'SQL adapter creation failed.') from miss
 
             self.__connected = True
         return
 
+    def __new_pool(self) -> ConnectionPool:
+        return ConnectionPool(factory=self._new_connection,
+                              **self.__pool_parameters)
+
+    def _after_fork(self):
+        '''
+        Вызывается в дочернем процессе сразу после fork(). Соединения родителя (в пуле, закреплённые за потоками,
+            занятые запросами) забываются без закрытия, иначе закрылась бы и сессия родителя.
+            Блокировки, которые мог держать поток родителя, создаются заново. Потоков очереди записей
+            в дочернем процессе нет, поэтому очередь тоже забывается: её запросы выполнит родитель.
+        Новые соединения откроются при первом запросе.
+
+        :return: ничего
+        '''
+        pinned = getattr(self.__local, 'pinned', None)
+        if pinned is not None:
+            abandon(pinned.connection)
+        for _, pooled in self.__active.values():
+            abandon(pooled.connection)
+
+        self.__mutex = threading.RLock()
+        self.__local = threading.local()
+        self.__active = {}
+        self.__WriteQueue = None
+        self.__Schema = SchemaCache(ttl=self.__Schema.ttl)
+        if self.__Cache is not None:  # Ответы не устарели, но блокировку кэша мог держать поток родителя
+            self.__Cache = ResultCache(max_bytes=self.__Cache.max_bytes, ttl=self.__Cache.ttl)
+
+        if self.__Pool is not None:
+            self.__Pool.after_fork()
+            if self.__per_process_pool:  # Свой пул процесса создастся при первом запросе
+                self.__Pool = None
+        return
+
+    def _new_connection(self):
+        '''
+        Функция создаёт новое соединение драйвера.
+        Параметры подключения у каждого пакета свои, поэтому соединение создаёт драйвер движка (см. Drivers).
+
+        :return: объект соединения.
+        '''
+        driver = self.Driver
+        connection = driver.connect(self.ConnectionData,
+                                    statement_cache_size=self.__statement_cache_size)
+        if driver.session_timeout and self.__statement_timeout is not None:
+            driver.set_timeout(connection, self.__statement_timeout)
+            connection.commit()  # SET в PostgreSQL транзакционный
+        return connection
+
+    @staticmethod
+    def _ping(connection) -> bool:
+        '''
+        Проверка соединения перед выдачей из пула.
+
+        :param connection: соединение драйвера
+        :return: True - соединение рабочее
+        '''
+        cursor = connection.cursor()
+        try:
+            cursor.execute('SELECT 1')
+            cursor.fetchall()
+        finally:
+            cursor.close()
+        return True
+
+    @contextlib.contextmanager
+    def _borrow(self):
+        '''
+        Берёт соединение на время запроса: закреплённое за потоком, если оно есть, иначе - из пула.
+        На время запроса соединение доступно cancel() и ограничено по времени (см. timeout()).
+
+        :return: контекстный менеджер, отдающий PooledConnection
+        '''
+        with self.__checkout() as pooled:
+            key = id(pooled)
+            with self.__mutex:
+                self.__active[key] = (threading.get_ident(), pooled)
+            try:
+                with self.__timed(pooled):
+                    yield pooled
+            finally:
+                with self.__mutex:
+                    self.__active.pop(key, None)
+
+    @contextlib.contextmanager
+    def __timed(self, pooled: PooledConnection):
+        '''
+        Ставит на соединение ограничение времени запроса и возвращает прежнее после него.
+
+        :param pooled: соединение
+        :return: контекстный менеджер
+        '''
+        driver = self.Driver
+        override = getattr(self.__local, 'timeout', None)
+        if driver.session_timeout:
+            if override is None:  # Действует настройка сессии из _new_connection()
+                yield
+                return
+            timeout, restore = override or None, self.__statement_timeout
+        else:
+            timeout = self.__statement_timeout if override is None else override or None
+            if timeout is None:
+                yield
+                return
+            restore = None
+
+        driver.set_timeout(pooled.connection, timeout)
+        try:
+            yield
+        finally:
+            try:
+                driver.set_timeout(pooled.connection, restore)
+                if driver.session_timeout and getattr(self.__local, 'pinned', None) is None:
+                    pooled.connection.commit()  # Иначе откат следующей транзакции вернул бы ограничение вызова
+            except BaseException:  # Прерванную транзакцию откатит _borrow(), вместе с настройкой
+                pass
+
+    @contextlib.contextmanager
+    def __checkout(self):
+        if not self.open:  # Если соединения нет
+            raise NotConnected('Adapter not connected.')
+
+        pinned = getattr(self.__local, 'pinned', None)
+        if pinned is not None:
+            try:
+                yield pinned
+            except BaseException as miss:
+                # Транзакцию не трогаем: её откатит transaction(). Иначе мёртвое соединение открепляем.
+                if self.in_transaction or self.__alive_after_error(pinned):
+                    raise
+                self.__local.pinned = None
+                self.__connection_lost(pinned)
+                self.__raise_lost(miss)
+            return
+
+        pool = self.Pool
+        try:
+            pooled = pool.acquire()
+        except (PoolTimeoutError, PoolClosedError):
+            raise
+        except BaseException as miss:
+            raise NotConnected('Connection to the server failed.') from miss
+
+        try:
+            yield pooled
+        except BaseException as miss:
+            # В пул не должно вернуться соединение с прерванной транзакцией или оборванное
+            if self.__alive_after_error(pooled):
+                pool.release(pooled)
+                raise
+            self.__connection_lost(pooled)
+            self.__raise_lost(miss)
+        else:
+            pool.release(pooled)
+
+    def __alive_after_error(self, pooled: PooledConnection) -> bool:
+        '''
+        Откатывает соединение после ошибки и проверяет, живо ли оно.
+
+        :param pooled: соединение
+        :return: True - соединение можно использовать дальше
+        '''
+        try:
+            pooled.connection.rollback()
+            return self._ping(pooled.connection)
+        except BaseException:
+            return False
+
+    def __connection_lost(self, pooled: PooledConnection):
+        '''
+        Выбрасывает оборванное соединение. Свободные соединения, скорее всего, оборваны тем же
+            (перезапуск сервера, сетевой сбой), поэтому закрываются и они: следующие запросы откроют новые.
+
+        :param pooled: оборванное соединение
+        :return: ничего
+        '''
+        pool = self.Pool
+        pool.release(pooled, discard=True)
+        pool.clear_idle()
+        return
+
+    @staticmethod
+    def __raise_lost(miss: BaseException):
+        if isinstance(miss, RequestExecutionError) and not isinstance(miss, ConnectionLostError):
+            raise ConnectionLostError(*miss.args) from (miss.__cause__ or miss)
+        raise miss
+
+    def _pinned(self) -> PooledConnection:
+        '''
+        Отдаёт соединение, закреплённое за текущим потоком. Если его нет - берёт из пула и закрепляет.
+        Закреплённое соединение используется всеми запросами потока до вызова release().
+
+        :return: PooledConnection
+        '''
+        if not self.open:  # Если соединения нет
+            raise NotConnected('Adapter not connected.')
+
+        pinned = getattr(self.__local, 'pinned', None)
+        if pinned is None:
+            try:
+                pinned = self.Pool.acquire()
+            except (PoolTimeoutError, PoolClosedError):
+                raise
+            except BaseException as miss:
+                raise NotConnected('Connection to the server failed.') from miss
+            self.__local.pinned = pinned
+        return pinned
+
     # ------------------------------------------------------------------------------------------------
     # Access -----------------------------------------------------------------------------------------
     # ------------------------------------------------------------------------------------------------
@@ -160,158 +648,917 @@ class CommonAdapterInterface:
         with self.__mutex:
             return self.__ConnectionData
 
+    @property
+    def placeholder(self) -> str:
+        '''
+        Метка параметра в запросах для драйвера движка: '?' для SQLite, '%s' для MySQL и PostgreSQL.
+
+        :return: строка - метка
+        '''
+        return self.Driver.placeholder
+
+    @property
+    def Driver(self) -> Driver:
+        '''
+        Драйвер движка из реестра (см. Drivers.register_driver).
+
+        :return: объект Driver
+        '''
+        with self.__mutex:
+            if self.__Driver is None:
+                return get_driver(self.engine)
+            return self.__Driver
+
     @property
     def Connection(self):
+        '''
+        Соединение, закреплённое за текущим потоком (см. release()).
+
+        :return: соединение драйвера
+        '''
+        return self._pinned().connection
+
+    @property
+    def Pool(self) -> ConnectionPool:
         with self.__mutex:
-            return self.__Connection
+            if self.__Pool is None and self.__connected:  # per_process_pool: первый запрос в процессе
+                try:
+                    self.__Pool = self.__new_pool()
+                except BaseException as miss:
+                    raise NotConnected('Connection to the server failed.') from miss
+            return self.__Pool
+
+    @property
+    def Cache(self) -> ResultCache or None:
+        '''
+        Кэш ответов или None, если он выключен.
+
+        :return:
+        '''
+        return self.__Cache
 
     @property
     def open(self) -> bool:
         with self.__mutex:
             return self.__connected
 
+    @property
+    def WriteQueue(self) -> WriteQueue or None:
+        '''
+        Очередь фоновых записей или None, если она не запущена (см. start_write_queue()).
+
+        :return:
+        '''
+        with self.__mutex:
+            return self.__WriteQueue
+
     # ------------------------------------------------------------------------------------------------
     # Standard Methods -------------------------------------------------------------------------------
     # ------------------------------------------------------------------------------------------------
     def cursor(self, **kwargs):
         '''
-        Returns cursor.
+        Returns cursor of the connection pinned to the current thread.
 
         :param kwargs:
         :return:
         '''
-        with self.__mutex:
-            return self.__Connection.cursor(**kwargs)
+        return self.Connection.cursor(**kwargs)
 
     def commit(self):
-        with self.__mutex:
-            self.__Connection.commit()
+        self.Connection.commit()
+        if self.__Cache is not None:  # Какие таблицы менялись через курсор, неизвестно
+            self.__Cache.invalidate()
         return
 
     def rollback(self):
-        with self.__mutex:
-            self.__Connection.rollback()
+        self.Connection.rollback()
         return
 
+    def release(self):
+        '''
+        Возвращает в пул соединение, закреплённое за текущим потоком через Connection/cursor().
+        Незакоммиченные изменения откатываются.
+
+        :return: ничего
+        '''
+        if self.in_transaction:
+            raise ProcessingError('Connection release inside transaction().')
+
+        pinned = getattr(self.__local, 'pinned', None)
+        if pinned is None:
+            return
+        self.__local.pinned = None
+
+        discard = False
+        try:
+            pinned.connection.rollback()
+        except BaseException:
+            discard = True
+        self.Pool.release(pinned, discard=discard)
+        return
+
+    def ping(self, reconnect: bool = True) -> bool:
+        '''
+        Проверяет, что сервер доступен. Оборванные соединения выбрасываются из пула.
+
+        :param reconnect: если проверка не прошла - пересоздать пул через connect() и проверить ещё раз
+        :return: True - сервер отвечает
+        '''
+        if not self.open:  # Закрытый адаптер не переоткрываем
+            return False
+
+        try:
+            self.__execute(request='SELECT 1', fetch=lambda cursor: cursor.fetchall())
+            return True
+        except (NotConnected, RequestExecutionError, PoolTimeoutError, PoolClosedError):
+            if not reconnect:
+                return False
+
+        try:
+            self.connect()
+            self.__execute(request='SELECT 1', fetch=lambda cursor: cursor.fetchall())
+            return True
+        except BaseException:
+            return False
+
     def close(self):
         with self.__mutex:
-            self.__Connection.close()
+            write_queue, self.__WriteQueue = self.__WriteQueue, None
+        if write_queue is not None:  # Запросы из очереди выполнятся до закрытия
+            write_queue.close()
+
+        with self.__mutex:
+            pinned = getattr(self.__local, 'pinned', None)
+            self.__local.pinned = None
+            if self.__Pool is not None:
+                self.__Pool.close()
+                if pinned is not None:  # Закрытый пул закроет соединение при возврате
+                    self.__Pool.release(pinned)
             self.__connected = False
         return
 
     # ------------------------------------------------------------------------------------------------
-    # Requests ---------------------------------------------------------------------------------------
+    # Timeouts ---------------------------------------------------------------------------------------
     # ------------------------------------------------------------------------------------------------
-    def request_commit(self, request: str) -> bool or None:
+    @property
+    def statement_timeout(self) -> float or None:
+        return self.__statement_timeout
+
+    @contextlib.contextmanager
+    def timeout(self, seconds: float or None):
         '''
-        Функция для передачи запросов в базу с коммитом.
+        Ограничение времени для запросов текущего потока внутри контекста, вместо statement_timeout адаптера.
 
-        :param request: запрос к базе данных
-        :return: True - успешно, False - нет соединения, None - ошибка отправки запроса или коммита
+            with adapter.timeout(5):
+                adapter.simple_expanded_strings(...)
+
+        :param seconds: ограничение в секундах. 0 - без ограничения, None - как у адаптера.
+        :return: контекстный менеджер
+        '''
+        state = self.__local
+        outer = getattr(state, 'timeout', None)
+        state.timeout = seconds
+        try:
+            yield self
+        finally:
+            state.timeout = outer
+
+    def __call_timeout(self, seconds: float or None):
+        if seconds is None:
+            return contextlib.nullcontext()
+        return self.timeout(seconds)
+
+    def cancel(self, thread: threading.Thread or int = None) -> int:
         '''
+        Прерывает выполняющиеся запросы адаптера. Можно вызывать из любого потока.
+            Прерванный запрос завершается исключением QueryCancelledError, соединение остаётся в пуле.
 
-        if not self.open:  # Если соединения нет
-            raise NotConnected('Adapter not connected.')
+        :param thread: поток (или его ident), запрос которого прервать. None - все запросы адаптера.
+        :return: сколько запросов прервано
+        '''
+        if isinstance(thread, threading.Thread):
+            thread = thread.ident
 
         with self.__mutex:
+            targets = [pooled for ident, pooled in self.__active.values() if thread is None or ident == thread]
+
+        cancelled = 0
+        for pooled in targets:
             try:
-                cursor = self.Connection.cursor()  # Взяли курсор
-                cursor.execute(request)  # отправили запрос
-                self.Connection.commit()  # Внесём изменения в базу
-                return
+                if self.Driver.cancel(pooled.connection, self.ConnectionData):
+                    cancelled += 1
+            except BaseException:  # Запрос мог успеть завершиться, а соединение - закрыться
+                pass
+        return cancelled
 
-            except BaseException as miss:  # Если вышла ошибка
+    # ------------------------------------------------------------------------------------------------
+    # Instrumentation --------------------------------------------------------------------------------
+    # ------------------------------------------------------------------------------------------------
+    def add_hook(self, hook) -> int:
+        '''
+        Добавляет хук, который вызывается после каждого запроса к базе с объектом QueryEvent:
+            отпечаток запроса, полное время, время ожидания соединения, строки, байты, ошибка.
+            Например, QueryMetrics собирает из них перцентили по отпечаткам.
+
+        :param hook: функция вида func(QueryEvent). Исключения хука игнорируются.
+        :return: индекс хука
+        '''
+        if not callable(hook):
+            raise MethodPropertyError(f'Hook {type(hook)} is not callable.')
+
+        with self.__mutex:
+            if self.__hooks != {}:
+                new_id = max(self.__hooks) + 1
+            else:
+                new_id = 1
+
+            hooks = dict(self.__hooks)  # Новый словарь: запросы перебирают хуки без блокировки
+            hooks[new_id] = hook
+            self.__hooks = hooks
+            return new_id
+
+    def drop_hook(self, hook_id: int):
+        '''
+
+        :param hook_id: индекс хука
+        :return: ничего
+        '''
+        with self.__mutex:
+            if hook_id not in self.__hooks:
+                raise KeyError(f'No such hook: {hook_id}')
+            hooks = dict(self.__hooks)
+            hooks.pop(hook_id)
+            self.__hooks = hooks
+        return
+
+    def __report(self, request: str,
+                 started: float,
+                 waited: float,
+                 rows: int,
+                 size: int,
+                 error: BaseException or None):
+        '''
+        Передаёт данные о выполнении запроса хукам.
+
+        :param request: запрос
+        :param started: time.perf_counter() в начале запроса
+        :param waited: время ожидания соединения
+        :param rows: количество строк
+        :param size: примерный объём ответа в байтах
+        :param error: исключение или None
+        :return: ничего
+        '''
+        event = QueryEvent(request=request,
+                           wall_time=time.perf_counter() - started,
+                           wait_time=waited,
+                           rows=rows,
+                           bytes=size,
+                           error=error)
+        self.notify_hooks(event)
+        return
+
+    def notify_hooks(self, event: QueryEvent):
+        '''
+        Передаёт событие хукам адаптера. Так очередь записей пересылает хукам владельца события своих писателей.
+
+        :param event: QueryEvent
+        :return: ничего
+        '''
+        for hook in self.__hooks.values():
+            try:
+                hook(event)
+            except BaseException:
+                pass
+        return
+
+    # ------------------------------------------------------------------------------------------------
+    # Transactions -----------------------------------------------------------------------------------
+    # ------------------------------------------------------------------------------------------------
+    @property
+    def in_transaction(self) -> bool:
+        '''
+        Выполняется ли текущий поток внутри transaction() или batch().
+
+        :return:
+        '''
+        return getattr(self.__local, 'depth', 0) > 0
+
+    @contextlib.contextmanager
+    def transaction(self):
+        '''
+        Контекст единицы работы: все запросы потока идут через одно соединение, а коммит выполняется один раз
+            при выходе. При исключении изменения откатываются.
+            Вложенный transaction() создаёт точку сохранения (SAVEPOINT): исключение откатывает только её.
+            Внутри batch() накопленные запросы отправляются до точки сохранения, а отложенные после неё
+            при исключении выбрасываются из очереди.
+
+            with adapter.transaction():
+                adapter.simple_insert_string(...)
+                adapter.simple_update(...)
+
+        :return: контекстный менеджер, отдающий адаптер
+        '''
+        state = self.__local
+        depth = getattr(state, 'depth', 0)
+
+        if depth > 0:  # Вложенная транзакция - точка сохранения
+            self.__flush_batch()  # Запросы batch(), отложенные до точки сохранения, она откатывать не должна
+            name = f'mengine_savepoint_{depth}'
+            self.__execute(request=f'SAVEPOINT {name}', fetch=None)
+            state.depth = depth + 1
+            try:
+                yield self
+            except BaseException:
+                batch = getattr(state, 'batch', None)
+                if batch is not None:  # Отложенное после точки сохранения не отправляем
+                    batch.clear()
+                self.__execute(request=f'ROLLBACK TO SAVEPOINT {name}', fetch=None)
+                self.__execute(request=f'RELEASE SAVEPOINT {name}', fetch=None)
+                raise
+            else:
+                self.__execute(request=f'RELEASE SAVEPOINT {name}', fetch=None)
+            finally:
+                state.depth = depth
+            return
+
+        had_pinned = getattr(state, 'pinned', None) is not None
+        connection = self._pinned().connection
+        state.depth = 1
+        state.changed_tables = set()
+        try:
+            try:
+                yield self
+            except BaseException:
                 try:
-                    self.Connection.rollback()  # Откатим операцию
+                    connection.rollback()  # Откатим всё
                 except BaseException:
                     pass
-                raise RequestExecutionError(request) from miss
+                raise
 
-            finally:
+            try:
+                connection.commit()  # Один коммит на всю единицу работы
+            except BaseException as miss:
                 try:
-                    cursor.close()
+                    connection.rollback()
                 except BaseException:
                     pass
+                raise RequestExecutionError('COMMIT') from miss
+
+        finally:
+            state.depth = 0
+            changed_tables = state.changed_tables
+            state.changed_tables = set()
+            self.__invalidate(changed_tables)
+            if not had_pinned:
+                self.release()
+
+    @contextlib.contextmanager
+    def batch(self):
+        '''
+        Как transaction(), но запросы с коммитом (request_commit, simple_insert_string, simple_update, param_*)
+            не отправляются сразу, а копятся и уходят при выходе из контекста. Подряд идущие одинаковые
+            параметризованные запросы отправляются одним executemany. Чтения внутри batch() отложенных
+            изменений не видят.
+            Загрузки (bulk_insert, bulk_upsert, simple_insert) не откладываются: перед ними накопленные
+            запросы отправляются, чтобы порядок записей сохранился.
+            Вложенный batch() - точка сохранения с общей очередью (см. transaction()).
+
+        :return: контекстный менеджер, отдающий адаптер
+        '''
+        state = self.__local
+        if getattr(state, 'batch', None) is not None:  # Вложенный batch()
+            with self.transaction():
+                yield self
+            return
+
+        with self.transaction():
+            state.batch = []
+            try:
+                yield self
+                self.__flush_batch()
+            finally:
+                state.batch = None
 
-    def request_fetch_all(self, request: str) -> list:
+    def __flush_batch(self):
         '''
-        Функция получает данные от базы данных. Забираются все строки
-        Вид данных [(str1), (str2), ...]
+        Отправляет запросы, накопленные в batch(). Подряд идущие одинаковые параметризованные запросы
+            уходят одним executemany.
 
-        :param request: запрос
-        :return: list - результат, False - нет соединения, None - ошибка.
+        :return: ничего
         '''
-        if not self.open:  # Если соединения нет
-            raise NotConnected('Adapter not connected.')
+        state = self.__local
+        batch = getattr(state, 'batch', None)
+        if not batch:
+            return
+
+        statements = list(batch)
+        batch.clear()
+        state.batch = None  # Иначе _execute снова отложит запросы
+        try:
+            for request, group in itertools.groupby(statements, key=lambda statement: statement[0]):
+                params_list = [params for _, params in group]
+                if len(params_list) > 1 and all(params is not None for params in params_list):
+                    self.__execute_many(request=request, params_list=params_list)
+                else:
+                    for params in params_list:
+                        self._execute(request=request, fetch=None, commit=True, params=params)
+        finally:
+            state.batch = batch
+        return
 
-        with self.__mutex:
-            try:
-                cursor = self.Connection.cursor()  # Взяли курсор
-                cursor.execute(request)  # отправили запрос
-                result = cursor.fetchall()  # Получим ответ
-                return result
+    def __execute_many(self, request: str,
+                       params_list: list):
+        '''
+        Выполняет один запрос с набором параметров через executemany. Используется внутри transaction().
 
+        :param request: запрос
+        :param params_list: список наборов параметров
+        :return: ничего
+        '''
+        with self._borrow() as pooled:
+            cursor = None
+            try:
+                cursor = pooled.connection.cursor()
+                cursor.executemany(request, params_list)
             except BaseException as miss:  # Если вышла ошибка
-                raise RequestExecutionError(request) from miss
-
+                raise self.__request_error(request, miss) from miss
             finally:
                 try:
                     cursor.close()
                 except BaseException:
                     pass
+        self.__invalidate(written_tables(request))
+        return
+
+    def __invalidate(self, tables: set or None):
+        '''
+        Сбрасывает кэш ответов для изменённых таблиц. Внутри transaction() сброс откладывается до её конца,
+            чтобы другой поток не положил в кэш данные до коммита.
+
+        :param tables: набор таблиц. None - весь кэш.
+        :return: ничего
+        '''
+        if self.__Cache is None:
+            return
+
+        state = self.__local
+        if getattr(state, 'depth', 0) > 0:
+            if tables is None:
+                state.changed_tables = None
+            elif state.changed_tables is not None:
+                state.changed_tables |= tables
+            return
+
+        self.__Cache.invalidate(tables)
+        return
+
+    # ------------------------------------------------------------------------------------------------
+    # Requests ---------------------------------------------------------------------------------------
+    # ------------------------------------------------------------------------------------------------
+    def _execute(self, request: str,
+                 fetch,
+                 commit: bool = False,
+                 params: tuple or list or dict = None,
+                 cache_as: object = None):
+        '''
+        Общая часть запросов: берёт соединение, выполняет запрос и обрабатывает ответ.
+        Если включён кэш ответов, чтение берётся из него, а запись сбрасывает записи изменённой таблицы.
+        Внутри batch() запросы с коммитом не выполняются сразу, а копятся до выхода из контекста.
+
+        :param request: запрос к базе данных
+        :param fetch: функция вида func(cursor) -> результат. None - ничего не забирать.
+        :param commit: коммитить ли изменения (с откатом при ошибке)
+        :param params: параметры запроса. None - запрос уже собран целиком.
+        :param cache_as: вид ответа для ключа кэша ('all', ('many', size), 'value'). None - не кэшировать.
+        :return: результат fetch
+        '''
+        batch = getattr(self.__local, 'batch', None)
+        if commit and fetch is None and batch is not None:  # Внутри batch() запись откладывается до выхода
+            batch.append((request, params))
+            return None
+
+        cache = self.__Cache
+        if cache is None:
+            return self.__execute_retrying(request=request, fetch=fetch, commit=commit, params=params)
+
+        if commit:
+            result = self.__execute_retrying(request=request, fetch=fetch, commit=commit, params=params)
+            self.__invalidate(written_tables(request))
+            return result
+
+        key = None
+        if cache_as is not None and getattr(self.__local, 'pinned', None) is None:  # Не кэшируем внутри транзакций
+            key = cache_key(cache_as=cache_as, request=request, params=params)
+        if key is None:
+            return self.__execute_retrying(request=request, fetch=fetch, commit=commit, params=params)
+
+        found, result = cache.get(key)
+        if not found:
+            tables = read_tables(request)
+            generation = cache.generation(tables)
+            result = self.__execute_retrying(request=request, fetch=fetch, commit=commit, params=params)
+            cache.put(key=key, value=result, tables=tables, generation=generation)
+
+        if isinstance(result, list):  # Копия, чтобы изменения у вызывающего не попали в кэш
+            return list(result)
+        return result
+
+    def __execute_retrying(self, request: str,
+                           fetch,
+                           commit: bool = False,
+                           params: tuple or list or dict = None):
+        '''
+        Выполнение запроса с повторами при обрыве соединения: с экспоненциально растущей паузой со случайным
+            разбросом. Повторяются чтения и любые запросы, которые не дошли до сервера (не удалось взять
+            соединение). Запись, оборвавшаяся после отправки, и запросы внутри транзакций не повторяются.
+
+        :param request: запрос к базе данных
+        :param fetch: функция вида func(cursor) -> результат. None - ничего не забирать.
+        :param commit: коммитить ли изменения
+        :param params: параметры запроса
+        :return: результат fetch
+        '''
+        attempt = 0
+        while True:
+            try:
+                return self.__execute(request=request, fetch=fetch, commit=commit, params=params)
+
+            except (NotConnected, ConnectionLostError) as miss:
+                if attempt >= self.__retries or not self.open or self.in_transaction:
+                    raise
+                if isinstance(miss, ConnectionLostError) and commit:  # Запись могла дойти до базы
+                    raise
+
+                attempt += 1
+                time.sleep(backoff_delay(attempt=attempt,
+                                         base_delay=self.__retry_delay,
+                                         max_delay=self.__retry_max_delay))
+
+    def __execute(self, request: str,
+                  fetch,
+                  commit: bool = False,
+                  params: tuple or list or dict = None):
+        '''
+        Выполнение запроса в обход кэша ответов.
+
+        :param request: запрос к базе данных
+        :param fetch: функция вида func(cursor) -> результат. None - ничего не забирать.
+        :param commit: коммитить ли изменения (с откатом при ошибке)
+        :param params: параметры запроса. None - запрос уже собран целиком.
+        :return: результат fetch
+        '''
+        started = time.perf_counter()
+        waited = 0.0
+        rows = 0
+        result = None
+        error = None
+        try:
+            with self._borrow() as pooled:
+                waited = time.perf_counter() - started
+                connection = pooled.connection
+                cursor = None
+                try:
+                    cursor = connection.cursor()  # Взяли курсор
+                    self._send(cursor=cursor, pooled=pooled, request=request, params=params)  # отправили запрос
+                    if fetch is None:
+                        rows = max(cursor.rowcount, 0)
+                    else:
+                        result = fetch(cursor)  # Получим ответ
+                        if result is None:  # Пустой ответ request_fetch_value
+                            rows = 0
+                        elif isinstance(result, (list, tuple)):
+                            rows = len(result)
+                        else:
+                            rows = 1
+                    if commit and not self.in_transaction:  # Внутри transaction() коммитит только она
+                        connection.commit()  # Внесём изменения в базу
+                    return result
+
+                except BaseException as miss:  # Если вышла ошибка
+                    if commit and not self.in_transaction:
+                        try:
+                            connection.rollback()  # Откатим операцию
+                        except BaseException:
+                            pass
+                    raise self.__request_error(request, miss) from miss
+
+                finally:
+                    try:
+                        cursor.close()
+                    except BaseException:
+                        pass
+
+        except BaseException as miss:
+            error = miss
+            raise
+
+        finally:
+            if self.__hooks:
+                self.__report(request=request, started=started, waited=waited,
+                              rows=rows, size=estimate_size(result), error=error)
+
+    def __request_error(self, request: str,
+                        miss: BaseException) -> RequestExecutionError:
+        '''
+
+        :param request: запрос
+        :param miss: исключение драйвера
+        :return: QueryCancelledError, если запрос прерван по времени или через cancel(), иначе RequestExecutionError
+        '''
+        try:
+            cancelled = self.Driver.is_cancelled(miss)
+        except BaseException:
+            cancelled = False
+        if cancelled:
+            return QueryCancelledError(request)
+        return RequestExecutionError(request)
+
+    def _send(self, cursor,
+              pooled: PooledConnection,
+              request: str,
+              params: tuple or list or dict = None):
+        '''
+        Отправляет запрос через курсор. Параметризованные запросы в PostgreSQL подготавливаются на сервере один раз
+            для соединения (PREPARE), дальше выполняются через EXECUTE без повторного разбора и планирования.
+            Если сервер запрос не подготовил (тип параметра не выводится, как в "SELECT %s"), PREPARE откатывается
+            до точки сохранения, чтобы не оборвать транзакцию, запрос выполняется обычным execute и больше
+            не подготавливается на этом соединении. Кортежи в параметрах psycopg2 раскрывает в списки
+            ("IN %s"), поэтому такие запросы не подготавливаются вовсе.
+            sqlite3 кэширует запросы сам, а pymysql подставляет параметры на стороне клиента.
+
+        :param cursor: курсор соединения pooled
+        :param pooled: соединение из пула
+        :param request: запрос
+        :param params: параметры запроса или None
+        :return: ничего
+        '''
+        if params is None:
+            cursor.execute(request)
+            return
+
+        if (not self.Driver.server_prepare or self.__statement_cache_size <= 0 or
+                isinstance(params, dict) or request in pooled.unpreparable or
+                any(isinstance(value, tuple) for value in params)):
+            cursor.execute(request, params)
+            return
+
+        statements = pooled.statements
+        name = statements.get(request)
+        if name is None:
+            numbered_request, count = numbered_placeholders(request)
+            name = f'mengine_{id(pooled):x}_{len(statements)}'
+            while name in statements.values():
+                name += '_'
+            cursor.execute('SAVEPOINT mengine_prepare')
+            try:
+                cursor.execute(f'PREPARE {name} AS {numbered_request}')
+            except self.Driver.module().ProgrammingError:
+                cursor.execute('ROLLBACK TO SAVEPOINT mengine_prepare')
+                cursor.execute('RELEASE SAVEPOINT mengine_prepare')
+                if len(pooled.unpreparable) >= self.__statement_cache_size:
+                    pooled.unpreparable.clear()
+                pooled.unpreparable.add(request)
+                cursor.execute(request, params)
+                return
+            cursor.execute('RELEASE SAVEPOINT mengine_prepare')
+            statements[request] = name
+
+            if len(statements) > self.__statement_cache_size:  # Вытесним самый старый запрос
+                _, old_name = statements.popitem(last=False)
+                cursor.execute(f'DEALLOCATE {old_name}')
+        else:
+            statements.move_to_end(request)
+
+        if len(params) == 0:
+            cursor.execute(f'EXECUTE {name}')
+        else:
+            cursor.execute(f'EXECUTE {name} (' + ', '.join(['%s'] * len(params)) + ')', params)
+        return
+
+    def request_commit(self, request: str,
+                       params: tuple or list or dict = None,
+                       timeout: float = None) -> None:
+        '''
+        Функция для передачи запросов в базу с коммитом.
+
+        :param request: запрос к базе данных. Параметры обозначаются меткой self.placeholder.
+        :param params: параметры запроса. None - запрос уже собран целиком.
+        :param timeout: ограничение времени запроса в секундах (см. timeout()). None - действующее ограничение.
+        :return: ничего. При ошибке отправки запроса или коммита - RequestExecutionError
+        '''
+        with self.__call_timeout(timeout):
+            self._execute(request=request, fetch=None, commit=True, params=params)
+        return
+
+    def request_commit_async(self, request: str,
+                             params: tuple or list or dict = None) -> concurrent.futures.Future:
+        '''
+        request_commit без ожидания: запрос уходит в очередь фоновых записей (см. start_write_queue()).
+        Если очередь не запущена, она запускается с параметрами по умолчанию.
+
+        :param request: запрос к базе данных. Параметры обозначаются меткой self.placeholder.
+        :param params: параметры запроса. None - запрос уже собран целиком.
+        :return: Future: результат None или исключение. Заполненная очередь задерживает вызов (см. WriteQueue).
+        '''
+        write_queue = self.WriteQueue
+        if write_queue is None:
+            write_queue = self.start_write_queue()
+        return write_queue.submit(request=request, params=params)
+
+    def start_write_queue(self, workers: int = 2,
+                          max_size: int = 10000,
+                          coalesce: int = 500,
+                          put_timeout: float or None = None) -> WriteQueue:
+        '''
+        Запускает очередь фоновых записей для request_commit_async(). У потоков-писателей свои соединения,
+            подряд идущие вставки в одну таблицу склеиваются в многострочные INSERT.
+
+        :param workers: количество потоков-писателей
+        :param max_size: ёмкость очереди
+        :param coalesce: сколько вставок склеивать в один запрос
+        :param put_timeout: сколько секунд ждать места в заполненной очереди. None - сколько потребуется.
+        :return: WriteQueue. Если очередь уже запущена - она и возвращается.
+        '''
+        with self.__mutex:
+            if self.__WriteQueue is None:
+                self.__WriteQueue = WriteQueue(self, workers=workers, max_size=max_size,
+                                               coalesce=coalesce, put_timeout=put_timeout)
+            return self.__WriteQueue
+
+    def request_fetch_all(self, request: str,
+                          params: tuple or list or dict = None,
+                          timeout: float = None) -> list:
+        '''
+        Функция получает данные от базы данных. Забираются все строки
+        Вид данных [(str1), (str2), ...]
+
+        :param request: запрос
+        :param params: параметры запроса. None - запрос уже собран целиком.
+        :param timeout: ограничение времени запроса в секундах (см. timeout()). None - действующее ограничение.
+        :return: list - результат
+        '''
+        with self.__call_timeout(timeout):
+            return self._execute(request=request, fetch=lambda cursor: cursor.fetchall(), params=params,
+                                 cache_as='all')
 
     def request_fetch_many(self, request: str,
-                           size: int = 1) -> list:
+                           size: int = 1,
+                           params: tuple or list or dict = None,
+                           timeout: float = None) -> list:
         '''
         Функция получает данные от базы данных. Забираются все строки
         Вид данных [(str1), (str2), ... , (str_n)]
 
         :param request: запрос
         :param size: количество строк, которые будут извлечены
+        :param params: параметры запроса. None - запрос уже собран целиком.
+        :param timeout: ограничение времени запроса в секундах (см. timeout()). None - действующее ограничение.
         :return: list - результат
         '''
-        if not self.open:  # Если соединения нет
-            raise NotConnected('Adapter not connected.')
-
-        with self.__mutex:
-            try:
-                cursor = self.Connection.cursor()  # Взяли курсор
-                cursor.execute(request)  # отправили запрос
-                result = cursor.fetchmany(size=size)  # Получим ответ
-                return result
+        with self.__call_timeout(timeout):
+            return self._execute(request=request, fetch=lambda cursor: cursor.fetchmany(size), params=params,
+                                 cache_as=('many', size))
 
-            except BaseException as miss:  # Если вышла ошибка
-                raise RequestExecutionError(request) from miss
-
-            finally:
-                try:
-                    cursor.close()
-                except BaseException:
-                    pass
-
-    def request_fetch_value(self, request: str) -> object:
+    def request_fetch_value(self, request: str,
+                            params: tuple or list or dict = None,
+                            timeout: float = None) -> object:
         '''
         Функция получает первое (нулевое) значение первой (нулевой) строки из ответа и возвращат его.
         Нужна для удобства, чтобы можно было легко запросить "количество", "минимум"/"максимум" и прочие подобные
             величины.
 
         :param request: запрос
-        :param errors_placeholder: "заменитель" ошибки. Актуален потому, что значение может быть и None.
-            Но "поумолчанию" подразумевается, что единственное запрашиваемое значение не должно быть None.
+        :param params: параметры запроса. None - запрос уже собран целиком.
+        :param timeout: ограничение времени запроса в секундах (см. timeout()). None - действующее ограничение.
         :return: "нулевое" значение "нулевой" строки.
         '''
-        if not self.open:  # Если соединения нет
-            raise NotConnected('Adapter not connected.')
+        with self.__call_timeout(timeout):
+            return self._execute(request=request, fetch=lambda cursor: cursor.fetchone()[0], params=params,
+                                 cache_as='value')
+
+    def request_stream(self, request: str,
+                       batch_size: int = 1000,
+                       params: tuple or list or dict = None,
+                       batches: bool = False):
+        '''
+        Генератор для чтения большого ответа порциями без загрузки его в память целиком.
+        Используются серверные курсоры: именованный курсор psycopg2, SSCursor pymysql, пошаговое чтение sqlite3.
+        Соединение занято, пока генератор не исчерпан или не закрыт (close() / выход из цикла).
 
-        with self.__mutex:
+        :param request: запрос
+        :param batch_size: сколько строк забирать с сервера за раз
+        :param params: параметры запроса. None - запрос уже собран целиком.
+        :param batches: True - отдавать списки строк (порции), False - отдавать строки по одной
+        :return: генератор строк или порций
+        '''
+        stream = self._stream(request=request, batch_size=batch_size, params=params)
+        try:
+            next(stream)  # cursor.description
+            for batch in stream:
+                if batches:
+                    yield batch
+                else:
+                    yield from batch
+        finally:
+            stream.close()
+
+    def request_fetch_frame(self, request: str,
+                            chunksize: int = None,
+                            params: tuple or list or dict = None,
+                            batch_size: int = 10000):
+        '''
+        Ответ на запрос в виде pandas.DataFrame.
+        Порции строк с серверного курсора сразу разворачиваются в столбцы, без общего списка строк и его копии
+            в DataFrame. Типы столбцов берутся из cursor.description через драйвер движка (см. Frames).
+
+        :param request: запрос
+        :param chunksize: None - вернуть один DataFrame, число - вернуть генератор DataFrame по chunksize строк
+            (соединение занято, пока генератор не исчерпан или не закрыт)
+        :param params: параметры запроса. None - запрос уже собран целиком.
+        :param batch_size: сколько строк забирать с сервера за раз, если chunksize не задан
+        :return: DataFrame или генератор DataFrame
+        '''
+        if chunksize is not None:
+            return self.__frame_chunks(request=request, chunksize=chunksize, params=params)
+
+        stream = self._stream(request=request, batch_size=batch_size, params=params)
+        try:
+            description = next(stream)
+            columns = [[] for _ in description or ()]
+            for batch in stream:
+                for values, column in zip(columns, zip(*batch)):
+                    values.extend(column)
+        finally:
+            stream.close()
+
+        return build_frame(description, columns, self.Driver)
+
+    def __frame_chunks(self, request: str,
+                       chunksize: int,
+                       params: tuple or list or dict = None):
+        stream = self._stream(request=request, batch_size=chunksize, params=params)
+        try:
+            description = next(stream)
+            for batch in stream:
+                yield build_frame(description, [list(column) for column in zip(*batch)], self.Driver)
+        finally:
+            stream.close()
+
+    def _stream(self, request: str,
+                batch_size: int,
+                params: tuple or list or dict = None):
+        '''
+        Общая часть потокового чтения: первым отдаёт cursor.description (None, если запрос ничего не возвращает),
+            дальше - порции строк.
+
+        :param request: запрос
+        :param batch_size: сколько строк забирать с сервера за раз
+        :param params: параметры запроса
+        :return: генератор
+        '''
+        if batch_size < 1:
+            raise ValueError(f'batch_size must be positive: {batch_size}')
+
+        started = time.perf_counter()
+        waited = 0.0
+        rows = 0
+        size = 0
+        error = None
+        with self._borrow() as pooled:
+            waited = time.perf_counter() - started
+            connection = pooled.connection
+            cursor = None
             try:
-                cursor = self.Connection.cursor()  # Взяли курсор
-                cursor.execute(request)  # отправили запрос
-                result = cursor.fetchone()[0]  # Получим ответ
-                return result
+                cursor = self.Driver.stream_cursor(connection,
+                                                   name=f'mengine_stream_{id(pooled):x}_{next(stream_counter)}',
+                                                   batch_size=batch_size)
 
+                if params is None:
+                    cursor.execute(request)
+                else:
+                    cursor.execute(request, params)
+
+                # Именованный курсор psycopg2 заполняет description только после первой выборки
+                batch = cursor.fetchmany(batch_size) if cursor.description is None else None
+                yield cursor.description
+
+                hooks = bool(self.__hooks)
+                while True:
+                    if batch is None:
+                        batch = cursor.fetchmany(batch_size)
+                    if not batch:
+                        break
+                    rows += len(batch)
+                    if hooks:
+                        size += estimate_size(batch)
+                    yield batch
+                    batch = None
+
+            except GeneratorExit:  # Генератор закрыли раньше времени
+                raise
             except BaseException as miss:  # Если вышла ошибка
-                raise RequestExecutionError(request) from miss
+                error = self.__request_error(request, miss)
+                raise error from miss
 
             finally:
                 try:
@@ -319,6 +1566,10 @@ class CommonAdapterInterface:
                 except BaseException:
                     pass
 
+                if self.__hooks:
+                    self.__report(request=request, started=started, waited=waited,
+                                  rows=rows, size=size, error=error)
+
     # ------------------------------------------------------------------------------------------------
     # Simple requests --------------------------------------------------------------------------------
     # ------------------------------------------------------------------------------------------------
@@ -412,55 +1663,74 @@ class CommonAdapterInterface:
     def simple_insert(self, table: str,
                       columns_names: list,
                       values_list: list,
-                      step: int = 500) -> list:
+                      step: int = 500,
+                      single_commit: bool = True) -> None:
         '''
-        Функция подготавливает набор запросов вида "начало запроса VALUES (), (),..." или WHERE abs IN (value1, value2,...).
+        Функция вставляет набор строк запросами вида "INSERT INTO table (...) VALUES (), (),...".
         Основная задача состоит в дроблении большого запроса на комлект небольших.
-        Функция делает работу "в лоб", без проверок элементов спсика и прочего.
+        Строки-кортежи передаются в bulk_insert() и загружаются быстрым путём движка.
 
         :param table: table name
         :param columns_names: columns names
         :param values_list: a list of prepared values in Str or tuple format.
-              strings: ["(v1, 'v2', v3)", "(vv1, 'vv2', vv3)", ...]
-              tuples: [(v1, v2, v3), (vv1, vv2, vv3), ...]
-            It is better to pass strings as this will eliminate conversion errors.
-            Example: str((1, "asd'dsa", 123)) =  '(1, "asd\'dsa", 123)' - it will raise error.
+              strings: ["(v1, 'v2', v3)", "(vv1, 'vv2', vv3)", ...] - values are already quoted
+              tuples: [(v1, v2, v3), (vv1, vv2, vv3), ...] - raw values, passed to the driver as parameters
         :param step: шаг разбиения
-        :return: список запросов
+        :param single_commit: True - один коммит на всю загрузку (при ошибке откатывается всё),
+            False - коммит после каждой порции.
+        :return: ничего
         '''
+        if len(values_list) == 0:
+            return
 
-        columns = ''
-        for name in columns_names[:-1]:
-            columns += f'{name}, '
-        columns += f'{columns_names[-1]}'
-
-        def get_add_request(values: list):
-            if values == []:
-                return None
-            request = ''  # чтобы ни в коем случае request не оказался ссылкой на start_request
+        if not isinstance(values_list[0], str):  # "Сырые" значения - через быструю загрузку
+            self.bulk_insert(table=table, columns_names=columns_names, rows=values_list,
+                             step=step, single_commit=single_commit)
+            return
 
-            if len(values) > 1:  # Добавим набор значений
-                for el in values[:-1]:
-                    request += str(el) + ', '
-            request += str(values[-1])  # добавми последнее или единственное
+        start_request = f'INSERT INTO {table} (' + ', '.join(columns_names) + ') VALUES '
 
+        def send(cursor, chunk: list) -> str:
+            request = start_request + ', '.join(chunk)
+            cursor.execute(request)
             return request
 
-        for j in range(0, round(len(values_list) / step) + 1):
+        self._load(table=table, rows=values_list, step=step, send=send, single_commit=single_commit)
+        return
 
-            values = get_add_request(values_list[j * step: (j + 1) * step])
-            if values is None:
-                continue
+    def simple_upsert(self,
+                      table: str,
+                      key_columns: list,
+                      update_columns: list = None,
+                      **kwargs):
+        '''
+        "Вставка или обновление" строки одним запросом вместо simple_check и simple_insert_string / simple_update:
+            INSERT ... ON CONFLICT DO UPDATE (PostgreSQL, SQLite) или INSERT ... ON DUPLICATE KEY UPDATE (MySQL).
 
-            request = f'INSERT INTO {table} ({columns}) VALUES ({values})'
+        :param table: имя таблицы
+        :param key_columns: столбцы уникального ключа (PRIMARY KEY или UNIQUE), по которому строка уже может быть
+        :param update_columns: столбцы, обновляемые у существующей строки. None - все переданные, кроме ключевых.
+            Пустой список - существующая строка не меняется.
+        :param kwargs: словарь с элементами ('имя колонки'=значение). Значение уже готово ко вставке. Если это строка,
+            она ограничена кавычками.
+        :return:
+        '''
+        if kwargs == {}:
+            raise ValueError('No arguments passed.')
 
-            self.request_commit(request=request)
+        columns = list(kwargs.keys())
+        values = ['NULL' if kwargs[key] in (None, 'null') else f'{kwargs[key]}' for key in columns]
+        request = (f'INSERT INTO {table} (' + ', '.join(columns) + ') VALUES (' + ', '.join(values) + ') ' +
+                   self.__upsert_clause(columns, key_columns, update_columns))
+
+        self.request_commit(request=request)
 
         return
 
     def simple_expanded_strings(self,
                                 table: str,
-                                **kwargs) -> list or dict or None:
+                                row_type: str = 'dict',
+                                **kwargs) -> list or dict:
         '''
 
         Функция подготавливает словарь для каждой найденной строки в таблице, которая удовлетворяет условиям, заданным
@@ -468,27 +1738,14 @@ class CommonAdapterInterface:
         искомой строки. Из словарей составляется список и передаётся на экспорт.
 
         :param table: имя таблицы
-        :param adapter: SQL коммуникатор с функцией "request_fetch_all" для выполнения запросов.
+        :param row_type: вид результата (см. Rows.materialise): 'dict' - список словарей,
+            'namedtuple' - список namedtuple, 'columns' - словарь {столбец: список значений}
         :param kwargs: название параметра - имя столбца, значение - то, чему столбец должен быть РАВЕН. В иных
             случаях следует писать запрос целиком.
-        :return: список словарей, отвечающих строкам или словарь, если строка была одна.
+        :return: список словарей (в том числе из одной строки или пустой) или другой вид по row_type
         '''
-
-        # Подготовим запрос на получение имён столбцов
-        columns_response = self.request_fetch_all(f"SHOW COLUMNS FROM {table}")  # Берём колонки
-
-        # Иначе это набор tuple, где первый элемент является названием колонки
-        parameters_list = []
-        for column in columns_response:
-            parameters_list.append(column[0])
-        del columns_response
-
-        # Соберём названия столбцов для SELECT
-        select_parameters = ''
-        if len(parameters_list) > 1:
-            for el in parameters_list[:-1]:
-                select_parameters += str(el) + ', '
-        select_parameters += str(parameters_list[-1]) + ' '  # Добавим последнюю
+        if row_type not in row_types:
+            raise ValueError(f'Wrong row type: {row_type}. Allowed: {", ".join(row_types)}.')
 
         # Соберём условие
         if kwargs != {}:
@@ -498,26 +1755,300 @@ class CommonAdapterInterface:
         else:
             where_value = ''  # иначе условие пустое
 
-        # Соберём запрос
-        select_request = f"SELECT {select_parameters} FROM {table} {where_value}"
-        select_response = self.request_fetch_all(request=select_request)  # берём данные
+        # Имена столбцов берём из кэша. Если их там нет - из описания ответа на "SELECT *" и кладём в кэш.
+        parameters_list = self.__Schema.get(table)
+        select_response = None
+        if parameters_list is not None:
+            select_request = f"SELECT {', '.join(parameters_list)} FROM {table} {where_value}"
+            try:
+                select_response = self.request_fetch_all(request=select_request)  # берём данные
+            except (QueryCancelledError, ConnectionLostError):
+                raise
+            except RequestExecutionError as miss:
+                if not self.Driver.is_undefined_column(miss.__cause__):
+                    raise
+                self.__Schema.invalidate(table)  # Схема таблицы изменилась
+                if self.in_transaction:  # Транзакция PostgreSQL после ошибки уже прервана
+                    raise
+
+        if select_response is None:
+            select_request = f"SELECT * FROM {table} {where_value}"
+            parameters_list, select_response = self._execute(request=select_request,
+                                                             fetch=lambda cursor: (description_names(cursor),
+                                                                                   cursor.fetchall()))
+            self.__Schema.set(table, parameters_list)
+
+        return materialise(parameters_list, select_response, row_type)
+
+    def table_columns(self, table: str) -> list:
+        '''
+        Отдаёт имена столбцов таблицы из кэша схемы. При промахе берёт их из описания ответа на пустой SELECT:
+            так одинаково работает для MySQL, PostgreSQL и SQLite.
+
+        :param table: имя таблицы
+        :return: список имён столбцов (копия, изменения не попадают в кэш)
+        '''
+        columns = self.__Schema.get(table)
+        if columns is None:
+            columns = self._execute(request=f'SELECT * FROM {table} WHERE 1=0', fetch=description_names)
+            self.__Schema.set(table, columns)
+        return list(columns)
+
+    def invalidate_schema(self, table: str = None):
+        '''
+        Сбрасывает кэш имён столбцов. Нужно вызывать после изменения схемы таблицы (ALTER TABLE и т.п.).
+
+        :param table: имя таблицы. None - сбросить весь кэш.
+        :return: ничего
+        '''
+        self.__Schema.invalidate(table)
+        return
+
+    # ------------------------------------------------------------------------------------------------
+    # Parameterised requests -------------------------------------------------------------------------
+    # ------------------------------------------------------------------------------------------------
+    def param_check(self,
+                    table: str,
+                    **kwargs) -> bool:
+        '''
+        Параметризованный вариант simple_check: значения передаются драйверу отдельно от запроса,
+            экранировать их не нужно.
+
+        :param table: table name
+        :param kwargs: parameters for the "WHERE" condition. None - "IS NULL".
+        :return: status
+        '''
+        if kwargs == {}:
+            where_value, params = '', []  # нет условия
+        else:
+            where_value, params = prepare_placeholders(values=kwargs, sep='AND', placeholder=self.placeholder)
+            where_value = 'WHERE ' + where_value
+
+        check_request = ("SELECT " +
+                         "CASE " +
+                         " WHEN EXISTS " +
+                         f"(SELECT * FROM {table} {where_value}) " +
+                         "THEN 1 ELSE 0 END")
+        result = self.request_fetch_value(check_request, params=tuple(params))
+        return bool(result)
+
+    def param_insert_string(self,
+                            table: str,
+                            **kwargs):
+        '''
+        Параметризованный вариант simple_insert_string.
+
+        :param table: имя таблицы
+        :param kwargs: словарь с элементами ('имя колонки'=значение). Значение передаётся как есть, None - NULL.
+        :return:
+        '''
+        if kwargs == {}:
+            raise ValueError('No arguments passed.')
+
+        columns = ', '.join(kwargs.keys())
+        values = ', '.join([self.placeholder] * len(kwargs))
+        request = f'INSERT INTO {table} ({columns}) VALUES ({values})'
+
+        self.request_commit(request=request, params=tuple(kwargs.values()))
+
+        return
+
+    def param_update(self,
+                     table: str,
+                     set_values: dict or list,
+                     where: dict or list = None):
+        '''
+        Параметризованный вариант simple_update.
+
+        :param table: имя таблицы
+        :param set_values: словарь или список с элементами ('имя колонки', значение)
+        :param where: словарь или список с элементами ('имя колонки', значение). Может быть пуст.
+        :return:
+        '''
+        set_values_string, params = prepare_placeholders(values=set_values, sep=',', placeholder=self.placeholder)
+        request = f'UPDATE {table} SET {set_values_string}'
+
+        if where:  # если условия заданы
+            where_string, where_params = prepare_placeholders(values=where, sep='AND', placeholder=self.placeholder)
+            request += f' WHERE {where_string}'
+            params += where_params
+
+        self.request_commit(request=request, params=tuple(params))
+
+        return
+
+    # ------------------------------------------------------------------------------------------------
+    # Bulk load --------------------------------------------------------------------------------------
+    # ------------------------------------------------------------------------------------------------
+    def bulk_insert(self, table: str,
+                    columns_names: list,
+                    rows,
+                    step: int = 10000,
+                    single_commit: bool = True) -> None:
+        '''
+        Загрузка большого набора строк быстрым путём движка:
+            PostgreSQL - COPY ... FROM STDIN из CSV буфера в памяти (copy_expert);
+            MySQL - executemany (pymysql собирает из него многострочные INSERT);
+            SQLite - executemany в одной транзакции.
+        Способ отправки порции задаёт драйвер движка (Driver.bulk_insert).
+
+        :param table: имя таблицы
+        :param columns_names: имена столбцов
+        :param rows: итерируемый набор кортежей со "сырыми" значениями. Может быть генератором.
+        :param step: сколько строк отправлять за раз
+        :param single_commit: True - один коммит на всю загрузку (при ошибке откатывается всё),
+            False - коммит после каждой порции.
+        :return: ничего
+        '''
+        driver = self.Driver
+
+        def send(cursor, chunk: list) -> str:
+            return driver.bulk_insert(cursor, table=table, columns_names=columns_names, chunk=chunk)
+
+        self._load(table=table, rows=rows, step=step, send=send, single_commit=single_commit)
+        return
 
-        if len(select_response) == 1:  # Если найдена одна строка
-            export_dict = {}
-            for j in range(0, len(select_response[0])):  # погнали по элементам строки
-                export_dict[parameters_list[j]] = select_response[0][j]
-            return export_dict
+    def bulk_upsert(self, table: str,
+                    columns_names: list,
+                    rows,
+                    key_columns: list,
+                    update_columns: list = None,
+                    step: int = 500,
+                    single_commit: bool = True) -> None:
+        '''
+        "Вставка или обновление" большого набора строк: каждая порция уходит одним многострочным запросом
+            INSERT ... VALUES (...), (...) ON CONFLICT DO UPDATE / ON DUPLICATE KEY UPDATE.
+        Повторы ключа внутри порции схлопываются так же, как при построчной отправке: при обновлении остаётся
+            последняя строка, без обновления - первая (PostgreSQL не даёт изменить строку дважды одним запросом).
 
-        elif len(select_response) == 0:  # Если не найдено ничего
-            return {}
+        :param table: имя таблицы
+        :param columns_names: имена столбцов
+        :param rows: итерируемый набор кортежей со "сырыми" значениями. Может быть генератором.
+        :param key_columns: столбцы уникального ключа (PRIMARY KEY или UNIQUE)
+        :param update_columns: столбцы, обновляемые у существующей строки. None - все, кроме ключевых.
+            Пустой список - существующие строки не меняются.
+        :param step: сколько строк отправлять одним запросом. Уменьшается, если движок ограничивает
+            количество параметров в запросе.
+        :param single_commit: True - один коммит на всю загрузку (при ошибке откатывается всё),
+            False - коммит после каждой порции.
+        :return: ничего
+        '''
+        columns_names = list(columns_names)
+        if update_columns is None:
+            update_columns = [column for column in columns_names if column not in key_columns]
+        clause = self.__upsert_clause(columns_names, key_columns, update_columns)
+        keep_last = bool(update_columns)
+        try:
+            key_positions = [columns_names.index(column) for column in key_columns]
+        except ValueError:
+            raise ValueError(f'Key columns {key_columns} must be among columns {columns_names}.') from None
+
+        max_parameters = self.Driver.max_parameters
+        if max_parameters is not None:
+            step = max(1, min(step, max_parameters // len(columns_names)))
+
+        start_request = f'INSERT INTO {table} (' + ', '.join(columns_names) + ') VALUES '
+        row_marks = '(' + ', '.join([self.placeholder] * len(columns_names)) + ')'
+        requests = {}  # {строк в запросе: запрос} - полные порции используют один и тот же текст
+
+        def send(cursor, chunk: list) -> str:
+            unique = {}
+            for row in chunk:
+                key = tuple([row[position] for position in key_positions])
+                if keep_last or key not in unique:
+                    unique[key] = row
+            chunk = list(unique.values())
+
+            request = requests.get(len(chunk))
+            if request is None:
+                request = start_request + ', '.join([row_marks] * len(chunk)) + ' ' + clause
+                requests[len(chunk)] = request
+            cursor.execute(request, [value for row in chunk for value in row])
+            return request
 
-        else:  # если более одной строки
-            export_list = []  # список словарей на экспорт
-            for result_string in select_response:  # погнали по строкам
-                export_dict = {}
-                for j in range(0, len(result_string)):  # погнали по элементам строки
-                    export_dict[parameters_list[j]] = result_string[j]
+        self._load(table=table, rows=rows, step=step, send=send, single_commit=single_commit)
+        return
 
-                export_list.append(export_dict)  # добавим
+    def __upsert_clause(self, columns_names: list,
+                        key_columns: list,
+                        update_columns: list or None) -> str:
+        '''
 
-            return export_list  # отдаём список
\ No newline at end of file
+        :param columns_names: вставляемые столбцы
+        :param key_columns: столбцы уникального ключа
+        :param update_columns: обновляемые столбцы или None - все, кроме ключевых
+        :return: хвост запроса от драйвера движка
+        '''
+        if not key_columns:
+            raise ValueError('No key columns passed.')
+        if update_columns is None:
+            update_columns = [column for column in columns_names if column not in key_columns]
+        return self.Driver.upsert_clause(key_columns=list(key_columns), update_columns=list(update_columns))
+
+    def _load(self, table: str,
+              rows,
+              step: int,
+              send,
+              single_commit: bool = True):
+        '''
+        Общая часть загрузок: режет строки на порции и отправляет их через одно соединение.
+            Внутри batch() загрузка не откладывается: сначала отправляются накопленные запросы.
+
+        :param table: имя таблицы
+        :param rows: итерируемый набор строк
+        :param step: размер порции
+        :param send: функция вида func(cursor, chunk) -> отправленный запрос
+        :param single_commit: один коммит в конце или коммит после каждой порции
+        :return: ничего
+        '''
+        if step < 1:
+            raise ValueError(f'step must be positive: {step}')
+
+        self.__flush_batch()  # Записи, отложенные в batch(), должны попасть в базу раньше загрузки
+
+        started = time.perf_counter()
+        waited = 0.0
+        loaded = 0
+        request = None
+        error = None
+        try:
+            with self._borrow() as pooled:
+                waited = time.perf_counter() - started
+                connection = pooled.connection
+                cursor = None
+                try:
+                    cursor = connection.cursor()
+                    in_transaction = self.in_transaction  # Внутри transaction() коммитит только она
+                    for chunk in chunked(rows, step):
+                        request = send(cursor, chunk)
+                        loaded += len(chunk)
+                        if not (single_commit or in_transaction):
+                            connection.commit()
+                    if single_commit and not in_transaction:
+                        connection.commit()
+
+                except BaseException as miss:  # Если вышла ошибка
+                    if not self.in_transaction:
+                        try:
+                            connection.rollback()  # Откатим незакоммиченное
+                        except BaseException:
+                            pass
+                    raise self.__request_error(request, miss) from miss
+
+                finally:
+                    try:
+                        cursor.close()
+                    except BaseException:
+                        pass
+
+                    # Часть порций могла быть закоммичена и при ошибке
+                    self.__invalidate({normalise_table(table)})
+
+        except BaseException as miss:
+            error = miss
+            raise
+
+        finally:
+            if self.__hooks and request is not None:
+                self.__report(request=request, started=started, waited=waited,
+                              rows=loaded, size=0, error=error)
@@ -0,0 +1,366 @@
+import collections
+import itertools
+import os
+import threading
+import time
+import weakref
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+class PoolClosedError(Exception):
+    pass
+
+
+# Соединения родительского процесса, доставшиеся процессу при fork(). Они держатся до конца процесса: закрытие
+# или сборка мусора закрыли бы и сессию родителя (psycopg2 шлёт серверу Terminate по общему сокету)
+_inherited = []
+_pools = weakref.WeakSet()
+
+
+def abandon(connection):
+    '''
+    Оставляет соединение чужого процесса нетронутым до конца текущего: не закрывает и не даёт закрыть
+        сборщику мусора.
+
+    :param connection: соединение драйвера
+    :return: ничего
+    '''
+    _inherited.append(connection)
+    return
+
+
+def _after_fork_in_child():
+    for pool in list(_pools):
+        pool.after_fork()
+    return
+
+
+if hasattr(os, 'register_at_fork'):  # Под Windows fork() нет
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+class PooledConnection:
+    '''
+    Обёртка над соединением драйвера, которое живёт в пуле.
+
+    Методы и свойства:
+        connection - соединение драйвера
+
+        created - время создания (time.monotonic)
+
+        last_used - время последнего возврата в пул (time.monotonic)
+
+        statements - кэш подготовленных на сервере запросов этого соединения: {запрос: имя}
+
+        unpreparable - запросы, которые сервер не смог подготовить: они выполняются без PREPARE
+
+        pid - процесс, открывший соединение
+    '''
+
+    def __init__(self, connection):
+        '''
+
+        :param connection: соединение драйвера
+        '''
+        self.connection = connection
+        self.created = time.monotonic()
+        self.last_used = self.created
+        self.statements = collections.OrderedDict()
+        self.unpreparable = set()
+        self.pid = os.getpid()
+
+
+class ConnectionPool:
+    '''
+    Пул соединений с ограничением размера, таймаутом выдачи, вытеснением простаивающих соединений
+        и проверкой "живости" при выдаче.
+    Пул переживает fork(): в дочернем процессе соединения родителя забываются без закрытия (см. after_fork()),
+        а новые открываются по мере выдачи.
+
+    Методы и свойства:
+        acquire() - взять соединение
+
+        release() - вернуть соединение
+
+        clear_idle() - закрыть свободные соединения
+
+        after_fork() - забыть соединения родительского процесса
+
+        close() - закрыть пул
+
+        size - количество открытых соединений
+
+        idle - количество свободных соединений
+
+        closed - закрыт ли пул
+    '''
+
+    def __init__(self,
+                 factory,
+                 min_size: int = 1,
+                 max_size: int = 1,
+                 timeout: float = None,
+                 max_idle_time: float = None,
+                 health_check=None,
+                 health_check_interval: float = 30.0):
+        '''
+
+        :param factory: функция без аргументов, создающая новое соединение драйвера
+        :param min_size: минимальное количество соединений. Они создаются сразу и не вытесняются.
+        :param max_size: максимальное количество соединений
+        :param timeout: время ожидания свободного соединения в секундах. None - ждать бесконечно.
+        :param max_idle_time: через сколько секунд простоя соединение сверх min_size закрывается. None - никогда.
+        :param health_check: функция вида func(connection) -> bool для проверки соединения перед выдачей.
+            None - не проверять.
+        :param health_check_interval: проверять соединение, только если оно простаивало дольше этого времени.
+            0 - проверять при каждой выдаче.
+        '''
+        if max_size < 1:
+            raise ValueError(f'max_size must be positive: {max_size}')
+        if not 0 <= min_size <= max_size:
+            raise ValueError(f'min_size must be in [0, max_size]: {min_size}')
+
+        self.__factory = factory
+        self.__min_size = min_size
+        self.__max_size = max_size
+        self.__timeout = timeout
+        self.__max_idle_time = max_idle_time
+        self.__health_check = health_check
+        self.__health_check_interval = health_check_interval
+
+        self.__condition = threading.Condition(threading.Lock())
+        self.__idle = collections.deque()  # свободные соединения, справа - самые "тёплые"
+        self.__size = 0  # все соединения: свободные, выданные и создающиеся
+        self.__busy = set()  # выданные соединения: пул держит их, чтобы после fork() их не закрыл сборщик мусора
+        self.__closed = False
+        self.__pid = os.getpid()
+        _pools.add(self)
+
+        for _ in range(min_size):  # Заполним пул сразу
+            self.__size += 1
+            try:
+                pooled = PooledConnection(self.__factory())
+            except BaseException:
+                self.__size -= 1
+                self.close()
+                raise
+            self.__idle.append(pooled)
+
+    # ------------------------------------------------------------------------------------------------
+    # Access -----------------------------------------------------------------------------------------
+    # ------------------------------------------------------------------------------------------------
+    @property
+    def min_size(self) -> int:
+        return self.__min_size
+
+    @property
+    def max_size(self) -> int:
+        return self.__max_size
+
+    @property
+    def size(self) -> int:
+        with self.__condition:
+            return self.__size
+
+    @property
+    def idle(self) -> int:
+        with self.__condition:
+            return len(self.__idle)
+
+    @property
+    def closed(self) -> bool:
+        with self.__condition:
+            return self.__closed
+
+    # ------------------------------------------------------------------------------------------------
+    # Checkout ---------------------------------------------------------------------------------------
+    # ------------------------------------------------------------------------------------------------
+    def acquire(self, timeout: float = None) -> PooledConnection:
+        '''
+        Выдаёт соединение: свободное, новое (если не достигнут max_size) или дожидается возврата.
+
+        :param timeout: время ожидания в секундах. None - таймаут пула.
+        :return: PooledConnection
+        '''
+        if self.__pid != os.getpid():  # fork() в обход os.fork(), без обработчика register_at_fork
+            self.after_fork()
+
+        if timeout is None:
+            timeout = self.__timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            to_close = []
+            pooled = None
+            create = False
+
+            with self.__condition:
+                while True:
+                    if self.__closed:
+                        raise PoolClosedError('Connection pool is closed.')
+
+                    to_close += self.__evict_idle()
+                    if self.__idle:
+                        pooled = self.__idle.pop()
+                        self.__busy.add(pooled)
+                        break
+                    if self.__size < self.__max_size:
+                        self.__size += 1  # резервируем место до создания соединения
+                        create = True
+                        break
+
+                    if deadline is None:
+                        self.__condition.wait()
+                    else:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise PoolTimeoutError(f'No free connection in {timeout} seconds.')
+                        self.__condition.wait(remaining)
+
+            self.__close_all(to_close)
+
+            if create:
+                try:
+                    pooled = PooledConnection(self.__factory())
+                except BaseException:
+                    self.__forget()
+                    raise
+                with self.__condition:
+                    self.__busy.add(pooled)
+                return pooled
+
+            if self.__is_healthy(pooled):
+                return pooled
+            self.__close_all([pooled])  # Сломанное соединение выбрасываем и пробуем снова
+            self.__forget(pooled)
+
+    def release(self, pooled: PooledConnection,
+                discard: bool = False):
+        '''
+        Возвращает соединение в пул.
+
+        :param pooled: соединение, полученное через acquire()
+        :param discard: закрыть соединение вместо возврата (например, если оно сломано)
+        :return: ничего
+        '''
+        if pooled.pid != os.getpid():  # Соединение родительского процесса: уже не считается в пуле
+            abandon(pooled.connection)
+            return
+
+        with self.__condition:
+            self.__busy.discard(pooled)
+            if not (discard or self.__closed):
+                pooled.last_used = time.monotonic()
+                self.__idle.append(pooled)
+                to_close = self.__evict_idle()
+                self.__condition.notify()
+                pooled = None
+            else:
+                to_close = []
+
+        if pooled is not None:
+            self.__close_all([pooled])
+            self.__forget()
+        self.__close_all(to_close)
+        return
+
+    def after_fork(self):
+        '''
+        Забывает соединения, унаследованные от родительского процесса при fork(): свободные и выданные.
+        Они не закрываются (см. abandon()), а следующие выдачи откроют свои соединения.
+        Вызывается автоматически в дочернем процессе. В родительском процессе ничего не делает.
+
+        :return: ничего
+        '''
+        if self.__pid == os.getpid():
+            return
+
+        for pooled in itertools.chain(self.__idle, self.__busy):
+            abandon(pooled.connection)
+        # Блокировка могла остаться захваченной потоком родителя, которого в дочернем процессе нет
+        self.__condition = threading.Condition(threading.Lock())
+        self.__idle = collections.deque()
+        self.__busy = set()
+        self.__size = 0
+        self.__pid = os.getpid()
+        return
+
+    def clear_idle(self):
+        '''
+        Закрывает все свободные соединения, следующие выдачи создадут новые.
+        Нужна, когда сервер оборвал соединения (перезапуск, переключение на реплику).
+
+        :return: ничего
+        '''
+        with self.__condition:
+            to_close = list(self.__idle)
+            self.__idle.clear()
+            self.__size -= len(to_close)
+            self.__condition.notify_all()
+
+        self.__close_all(to_close)
+        return
+
+    def close(self):
+        '''
+        Закрывает пул и все свободные соединения. Выданные соединения закроются при возврате.
+
+        :return: ничего
+        '''
+        with self.__condition:
+            self.__closed = True
+            to_close = list(self.__idle)
+            self.__idle.clear()
+            self.__size -= len(to_close)
+            self.__condition.notify_all()
+
+        self.__close_all(to_close)
+        return
+
+    # ------------------------------------------------------------------------------------------------
+    # Internal ---------------------------------------------------------------------------------------
+    # ------------------------------------------------------------------------------------------------
+    def __evict_idle(self) -> list:
+        '''
+        Забирает из очереди соединения, простаивающие дольше max_idle_time, не опуская пул ниже min_size.
+        Вызывается под блокировкой, закрытие выполняет вызывающая функция.
+
+        :return: список соединений на закрытие
+        '''
+        if self.__max_idle_time is None:
+            return []
+
+        evicted = []
+        border = time.monotonic() - self.__max_idle_time
+        # Слева самые "старые" соединения
+        while self.__idle and self.__size > self.__min_size and self.__idle[0].last_used < border:
+            evicted.append(self.__idle.popleft())
+            self.__size -= 1
+        return evicted
+
+    def __is_healthy(self, pooled: PooledConnection) -> bool:
+        if self.__health_check is None:
+            return True
+        if time.monotonic() - pooled.last_used < self.__health_check_interval:
+            return True
+        try:
+            return bool(self.__health_check(pooled.connection))
+        except BaseException:
+            return False
+
+    def __forget(self, pooled: PooledConnection = None):
+        with self.__condition:
+            self.__busy.discard(pooled)
+            self.__size -= 1
+            self.__condition.notify()
+
+    @staticmethod
+    def __close_all(connections: list):
+        for pooled in connections:
+            try:
+                pooled.connection.close()
+            except BaseException:
+                pass
@@ -0,0 +1,398 @@
+'''
+Реестр драйверов движков для CommonAdapterInterface.
+Модули драйверов (pymysql, psycopg2, sqlite3) импортируются при первом подключении, а не при импорте пакета,
+    поэтому процесс загружает и требует только те драйверы, которыми реально пользуется.
+Сторонний движок подключается через register_driver() объектом-наследником Driver.
+'''
+
+from Exceptions.ExceptionTypes import ProcessingError
+
+import abc
+import importlib
+import io
+import threading
+import time
+
+
+class Driver(abc.ABC):
+    '''
+    Описание движка: как подключаться и чем движок отличается от "общего" поведения адаптера.
+    Наследник обязан определить connect(), иначе его объект не создастся (TypeError).
+
+    Методы и свойства:
+        module_name - модуль драйвера для ленивого импорта
+
+        placeholder - метка параметра в запросах
+
+        server_prepare - поддерживает ли движок PREPARE имя AS ... ($1, $2, ...) / EXECUTE имя (...)
+
+        module() - импортированный модуль драйвера
+
+        connect() - новое соединение
+
+        stream_cursor() - курсор для чтения ответа порциями
+
+        max_parameters - ограничение количества параметров в одном запросе. None - без ограничения.
+
+        bulk_insert() - отправка порции строк при массовой загрузке
+
+        upsert_clause() - хвост INSERT для "вставки или обновления"
+
+        column_kind() - вид значений столбца по type_code из cursor.description
+
+        session_timeout - True: ограничение времени запроса - настройка сессии, она действует до изменения;
+            False - его нужно ставить перед каждым запросом и снимать после
+
+        set_timeout() - ограничить время выполнения запросов соединения
+
+        cancel() - прервать выполняющийся на соединении запрос (из другого потока)
+
+        is_cancelled() - прерван ли запрос по ограничению времени или через cancel()
+
+        is_undefined_column() - упал ли запрос из-за несуществующего столбца
+    '''
+    module_name = None
+    placeholder = '%s'
+    server_prepare = False
+    max_parameters = None
+    session_timeout = True
+
+    def __init__(self):
+        self.__module = None
+        self.__mutex = threading.Lock()
+
+    def module(self):
+        '''
+        Импортирует модуль драйвера при первом обращении.
+
+        :return: модуль
+        '''
+        if self.__module is None:
+            with self.__mutex:
+                if self.__module is None:
+                    self.__module = importlib.import_module(self.module_name)
+        return self.__module
+
+    @abc.abstractmethod
+    def connect(self, connection_data,
+                statement_cache_size: int = 100):
+        '''
+
+        :param connection_data: RemoteConnectionData
+        :param statement_cache_size: размер кэша запросов соединения, если драйвер его поддерживает
+        :return: соединение драйвера
+        '''
+
+    def stream_cursor(self, connection,
+                      name: str,
+                      batch_size: int):
+        '''
+        Курсор, который не забирает весь ответ в память при execute.
+
+        :param connection: соединение драйвера
+        :param name: уникальное имя курсора (для именованных серверных курсоров)
+        :param batch_size: сколько строк забирать с сервера за раз
+        :return: курсор
+        '''
+        return connection.cursor()
+
+    def bulk_insert(self, cursor,
+                    table: str,
+                    columns_names: list,
+                    chunk: list) -> str:
+        '''
+        Отправляет порцию строк при массовой загрузке. По умолчанию - executemany.
+
+        :param cursor: курсор
+        :param table: имя таблицы
+        :param columns_names: имена столбцов
+        :param chunk: список кортежей значений
+        :return: отправленный запрос
+        '''
+        request = (f'INSERT INTO {table} (' + ', '.join(columns_names) + ') VALUES (' +
+                   ', '.join([self.placeholder] * len(columns_names)) + ')')
+        cursor.executemany(request, chunk)
+        return request
+
+    def upsert_clause(self, key_columns: list,
+                      update_columns: list) -> str:
+        '''
+        По умолчанию - синтаксис PostgreSQL и SQLite: ON CONFLICT (ключ) DO UPDATE SET ... = EXCLUDED. ...
+
+        :param key_columns: столбцы уникального ключа, по которому определяется конфликт
+        :param update_columns: столбцы, обновляемые при конфликте. Пустой список - существующая строка не меняется.
+        :return: строка для добавления после VALUES
+        '''
+        conflict = 'ON CONFLICT (' + ', '.join(key_columns) + ')'
+        if not update_columns:
+            return conflict + ' DO NOTHING'
+        return conflict + ' DO UPDATE SET ' + ', '.join([f'{column} = EXCLUDED.{column}'
+                                                         for column in update_columns])
+
+    def column_kind(self, type_code) -> str or None:
+        '''
+        Вид значений столбца для сборки DataFrame (см. Frames.build_frame).
+
+        :param type_code: второй элемент описания столбца в cursor.description
+        :return: 'int', 'float', 'decimal', 'bool', 'datetime', 'str' или None - вывести по значениям
+        '''
+        return None
+
+    def set_timeout(self, connection,
+                    seconds: float or None):
+        '''
+        По умолчанию движок ограничение времени не поддерживает, и оно игнорируется.
+
+        :param connection: соединение драйвера
+        :param seconds: ограничение в секундах. None - без ограничения.
+        :return: ничего
+        '''
+        return
+
+    def cancel(self, connection,
+               connection_data) -> bool:
+        '''
+
+        :param connection: соединение драйвера, на котором выполняется запрос
+        :param connection_data: RemoteConnectionData (если для отмены нужно отдельное соединение)
+        :return: True - отмена отправлена
+        '''
+        return False
+
+    def is_cancelled(self, exception: BaseException) -> bool:
+        return False
+
+    def is_undefined_column(self, exception: BaseException) -> bool:
+        return False
+
+
+class MySQLDriver(Driver):
+    module_name = 'pymysql'
+    # pymysql.constants.FIELD_TYPE
+    kinds = {1: 'int', 2: 'int', 3: 'int', 8: 'int', 9: 'int', 13: 'int',
+             4: 'float', 5: 'float',
+             0: 'decimal', 246: 'decimal',
+             7: 'datetime', 10: 'datetime', 12: 'datetime', 14: 'datetime',
+             15: 'str', 253: 'str', 254: 'str', 247: 'str'}
+
+    def connect(self, connection_data,
+                statement_cache_size: int = 100):
+        return self.module().connect(host=connection_data.host,
+                                     port=connection_data.port,
+                                     user=connection_data.user,
+                                     password=connection_data.password,
+                                     database=connection_data.base_name
+                                     )  # законектились
+
+    def column_kind(self, type_code) -> str or None:
+        return self.kinds.get(type_code)
+
+    def stream_cursor(self, connection,
+                      name: str,
+                      batch_size: int):
+        cursors = importlib.import_module('pymysql.cursors')
+        return connection.cursor(cursors.SSCursor)
+
+    def set_timeout(self, connection,
+                    seconds: float or None):
+        # max_execution_time (MySQL 5.7.8+) ограничивает только SELECT
+        with connection.cursor() as cursor:
+            cursor.execute(f'SET SESSION max_execution_time = {timeout_ms(seconds)}')
+
+    def cancel(self, connection,
+               connection_data) -> bool:
+        # Сессию с запросом не перебить, поэтому KILL QUERY отправляется через отдельное соединение
+        killer = self.connect(connection_data)
+        try:
+            with killer.cursor() as cursor:
+                cursor.execute(f'KILL QUERY {int(connection.thread_id())}')
+        finally:
+            killer.close()
+        return True
+
+    def is_cancelled(self, exception: BaseException) -> bool:
+        # 3024 - ER_QUERY_TIMEOUT, 1317 - ER_QUERY_INTERRUPTED
+        return bool(exception.args) and exception.args[0] in (3024, 1317)
+
+    def is_undefined_column(self, exception: BaseException) -> bool:
+        return bool(exception.args) and exception.args[0] == 1054  # ER_BAD_FIELD_ERROR
+
+    # Многострочные INSERT pymysql собирает из executemany сам
+
+    def upsert_clause(self, key_columns: list,
+                      update_columns: list) -> str:
+        # Ключ MySQL берёт из уникальных индексов таблицы сам; key_columns нужны только для "пустого" обновления
+        if not update_columns:
+            column = key_columns[0]
+            return f'ON DUPLICATE KEY UPDATE {column} = {column}'
+        return 'ON DUPLICATE KEY UPDATE ' + ', '.join([f'{column} = VALUES({column})' for column in update_columns])
+
+
+class PostgreSQLDriver(Driver):
+    module_name = 'psycopg2'
+    server_prepare = True
+    # OID типов из pg_type
+    kinds = {20: 'int', 21: 'int', 23: 'int', 26: 'int',
+             700: 'float', 701: 'float',
+             1700: 'decimal',
+             16: 'bool',
+             1082: 'datetime', 1114: 'datetime', 1184: 'datetime',
+             18: 'str', 25: 'str', 1042: 'str', 1043: 'str'}
+
+    def connect(self, connection_data,
+                statement_cache_size: int = 100):
+        return self.module().connect(host=connection_data.host,
+                                     port=connection_data.port,
+                                     user=connection_data.user,
+                                     password=connection_data.password,
+                                     dbname=connection_data.base_name
+                                     )  # законектились
+
+    def column_kind(self, type_code) -> str or None:
+        return self.kinds.get(type_code)
+
+    def stream_cursor(self, connection,
+                      name: str,
+                      batch_size: int):
+        cursor = connection.cursor(name=name)  # именованный курсор - серверный
+        cursor.itersize = batch_size
+        return cursor
+
+    def set_timeout(self, connection,
+                    seconds: float or None):
+        # SET в PostgreSQL транзакционный: откат транзакции возвращает прежнее значение
+        with connection.cursor() as cursor:
+            cursor.execute(f'SET statement_timeout = {timeout_ms(seconds)}')
+
+    def cancel(self, connection,
+               connection_data) -> bool:
+        connection.cancel()  # psycopg2 разрешает вызывать из другого потока
+        return True
+
+    def is_cancelled(self, exception: BaseException) -> bool:
+        return getattr(exception, 'pgcode', None) == '57014'  # query_canceled
+
+    def is_undefined_column(self, exception: BaseException) -> bool:
+        return getattr(exception, 'pgcode', None) == '42703'  # undefined_column
+
+    def bulk_insert(self, cursor,
+                    table: str,
+                    columns_names: list,
+                    chunk: list) -> str:
+        request = f'COPY {table} (' + ', '.join(columns_names) + ') FROM STDIN WITH (FORMAT csv)'
+        cursor.copy_expert(request, io.StringIO(''.join([csv_line(row) for row in chunk])))
+        return request
+
+
+class SQLiteDriver(Driver):
+    module_name = 'sqlite3'
+    placeholder = '?'
+    # Ограничение времени - обработчик прогресса, который прерывает запрос после срока. Он ставится на запрос.
+    session_timeout = False
+    progress_steps = 1000  # Через сколько инструкций виртуальной машины SQLite проверять срок
+
+    @property
+    def max_parameters(self) -> int:
+        # SQLITE_MAX_VARIABLE_NUMBER: 999 до версии 3.32.0, 32766 начиная с неё
+        if self.module().sqlite_version_info < (3, 32, 0):
+            return 999
+        return 32766
+
+    def set_timeout(self, connection,
+                    seconds: float or None):
+        if seconds is None:
+            connection.set_progress_handler(None, 0)
+            return
+
+        deadline = time.monotonic() + seconds
+        connection.set_progress_handler(lambda: time.monotonic() > deadline, self.progress_steps)
+
+    def cancel(self, connection,
+               connection_data) -> bool:
+        connection.interrupt()
+        return True
+
+    def is_cancelled(self, exception: BaseException) -> bool:
+        return isinstance(exception, self.module().OperationalError) and 'interrupted' in str(exception)
+
+    def is_undefined_column(self, exception: BaseException) -> bool:
+        return isinstance(exception, self.module().OperationalError) and 'no such column' in str(exception)
+
+    def connect(self, connection_data,
+                statement_cache_size: int = 100):
+        # Пул сам следит, чтобы соединением пользовался один поток за раз
+        return self.module().connect(database=connection_data.catalog,
+                                     check_same_thread=False,
+                                     cached_statements=max(statement_cache_size, 1))  # законектились
+
+
+def timeout_ms(seconds: float or None) -> int:
+    '''
+
+    :param seconds: ограничение в секундах или None
+    :return: миллисекунды для настроек сервера, 0 - без ограничения
+    '''
+    if seconds is None:
+        return 0
+    return max(int(seconds * 1000), 1)
+
+
+def csv_line(row) -> str:
+    '''
+    Строка CSV для COPY в PostgreSQL: все значения в кавычках, None - пустое значение без кавычек (NULL).
+
+    :param row: кортеж значений
+    :return: строка с переводом строки в конце
+    '''
+    fields = []
+    for value in row:
+        if value is None:
+            fields.append('')
+        elif isinstance(value, (bytes, bytearray, memoryview)):
+            fields.append('"\\x' + bytes(value).hex() + '"')
+        else:
+            fields.append('"' + str(value).replace('"', '""') + '"')
+    return ','.join(fields) + '\n'
+
+
+# ------------------------------------------------------------------------------------------------
+# Реестр -----------------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------------------------
+_drivers = {'MySQL': MySQLDriver(),
+            'PostgreSQL': PostgreSQLDriver(),
+            'SQLite': SQLiteDriver()}
+_drivers_mutex = threading.RLock()
+
+
+def register_driver(engine: str, driver: Driver):
+    '''
+    Регистрирует (или заменяет) драйвер движка.
+
+    :param engine: название движка, как в RemoteConnectionData.engine
+    :param driver: объект драйвера
+    :return: ничего
+    '''
+    if not isinstance(driver, Driver):
+        raise ProcessingError(f'Driver {type(driver)} is not a Driver subclass.')
+    with _drivers_mutex:
+        _drivers[engine] = driver
+    return
+
+
+def get_driver(engine: str) -> Driver:
+    '''
+
+    :param engine: название движка
+    :return: драйвер движка
+    '''
+    with _drivers_mutex:
+        try:
+            return _drivers[engine]
+        except KeyError:
+            raise ProcessingError(f'Wrong engine type: {engine}. ' +
+                                  f'Allowed: {", ".join(_drivers)}.') from None
+
+
+def registered_engines() -> list:
+    with _drivers_mutex:
+        return list(_drivers)
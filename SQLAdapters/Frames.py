@@ -0,0 +1,59 @@
+'''
+Сборка pandas.DataFrame из столбцов ответа. pandas импортируется при первой сборке, а не при импорте пакета.
+'''
+
+import importlib
+
+
+def build_frame(description,
+                columns: list,
+                driver):
+    '''
+    Собирает DataFrame из значений столбцов. Тип столбца берётся из cursor.description через драйвер движка:
+        целые - int64 (Int64, если есть NULL), дробные и decimal - float64, логические - bool (boolean, если есть
+        NULL), даты - datetime64, строки - object. Если драйвер тип не знает, pandas выводит его по значениям.
+
+    :param description: cursor.description или None
+    :param columns: список списков значений, по одному на столбец description
+    :param driver: Drivers.Driver движка
+    :return: DataFrame
+    '''
+    pandas = importlib.import_module('pandas')
+    if not description:
+        return pandas.DataFrame()
+
+    names = [column[0] for column in description]
+    series = {}
+    for position, (column, values) in enumerate(zip(description, columns)):
+        series[position] = column_series(pandas, values, driver.column_kind(column[1]))
+
+    frame = pandas.DataFrame(series)
+    frame.columns = names  # имена могут повторяться (JOIN), поэтому не ключи словаря
+    return frame
+
+
+def column_series(pandas,
+                  values: list,
+                  kind: str or None):
+    '''
+
+    :param pandas: модуль pandas
+    :param values: значения столбца
+    :param kind: вид значений от Driver.column_kind()
+    :return: pandas.Series
+    '''
+    try:
+        if kind == 'int':
+            return pandas.Series(values, dtype='Int64' if None in values else 'int64')
+        if kind in ('float', 'decimal'):
+            return pandas.Series([float('nan') if value is None else float(value) for value in values]
+                                 if kind == 'decimal' else values, dtype='float64')
+        if kind == 'bool':
+            return pandas.Series(values, dtype='boolean' if None in values else 'bool')
+        if kind == 'datetime':
+            return pandas.Series(pandas.to_datetime(values))
+        if kind == 'str':
+            return pandas.Series(values, dtype=object)
+    except (TypeError, ValueError, OverflowError):  # значения не влезли в тип (BIGINT UNSIGNED, даты вне диапазона)
+        return pandas.Series(values, dtype=object)
+    return pandas.Series(values)
@@ -0,0 +1,224 @@
+import math
+import re
+import threading
+
+
+_literals_pattern = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_lists_pattern = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_rows_pattern = re.compile(r'\((\?\+?)\)(?:\s*,\s*\(\?\+?\))+')
+_spaces_pattern = re.compile(r'\s+')
+
+
+def fingerprint(request: str) -> str:
+    '''
+    "Отпечаток" запроса: строковые и числовые литералы заменяются на "?", списки "(?, ?, ...)" схлопываются
+        в "(?+)", повторы таких групп (многострочный VALUES) - в "(?+), ...", пробельные символы - в один пробел.
+        Запросы, отличающиеся только значениями и количеством строк, дают один отпечаток.
+
+    :param request: запрос
+    :return: отпечаток
+    '''
+    request = _literals_pattern.sub('?', request)
+    request = _spaces_pattern.sub(' ', request).strip()
+    request = _lists_pattern.sub('(?+)', request)
+    return _rows_pattern.sub(r'(\1), ...', request)
+
+
+def estimate_size(result) -> int:
+    '''
+    Примерный объём ответа в байтах: длина строк и байтовых значений, 8 байт на прочие значения.
+
+    :param result: ответ: список строк, строка или одно значение
+    :return: количество байт
+    '''
+    if isinstance(result, (list, tuple)):
+        return sum(estimate_size(value) for value in result)
+    if isinstance(result, (str, bytes, bytearray)):
+        return len(result)
+    if result is None:
+        return 0
+    return 8
+
+
+class QueryEvent:
+    '''
+    Данные об одном выполнении запроса, которые адаптер передаёт хукам.
+
+    Методы и свойства:
+        request - запрос
+
+        fingerprint - отпечаток запроса
+
+        wall_time - полное время выполнения в секундах, включая ожидание соединения
+
+        wait_time - время ожидания соединения из пула в секундах
+
+        rows - количество полученных (или изменённых) строк
+
+        bytes - примерный объём полученных данных
+
+        error - исключение или None
+    '''
+    __slots__ = ('request', 'fingerprint', 'wall_time', 'wait_time', 'rows', 'bytes', 'error')
+
+    def __init__(self, request: str,
+                 wall_time: float,
+                 wait_time: float,
+                 rows: int = 0,
+                 bytes: int = 0,
+                 error: BaseException = None):
+        self.request = request
+        self.fingerprint = fingerprint(request)
+        self.wall_time = wall_time
+        self.wait_time = wait_time
+        self.rows = rows
+        self.bytes = bytes
+        self.error = error
+
+
+class LatencyHistogram:
+    '''
+    Гистограмма времени с логарифмическими корзинами: относительная погрешность перцентилей около
+        2 ** (1 / precision) - 1 при постоянном объёме памяти.
+
+    Методы и свойства:
+        count, total, minimum, maximum
+
+        record() - добавить значение
+
+        percentile() - перцентиль
+    '''
+
+    def __init__(self, precision: int = 8,
+                 resolution: float = 1e-6):
+        '''
+
+        :param precision: количество корзин на каждое удвоение значения
+        :param resolution: наименьшее различимое значение (секунды)
+        '''
+        self.__precision = precision
+        self.__resolution = resolution
+        self.__buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    def record(self, value: float):
+        self.count += 1
+        self.total += value
+        self.minimum = value if self.minimum is None else min(self.minimum, value)
+        self.maximum = value if self.maximum is None else max(self.maximum, value)
+
+        if value <= self.__resolution:
+            bucket = 0
+        else:
+            bucket = int(math.log2(value / self.__resolution) * self.__precision) + 1
+        self.__buckets[bucket] = self.__buckets.get(bucket, 0) + 1
+
+    def percentile(self, q: float) -> float or None:
+        '''
+
+        :param q: перцентиль от 0 до 100
+        :return: верхняя граница корзины, в которую попал перцентиль (не больше максимума). None - нет данных.
+        '''
+        if self.count == 0:
+            return None
+
+        rank = q / 100 * self.count
+        seen = 0
+        for bucket in sorted(self.__buckets):
+            seen += self.__buckets[bucket]
+            if seen >= rank:
+                upper = self.__resolution * 2 ** (bucket / self.__precision)
+                return min(upper, self.maximum)
+        return self.maximum
+
+
+class QueryMetrics:
+    '''
+    Хук для CommonAdapterInterface.add_hook(): собирает по каждому отпечатку запроса количество вызовов и ошибок,
+        гистограммы полного времени и ожидания соединения, строки и байты.
+
+    Методы и свойства:
+        snapshot() - статистика в виде словаря
+
+        export() - отправить статистику в Logging.Logger
+
+        reset() - сбросить статистику
+    '''
+
+    def __init__(self):
+        self.__queries = {}
+        self.__mutex = threading.RLock()
+
+    def __call__(self, event: QueryEvent):
+        with self.__mutex:
+            stats = self.__queries.get(event.fingerprint)
+            if stats is None:
+                stats = {'calls': 0, 'errors': 0, 'rows': 0, 'bytes': 0,
+                         'wall_time': LatencyHistogram(), 'wait_time': LatencyHistogram()}
+                self.__queries[event.fingerprint] = stats
+
+            stats['calls'] += 1
+            if event.error is not None:
+                stats['errors'] += 1
+            stats['rows'] += event.rows
+            stats['bytes'] += event.bytes
+            stats['wall_time'].record(event.wall_time)
+            stats['wait_time'].record(event.wait_time)
+        return
+
+    def snapshot(self) -> dict:
+        '''
+
+        :return: {отпечаток: {'calls', 'errors', 'rows', 'bytes', 'wall_time': {...}, 'wait_time': {...}}},
+            где для времени даны 'total', 'max', 'p50', 'p95', 'p99' в секундах
+        '''
+        export_dict = {}
+        with self.__mutex:
+            for query, stats in self.__queries.items():
+                export_dict[query] = {'calls': stats['calls'],
+                                      'errors': stats['errors'],
+                                      'rows': stats['rows'],
+                                      'bytes': stats['bytes'],
+                                      'wall_time': self.__describe(stats['wall_time']),
+                                      'wait_time': self.__describe(stats['wait_time'])}
+        return export_dict
+
+    def export(self, logger,
+               logging_level: str or int = 'INFO',
+               reset: bool = False):
+        '''
+        Отправляет статистику в логер: одно сообщение на отпечаток запроса, данные в logging_data.
+
+        :param logger: Logging.Logger или объект с таким же методом log()
+        :param logging_level: уровень сообщений
+        :param reset: сбросить статистику после отправки
+        :return: ничего
+        '''
+        with self.__mutex:
+            snapshot = self.snapshot()
+            if reset:
+                self.reset()
+
+        for query, stats in snapshot.items():
+            logger.log(message='SQL query statistics.',
+                       function_name='QueryMetrics.export',
+                       logging_level=logging_level,
+                       logging_data={'fingerprint': query, **stats},
+                       exception=False)
+        return
+
+    def reset(self):
+        with self.__mutex:
+            self.__queries = {}
+        return
+
+    @staticmethod
+    def __describe(histogram: LatencyHistogram) -> dict:
+        return {'total': histogram.total,
+                'max': histogram.maximum,
+                'p50': histogram.percentile(50),
+                'p95': histogram.percentile(95),
+                'p99': histogram.percentile(99)}
@@ -0,0 +1,363 @@
+from .CommomAdapter import CommonAdapterInterface, NotConnected, ConnectionLostError
+from .ConnectionData import RemoteConnectionData
+from Exceptions.ExceptionTypes import ProcessingError
+
+import itertools
+import threading
+import time
+
+
+class ReplicatedAdapter:
+    '''
+    Адаптер для основного сервера с репликами для чтения.
+    Чтения (request_fetch_*, request_stream, simple_check, simple_expanded_strings, param_check) уходят на реплики,
+        запросы с изменениями - на основной сервер. Внутри transaction() / batch() основного сервера чтения потока
+        тоже идут на основной сервер, чтобы видеть свои изменения.
+    Реплика, к которой не удалось подключиться, пропускается replica_retry_interval секунд; если недоступны все,
+        чтение уходит на основной сервер.
+
+    Стратегии выбора реплики:
+        'round_robin' - по кругу
+        'least_latency' - с наименьшим сглаженным временем ответа
+
+    Methods
+        Access
+            Primary - adapter of the primary server
+            Replicas - adapters of the replicas
+            strategy
+            in_transaction
+
+        Standard Methods
+            ping()
+            close()
+
+        Instrumentation
+            add_hook()
+            drop_hook()
+
+        Transactions
+            transaction()
+            batch()
+
+        Reads (replicas)
+            request_fetch_all()
+            request_fetch_many()
+            request_fetch_value()
+            request_stream()
+            request_fetch_frame()
+            simple_check()
+            simple_expanded_strings()
+            param_check()
+            table_columns()
+
+        Writes (primary)
+            request_commit()
+            simple_insert_string()
+            simple_update()
+            simple_insert()
+            simple_upsert()
+            param_insert_string()
+            param_update()
+            bulk_insert()
+            bulk_upsert()
+    '''
+    strategies = ('round_robin', 'least_latency')
+
+    def __init__(self,
+                 primary: RemoteConnectionData,
+                 replicas: list,
+                 strategy: str = 'round_robin',
+                 replica_retry_interval: float = 30.0,
+                 latency_smoothing: float = 0.2,
+                 **kwargs):
+        '''
+
+        :param primary: данные подключения к основному серверу
+        :param replicas: список RemoteConnectionData реплик. Пустой - всё идёт на основной сервер.
+        :param strategy: 'round_robin' или 'least_latency'
+        :param replica_retry_interval: сколько секунд не обращаться к недоступной реплике
+        :param latency_smoothing: вес нового замера в сглаженном времени ответа (для 'least_latency')
+        :param kwargs: прочие параметры CommonAdapterInterface (размер пула, таймауты и т.п.), общие для всех серверов
+        '''
+        if strategy not in self.strategies:
+            raise ValueError(f'Wrong strategy: {strategy}. Allowed: {", ".join(self.strategies)}.')
+
+        self.__strategy = strategy
+        self.__retry_interval = replica_retry_interval
+        self.__smoothing = latency_smoothing
+
+        self.__Primary = CommonAdapterInterface.from_connection_data(connection_data=primary, **kwargs)
+        self.__Replicas = []
+        self.__latency = []  # сглаженное время ответа
+        self.__down_until = []  # до какого момента реплика считается недоступной
+        for replica in replicas:
+            try:
+                adapter = CommonAdapterInterface.from_connection_data(connection_data=replica, **kwargs)
+                down_until = 0.0
+            except ProcessingError:  # Недоступная при старте реплика подключится позже, пул пока пустой
+                adapter = CommonAdapterInterface.from_connection_data(connection_data=replica,
+                                                                      **{**kwargs, 'min_connections': 0})
+                down_until = time.monotonic() + replica_retry_interval
+            self.__Replicas.append(adapter)
+            self.__latency.append(0.0)
+            self.__down_until.append(down_until)
+
+        self.__counter = itertools.count()
+        self.__hooks = {}  # {индекс: [индексы хука в адаптерах]}
+        self.__mutex = threading.Lock()
+
+        # Запись сбрасывает кэши реплик тогда же, когда и кэш основного сервера: после коммита
+        if self.__Primary.Cache is not None:
+            for replica in self.__Replicas:
+                if replica.Cache is not None:
+                    self.__Primary.Cache.add_follower(replica.Cache)
+
+    # ------------------------------------------------------------------------------------------------
+    # Access -----------------------------------------------------------------------------------------
+    # ------------------------------------------------------------------------------------------------
+    @property
+    def Primary(self) -> CommonAdapterInterface:
+        return self.__Primary
+
+    @property
+    def Replicas(self) -> list:
+        return list(self.__Replicas)
+
+    @property
+    def strategy(self) -> str:
+        return self.__strategy
+
+    @property
+    def in_transaction(self) -> bool:
+        return self.__Primary.in_transaction
+
+    # ------------------------------------------------------------------------------------------------
+    # Standard Methods -------------------------------------------------------------------------------
+    # ------------------------------------------------------------------------------------------------
+    def ping(self, reconnect: bool = True) -> bool:
+        '''
+        Проверяет все серверы. Доступные реплики снова участвуют в чтении.
+
+        :param reconnect: пересоздать пул сервера, если проверка не прошла
+        :return: True - основной сервер отвечает
+        '''
+        for position, replica in enumerate(self.__Replicas):
+            alive = replica.ping(reconnect=reconnect)
+            with self.__mutex:
+                self.__down_until[position] = 0.0 if alive else time.monotonic() + self.__retry_interval
+        return self.__Primary.ping(reconnect=reconnect)
+
+    def close(self):
+        for adapter in [self.__Primary] + self.__Replicas:
+            adapter.close()
+        return
+
+    # ------------------------------------------------------------------------------------------------
+    # Instrumentation --------------------------------------------------------------------------------
+    # ------------------------------------------------------------------------------------------------
+    def add_hook(self, hook) -> int:
+        '''
+        Добавляет хук на все серверы (см. CommonAdapterInterface.add_hook).
+
+        :param hook: функция вида func(QueryEvent)
+        :return: индекс хука
+        '''
+        ids = [adapter.add_hook(hook) for adapter in [self.__Primary] + self.__Replicas]
+        with self.__mutex:
+            new_id = max(self.__hooks) + 1 if self.__hooks != {} else 0
+            self.__hooks[new_id] = ids
+        return new_id
+
+    def drop_hook(self, hook_id: int):
+        with self.__mutex:
+            if hook_id not in self.__hooks:
+                raise KeyError(f'No such hook: {hook_id}')
+            ids = self.__hooks.pop(hook_id)
+        for adapter, adapter_hook_id in zip([self.__Primary] + self.__Replicas, ids):
+            adapter.drop_hook(adapter_hook_id)
+        return
+
+    # ------------------------------------------------------------------------------------------------
+    # Transactions -----------------------------------------------------------------------------------
+    # ------------------------------------------------------------------------------------------------
+    def transaction(self):
+        '''
+        transaction() основного сервера. Чтения потока внутри неё идут на основной сервер.
+
+        :return: контекстный менеджер, отдающий адаптер основного сервера
+        '''
+        return self.__Primary.transaction()
+
+    def batch(self):
+        return self.__Primary.batch()
+
+    # ------------------------------------------------------------------------------------------------
+    # Routing ----------------------------------------------------------------------------------------
+    # ------------------------------------------------------------------------------------------------
+    def _read_order(self) -> list:
+        '''
+        Порядок, в котором пробовать реплики для очередного чтения.
+
+        :return: список индексов реплик. Пустой - читать с основного сервера.
+        '''
+        if not self.__Replicas or self.__Primary.in_transaction:
+            return []
+
+        now = time.monotonic()
+        with self.__mutex:
+            alive = [position for position in range(len(self.__Replicas)) if self.__down_until[position] <= now]
+            if not alive:
+                return []
+
+            if self.__strategy == 'least_latency':
+                return sorted(alive, key=lambda position: self.__latency[position])
+
+            shift = next(self.__counter) % len(alive)
+            return alive[shift:] + alive[:shift]
+
+    def _read(self, method: str, *args, **kwargs):
+        '''
+        Выполняет метод чтения на реплике. Если реплика недоступна, пробуется следующая, затем основной сервер.
+
+        :param method: имя метода CommonAdapterInterface
+        :param args: позиционные аргументы
+        :param kwargs: именованные аргументы
+        :return: результат метода
+        '''
+        for position in self._read_order():
+            started = time.perf_counter()
+            try:
+                result = getattr(self.__Replicas[position], method)(*args, **kwargs)
+            except (NotConnected, ConnectionLostError):
+                with self.__mutex:
+                    self.__down_until[position] = time.monotonic() + self.__retry_interval
+                continue
+
+            elapsed = time.perf_counter() - started
+            with self.__mutex:
+                latency = self.__latency[position]
+                self.__latency[position] = elapsed if latency == 0.0 else \
+                    latency + self.__smoothing * (elapsed - latency)
+            return result
+
+        return getattr(self.__Primary, method)(*args, **kwargs)
+
+    def _read_adapter(self) -> CommonAdapterInterface:
+        '''
+        Адаптер для ленивых чтений (генераторов), у которых ошибка подключения возникает уже при итерации.
+
+        :return: адаптер реплики или основного сервера
+        '''
+        order = self._read_order()
+        if not order:
+            return self.__Primary
+        return self.__Replicas[order[0]]
+
+    # ------------------------------------------------------------------------------------------------
+    # Reads ------------------------------------------------------------------------------------------
+    # ------------------------------------------------------------------------------------------------
+    def request_fetch_all(self, request: str,
+                          params: tuple or list or dict = None,
+                          timeout: float = None) -> list:
+        return self._read('request_fetch_all', request=request, params=params, timeout=timeout)
+
+    def request_fetch_many(self, request: str,
+                           size: int = 1,
+                           params: tuple or list or dict = None,
+                           timeout: float = None) -> list:
+        return self._read('request_fetch_many', request=request, size=size, params=params, timeout=timeout)
+
+    def request_fetch_value(self, request: str,
+                            params: tuple or list or dict = None,
+                            timeout: float = None) -> object:
+        return self._read('request_fetch_value', request=request, params=params, timeout=timeout)
+
+    def request_stream(self, request: str,
+                       batch_size: int = 1000,
+                       params: tuple or list or dict = None,
+                       batches: bool = False):
+        return self._read_adapter().request_stream(request=request, batch_size=batch_size,
+                                                   params=params, batches=batches)
+
+    def request_fetch_frame(self, request: str,
+                            chunksize: int = None,
+                            params: tuple or list or dict = None,
+                            batch_size: int = 10000):
+        if chunksize is not None:
+            return self._read_adapter().request_fetch_frame(request=request, chunksize=chunksize,
+                                                            params=params, batch_size=batch_size)
+        return self._read('request_fetch_frame', request=request, params=params, batch_size=batch_size)
+
+    def simple_check(self, table: str, **kwargs) -> bool:
+        return self._read('simple_check', table, **kwargs)
+
+    def simple_expanded_strings(self, table: str, **kwargs) -> list or dict:
+        return self._read('simple_expanded_strings', table, **kwargs)
+
+    def param_check(self, table: str, **kwargs) -> bool:
+        return self._read('param_check', table, **kwargs)
+
+    def table_columns(self, table: str) -> list:
+        return self._read('table_columns', table)
+
+    def invalidate_schema(self, table: str = None):
+        for adapter in [self.__Primary] + self.__Replicas:
+            adapter.invalidate_schema(table)
+        return
+
+    # ------------------------------------------------------------------------------------------------
+    # Writes -----------------------------------------------------------------------------------------
+    # ------------------------------------------------------------------------------------------------
+    def request_commit(self, request: str,
+                       params: tuple or list or dict = None,
+                       timeout: float = None) -> None:
+        return self.__Primary.request_commit(request=request, params=params, timeout=timeout)
+
+    def simple_insert_string(self, table: str, **kwargs):
+        return self.__Primary.simple_insert_string(table, **kwargs)
+
+    def simple_update(self, table: str,
+                      set_values: dict,
+                      where: dict = None):
+        return self.__Primary.simple_update(table=table, set_values=set_values, where=where)
+
+    def simple_insert(self, table: str,
+                      columns_names: list,
+                      values_list: list,
+                      step: int = 500,
+                      single_commit: bool = True):
+        return self.__Primary.simple_insert(table=table, columns_names=columns_names, values_list=values_list,
+                                            step=step, single_commit=single_commit)
+
+    def simple_upsert(self, table: str,
+                      key_columns: list,
+                      update_columns: list = None,
+                      **kwargs):
+        return self.__Primary.simple_upsert(table, key_columns, update_columns, **kwargs)
+
+    def param_insert_string(self, table: str, **kwargs):
+        return self.__Primary.param_insert_string(table, **kwargs)
+
+    def param_update(self, table: str,
+                     set_values: dict or list,
+                     where: dict or list = None):
+        return self.__Primary.param_update(table=table, set_values=set_values, where=where)
+
+    def bulk_insert(self, table: str,
+                    columns_names: list,
+                    rows,
+                    step: int = 10000,
+                    single_commit: bool = True):
+        return self.__Primary.bulk_insert(table=table, columns_names=columns_names, rows=rows,
+                                          step=step, single_commit=single_commit)
+
+    def bulk_upsert(self, table: str,
+                    columns_names: list,
+                    rows,
+                    key_columns: list,
+                    update_columns: list = None,
+                    step: int = 500,
+                    single_commit: bool = True):
+        return self.__Primary.bulk_upsert(table=table, columns_names=columns_names, rows=rows,
+                                          key_columns=key_columns, update_columns=update_columns,
+                                          step=step, single_commit=single_commit)
@@ -0,0 +1,292 @@
+import collections
+import pickle
+import re
+import threading
+import time
+
+
+any_table = '*'  # Тег ответа, таблицы которого определить не удалось: его сбрасывает любая запись
+
+_from_pattern = re.compile(r'\b(FROM|JOIN)\b', re.IGNORECASE)
+_name_part = r'(?:`[^`]+`|"[^"]+"|\[[^\]]+\]|[\w$]+)'
+_table_name_pattern = re.compile(r'\s*(' + _name_part + r'(?:\s*\.\s*' + _name_part + r')*)', re.IGNORECASE)
+_alias_pattern = re.compile(r'\s+(?:AS\s+)?(?!(?:WHERE|JOIN|INNER|LEFT|RIGHT|FULL|CROSS|NATURAL|OUTER|ON|USING|GROUP|'
+                            r'ORDER|LIMIT|OFFSET|FETCH|HAVING|UNION|EXCEPT|INTERSECT|WINDOW|FOR|LATERAL|RETURNING|'
+                            r'WITH|STRAIGHT_JOIN)\b)' + _name_part, re.IGNORECASE)
+_written_table_pattern = re.compile(r'^\s*(?:'
+                                    r'INSERT\s+(?:(?:OR\s+\w+|IGNORE|LOW_PRIORITY|DELAYED|HIGH_PRIORITY)\s+)*INTO|'
+                                    r'REPLACE\s+(?:(?:LOW_PRIORITY|DELAYED)\s+)?INTO|'
+                                    r'UPDATE\s+(?:(?:LOW_PRIORITY|IGNORE|OR\s+\w+)\s+)*|'
+                                    r'DELETE\s+(?:(?:LOW_PRIORITY|QUICK|IGNORE)\s+)*FROM|'
+                                    r'TRUNCATE\s+(?:TABLE\s+)?|'
+                                    r'COPY|'
+                                    r'(?:ALTER|DROP)\s+TABLE\s+(?:IF\s+EXISTS\s+)?'
+                                    r')\s*([\w.`"\[\]]+)', re.IGNORECASE)
+_spaces_pattern = re.compile(r'\s+')
+
+
+def normalise_table(table: str) -> str:
+    '''
+    Приводит имя таблицы к виду для тегов кэша: без кавычек, схемы (базы) и в нижнем регистре, чтобы
+        public.t, "T" и t давали один тег. Одноимённые таблицы разных схем сбрасываются вместе - это лишь лишний сброс.
+
+    :param table: имя таблицы
+    :return: нормализованное имя
+    '''
+    table = re.sub(r'\s*\.\s*', '.', table.strip())
+    return re.sub(r'[`"\[\]]', '', table).rsplit('.', 1)[-1].lower()
+
+
+def normalise_request(request: str) -> str:
+    '''
+    Схлопывает пробельные символы в запросе, чтобы одинаковые запросы с разным форматированием давали один ключ.
+
+    :param request: запрос
+    :return: нормализованный запрос
+    '''
+    return _spaces_pattern.sub(' ', request).strip()
+
+
+def read_tables(request: str) -> set:
+    '''
+    Таблицы, из которых читает запрос: после JOIN и весь список через запятую после FROM.
+    Подзапросы в скобках разбираются своими FROM. Если таблицы определить не удалось (нет FROM,
+        функция в FROM), в наборе будет any_table.
+
+    :param request: запрос
+    :return: множество нормализованных имён таблиц
+    '''
+    tables = set()
+    reliable = True
+    for match in _from_pattern.finditer(request):
+        position = match.end()
+        while True:
+            position = _skip_spaces(request, position)
+            if request.startswith('(', position):  # Подзапрос: его таблицы найдутся по его FROM
+                position = _skip_brackets(request, position)
+            else:
+                name = _table_name_pattern.match(request, position)
+                if name is None:
+                    reliable = False
+                    break
+                position = name.end()
+                if request.startswith('(', _skip_spaces(request, position)):  # Функция: что она читает, неизвестно
+                    reliable = False
+                    break
+                tables.add(normalise_table(name.group(1)))
+
+            alias = _alias_pattern.match(request, position)
+            if alias is not None:
+                position = alias.end()
+            position = _skip_spaces(request, position)
+            if match.group(1).upper() != 'FROM' or not request.startswith(',', position):
+                break
+            position += 1
+
+    if not tables or not reliable:
+        tables.add(any_table)
+    return tables
+
+
+def _skip_spaces(request: str, position: int) -> int:
+    while position < len(request) and request[position].isspace():
+        position += 1
+    return position
+
+
+def _skip_brackets(request: str, position: int) -> int:
+    '''
+
+    :param request: запрос
+    :param position: позиция открывающей скобки
+    :return: позиция после парной закрывающей скобки (или конец запроса)
+    '''
+    depth = 0
+    for index in range(position, len(request)):
+        if request[index] == '(':
+            depth += 1
+        elif request[index] == ')':
+            depth -= 1
+            if depth == 0:
+                return index + 1
+    return len(request)
+
+
+def written_tables(request: str) -> set or None:
+    '''
+    Таблица, которую меняет запрос.
+
+    :param request: запрос
+    :return: множество из одного нормализованного имени или None, если таблицу определить не удалось
+    '''
+    match = _written_table_pattern.match(request)
+    if match is None:
+        return None
+    return {normalise_table(match.group(1))}
+
+
+class ResultCache:
+    '''
+    LRU кэш ответов на запросы со временем жизни записей, ограничением размера в байтах
+        и сбросом по таблицам.
+
+    Методы и свойства:
+        max_bytes - ограничение размера
+
+        ttl - время жизни записи
+
+        size - текущий размер в байтах
+
+        generation() - "поколение" набора таблиц
+
+        get() - получить ответ
+
+        put() - сохранить ответ
+
+        invalidate() - сбросить записи таблиц или весь кэш
+
+        add_follower() - сбрасывать другой кэш вместе с этим
+    '''
+
+    def __init__(self, max_bytes: int,
+                 ttl: float or None = 60.0):
+        '''
+
+        :param max_bytes: ограничение размера кэша в байтах (по размеру pickle ответа)
+        :param ttl: время жизни записи в секундах. None - до вытеснения или сброса.
+        '''
+        self.__max_bytes = max_bytes
+        self.__ttl = ttl
+
+        self.__entries = collections.OrderedDict()  # {ключ: (время записи, размер, таблицы, ответ)}
+        self.__tags = collections.defaultdict(set)  # {таблица: {ключи}}
+        self.__generations = collections.defaultdict(int)  # {таблица: номер сброса}
+        self.__global_generation = 0
+        self.__size = 0
+        self.__followers = []  # Кэши, которые сбрасываются вместе с этим
+        self.__mutex = threading.RLock()
+
+    @property
+    def max_bytes(self) -> int:
+        return self.__max_bytes
+
+    @property
+    def ttl(self) -> float or None:
+        return self.__ttl
+
+    @property
+    def size(self) -> int:
+        with self.__mutex:
+            return self.__size
+
+    def generation(self, tables: set) -> tuple:
+        '''
+        "Поколение" набора таблиц. Его нужно взять до запроса и передать в put(): если таблицы за время запроса
+            сбросили, ответ не сохранится.
+
+        :param tables: набор таблиц
+        :return: отметка поколения
+        '''
+        with self.__mutex:
+            return (self.__global_generation,) + tuple(self.__generations[table] for table in sorted(tables))
+
+    def get(self, key: tuple) -> (bool, object):
+        '''
+
+        :param key: ключ запроса
+        :return: (найден ли ответ, ответ)
+        '''
+        with self.__mutex:
+            entry = self.__entries.get(key)
+            if entry is None:
+                return False, None
+
+            stored, _, _, value = entry
+            if self.__ttl is not None and time.monotonic() - stored > self.__ttl:
+                self.__remove(key)
+                return False, None
+
+            self.__entries.move_to_end(key)
+            return True, value
+
+    def put(self, key: tuple,
+            value: object,
+            tables: set,
+            generation: tuple):
+        '''
+        Сохраняет ответ. Ответ, который не сериализуется или больше всего кэша, не сохраняется.
+
+        :param key: ключ запроса
+        :param value: ответ
+        :param tables: таблицы, из которых читал запрос
+        :param generation: отметка поколения, взятая до запроса
+        :return: ничего
+        '''
+        try:
+            size = len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        except BaseException:
+            return
+        if size > self.__max_bytes:
+            return
+
+        with self.__mutex:
+            if generation != self.generation(tables):  # Таблицы успели измениться
+                return
+
+            if key in self.__entries:
+                self.__remove(key)
+
+            self.__entries[key] = (time.monotonic(), size, tables, value)
+            self.__size += size
+            for table in tables:
+                self.__tags[table].add(key)
+
+            while self.__size > self.__max_bytes:  # Вытесняем самые старые
+                self.__remove(next(iter(self.__entries)))
+        return
+
+    def invalidate(self, tables: set = None):
+        '''
+        Сбрасывает записи, читавшие указанные таблицы, и записи с неизвестными таблицами (any_table).
+
+        :param tables: набор таблиц. None - сбросить весь кэш.
+        :return: ничего
+        '''
+        for follower in self.__followers:
+            follower.invalidate(tables)
+
+        with self.__mutex:
+            if tables is None:
+                self.__global_generation += 1
+                self.__entries.clear()
+                self.__tags.clear()
+                self.__size = 0
+                return
+
+            for table in set(tables) | {any_table}:
+                self.__generations[table] += 1
+                for key in list(self.__tags.pop(table, ())):
+                    self.__remove(key)
+        return
+
+    def add_follower(self, cache):
+        '''
+        Каждый сброс этого кэша повторяется и в кэше cache. Так кэши реплик сбрасываются, когда запись
+            на основном сервере закоммичена.
+
+        :param cache: ResultCache
+        :return: ничего
+        '''
+        with self.__mutex:
+            self.__followers = self.__followers + [cache]  # Новый список: сброс перебирает его без блокировки
+        return
+
+    def __remove(self, key: tuple):
+        _, size, tables, _ = self.__entries.pop(key)
+        self.__size -= size
+        for table in tables:
+            keys = self.__tags.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.__tags[table]
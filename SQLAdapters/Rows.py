@@ -0,0 +1,46 @@
+'''
+Превращение строк ответа (кортежей драйвера) в строки с именами столбцов.
+Вид результата зависит только от row_type, а не от количества строк.
+'''
+
+import collections
+import functools
+import itertools
+
+
+row_types = ('dict', 'namedtuple', 'columns')
+
+
+@functools.lru_cache(maxsize=256)
+def row_class(names: tuple) -> type:
+    '''
+    Класс строки для набора столбцов: namedtuple создаётся один раз на "форму" ответа и берётся из кэша.
+    Имена, которые не годятся для атрибутов (повторы, ключевые слова), заменяются на _0, _1, ...
+
+    :param names: кортеж имён столбцов
+    :return: класс namedtuple
+    '''
+    return collections.namedtuple('Row', names, rename=True)
+
+
+def materialise(names: list,
+                rows: list,
+                row_type: str = 'dict') -> list or dict:
+    '''
+
+    :param names: имена столбцов
+    :param rows: список кортежей значений
+    :param row_type: 'dict' - список словарей {столбец: значение},
+        'namedtuple' - список namedtuple (доступ по имени и по индексу, меньше памяти),
+        'columns' - словарь {столбец: список значений}
+    :return: список строк или словарь столбцов
+    '''
+    if row_type == 'dict':
+        return list(map(dict, map(zip, itertools.repeat(names), rows)))
+    if row_type == 'namedtuple':
+        return list(map(row_class(tuple(names))._make, rows))
+    if row_type == 'columns':
+        if not rows:
+            return {name: [] for name in names}
+        return {name: list(values) for name, values in zip(names, zip(*rows))}
+    raise ValueError(f'Wrong row type: {row_type}. Allowed: {", ".join(row_types)}.')
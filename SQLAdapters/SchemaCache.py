@@ -0,0 +1,73 @@
+import threading
+import time
+
+
+class SchemaCache:
+    '''
+    Кэш имён столбцов таблиц со временем жизни записей.
+
+    Методы и свойства:
+        ttl - время жизни записи в секундах. None - бессрочно.
+
+        get() - получить столбцы таблицы или None
+
+        set() - записать столбцы таблицы
+
+        invalidate() - сбросить таблицу или весь кэш
+    '''
+
+    def __init__(self, ttl: float or None = 300.0):
+        '''
+
+        :param ttl: время жизни записи в секундах. None - записи живут до явного сброса.
+        '''
+        self.__ttl = ttl
+        self.__tables = {}  # {таблица: (время записи, [столбцы])}
+        self.__mutex = threading.RLock()
+
+    @property
+    def ttl(self) -> float or None:
+        return self.__ttl
+
+    def get(self, table: str) -> list or None:
+        '''
+        Отдаёт столбцы таблицы, если запись есть и не устарела.
+
+        :param table: имя таблицы
+        :return: список имён столбцов или None
+        '''
+        with self.__mutex:
+            record = self.__tables.get(table)
+            if record is None:
+                return None
+
+            stored, columns = record
+            if self.__ttl is not None and time.monotonic() - stored > self.__ttl:
+                del self.__tables[table]
+                return None
+            return columns
+
+    def set(self, table: str, columns: list):
+        '''
+
+        :param table: имя таблицы
+        :param columns: список имён столбцов
+        :return: ничего
+        '''
+        with self.__mutex:
+            self.__tables[table] = (time.monotonic(), list(columns))
+        return
+
+    def invalidate(self, table: str = None):
+        '''
+        Сбрасывает запись таблицы или весь кэш.
+
+        :param table: имя таблицы. None - сбросить всё.
+        :return: ничего
+        '''
+        with self.__mutex:
+            if table is None:
+                self.__tables.clear()
+            else:
+                self.__tables.pop(table, None)
+        return
@@ -0,0 +1,307 @@
+from .CommomAdapter import CommonAdapterInterface
+
+import concurrent.futures
+import heapq
+import itertools
+import operator
+import zlib
+
+
+def crc32_shard(key, shards_count: int) -> int:
+    '''
+    Шард по CRC32 строкового представления ключа. В отличие от hash() не зависит от процесса и перезапуска.
+
+    :param key: ключ (например, id клиента)
+    :param shards_count: количество шардов
+    :return: номер шарда
+    '''
+    return zlib.crc32(str(key).encode('utf-8')) % shards_count
+
+
+class ShardedAdapter:
+    '''
+    Адаптер для таблиц, разложенных по нескольким серверам (шардам) по ключу.
+    Запросы с ключом идут на шард, который выбирает функция шардирования. Запросы без ключа к
+        request_fetch_all и scatter() выполняются на всех шардах одновременно в пуле потоков, поэтому
+        отчёт по всем шардам занимает время самого медленного шарда, а не сумму.
+
+    Methods
+        Access
+            Shards - list of adapters
+            shard() - adapter for a key
+            shard_index() - shard number for a key
+
+        Standard Methods
+            close()
+
+        Scatter-gather
+            scatter()
+            request_fetch_all()
+
+        Keyed Requests
+            request_commit()
+            request_fetch_many()
+            request_fetch_value()
+            simple_check()
+            simple_insert_string()
+            simple_update()
+            simple_upsert()
+            simple_expanded_strings()
+            param_check()
+            param_insert_string()
+            param_update()
+
+        Bulk load
+            bulk_insert()
+            bulk_upsert()
+    '''
+
+    def __init__(self,
+                 shards: list,
+                 shard_function=crc32_shard,
+                 max_workers: int = None):
+        '''
+
+        :param shards: список CommonAdapterInterface, по одному на шард. Порядок задаёт номера шардов.
+        :param shard_function: функция вида func(ключ, количество шардов) -> номер шарда
+        :param max_workers: потоков для запросов ко всем шардам. None - по одному на шард.
+        '''
+        if not shards:
+            raise ValueError('No shards passed.')
+
+        self.__Shards = list(shards)
+        self.__shard_function = shard_function
+        self.__executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers or len(self.__Shards),
+                                                                thread_name_prefix='ShardedAdapter')
+
+    @classmethod
+    def from_connection_data(cls, connections_data: list,
+                             shard_function=crc32_shard,
+                             max_workers: int = None,
+                             **kwargs):
+        '''
+
+        :param connections_data: список RemoteConnectionData, по одному на шард
+        :param shard_function: функция вида func(ключ, количество шардов) -> номер шарда
+        :param max_workers: потоков для запросов ко всем шардам
+        :param kwargs: прочие параметры CommonAdapterInterface, общие для всех шардов
+        :return: адаптер
+        '''
+        shards = [CommonAdapterInterface.from_connection_data(connection_data=connection_data, **kwargs)
+                  for connection_data in connections_data]
+        return cls(shards=shards, shard_function=shard_function, max_workers=max_workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    # ------------------------------------------------------------------------------------------------
+    # Access -----------------------------------------------------------------------------------------
+    # ------------------------------------------------------------------------------------------------
+    @property
+    def Shards(self) -> list:
+        return list(self.__Shards)
+
+    def shard_index(self, key) -> int:
+        index = self.__shard_function(key, len(self.__Shards))
+        if not 0 <= index < len(self.__Shards):
+            raise ValueError(f'Shard function returned {index} for {len(self.__Shards)} shards.')
+        return index
+
+    def shard(self, key) -> CommonAdapterInterface:
+        '''
+
+        :param key: ключ шардирования
+        :return: адаптер шарда
+        '''
+        return self.__Shards[self.shard_index(key)]
+
+    # ------------------------------------------------------------------------------------------------
+    # Standard Methods -------------------------------------------------------------------------------
+    # ------------------------------------------------------------------------------------------------
+    def close(self):
+        self.__executor.shutdown(wait=True)
+        for shard in self.__Shards:
+            shard.close()
+        return
+
+    # ------------------------------------------------------------------------------------------------
+    # Scatter-gather ---------------------------------------------------------------------------------
+    # ------------------------------------------------------------------------------------------------
+    def scatter(self, method: str, *args, **kwargs) -> list:
+        '''
+        Выполняет метод CommonAdapterInterface на всех шардах одновременно.
+        Если на каком-то шарде вышла ошибка, она пробрасывается после завершения остальных шардов.
+
+        :param method: имя метода, например 'request_commit'
+        :param args: позиционные аргументы
+        :param kwargs: именованные аргументы
+        :return: список результатов в порядке шардов
+        '''
+        futures = [self.__executor.submit(getattr(shard, method), *args, **kwargs) for shard in self.__Shards]
+        concurrent.futures.wait(futures)
+        return [future.result() for future in futures]
+
+    def request_fetch_all(self, request: str,
+                          params: tuple or list or dict = None,
+                          key=None,
+                          order_by=None,
+                          reverse: bool = False,
+                          limit: int = None,
+                          timeout: float = None) -> list:
+        '''
+        С ключом - запрос к одному шарду. Без ключа - запрос ко всем шардам одновременно и слияние ответов.
+
+        :param request: запрос
+        :param params: параметры запроса
+        :param key: ключ шардирования. None - все шарды.
+        :param order_by: порядок слияния: номер столбца, список номеров или функция вида func(строка) -> ключ.
+            Ответы шардов должны быть уже упорядочены так же (ORDER BY в запросе): они сливаются без пересортировки.
+            None - ответы склеиваются в порядке шардов.
+        :param reverse: True - слияние по убыванию (ORDER BY ... DESC)
+        :param limit: сколько строк оставить после слияния. В запрос стоит добавить тот же LIMIT, чтобы
+            шарды не отдавали лишнего.
+        :param timeout: ограничение времени запроса на каждом шарде (см. CommonAdapterInterface.timeout())
+        :return: список строк
+        '''
+        if key is not None:
+            rows = self.shard(key).request_fetch_all(request=request, params=params, timeout=timeout)
+            return rows if limit is None else rows[:limit]
+
+        results = self.scatter('request_fetch_all', request=request, params=params, timeout=timeout)
+
+        if order_by is None:
+            merged = itertools.chain.from_iterable(results)
+        else:
+            if isinstance(order_by, int):
+                order_by = operator.itemgetter(order_by)
+            elif isinstance(order_by, (list, tuple)):
+                order_by = operator.itemgetter(*order_by)
+            merged = heapq.merge(*results, key=order_by, reverse=reverse)
+
+        if limit is not None:
+            merged = itertools.islice(merged, limit)
+        return list(merged)
+
+    # ------------------------------------------------------------------------------------------------
+    # Keyed requests ---------------------------------------------------------------------------------
+    # ------------------------------------------------------------------------------------------------
+    def request_commit(self, key,
+                       request: str,
+                       params: tuple or list or dict = None,
+                       timeout: float = None) -> None:
+        return self.shard(key).request_commit(request=request, params=params, timeout=timeout)
+
+    def request_fetch_many(self, key,
+                           request: str,
+                           size: int = 1,
+                           params: tuple or list or dict = None,
+                           timeout: float = None) -> list:
+        return self.shard(key).request_fetch_many(request=request, size=size, params=params, timeout=timeout)
+
+    def request_fetch_value(self, key,
+                            request: str,
+                            params: tuple or list or dict = None,
+                            timeout: float = None) -> object:
+        return self.shard(key).request_fetch_value(request=request, params=params, timeout=timeout)
+
+    def simple_check(self, key, table: str, **kwargs) -> bool:
+        return self.shard(key).simple_check(table, **kwargs)
+
+    def simple_insert_string(self, key, table: str, **kwargs):
+        return self.shard(key).simple_insert_string(table, **kwargs)
+
+    def simple_update(self, key,
+                      table: str,
+                      set_values: dict,
+                      where: dict = None):
+        return self.shard(key).simple_update(table=table, set_values=set_values, where=where)
+
+    def simple_upsert(self, key,
+                      table: str,
+                      key_columns: list,
+                      update_columns: list = None,
+                      **kwargs):
+        return self.shard(key).simple_upsert(table, key_columns, update_columns, **kwargs)
+
+    def simple_expanded_strings(self, key, table: str, **kwargs) -> list or dict:
+        return self.shard(key).simple_expanded_strings(table, **kwargs)
+
+    def param_check(self, key, table: str, **kwargs) -> bool:
+        return self.shard(key).param_check(table, **kwargs)
+
+    def param_insert_string(self, key, table: str, **kwargs):
+        return self.shard(key).param_insert_string(table, **kwargs)
+
+    def param_update(self, key,
+                     table: str,
+                     set_values: dict or list,
+                     where: dict or list = None):
+        return self.shard(key).param_update(table=table, set_values=set_values, where=where)
+
+    # ------------------------------------------------------------------------------------------------
+    # Bulk load --------------------------------------------------------------------------------------
+    # ------------------------------------------------------------------------------------------------
+    def bulk_insert(self, table: str,
+                    columns_names: list,
+                    rows,
+                    key_column: str,
+                    step: int = 10000,
+                    single_commit: bool = True):
+        '''
+        Раскладывает строки по шардам по значению столбца key_column и загружает их на все шарды одновременно
+            (см. CommonAdapterInterface.bulk_insert).
+
+        :param table: имя таблицы
+        :param columns_names: имена столбцов
+        :param rows: итерируемый набор кортежей со "сырыми" значениями
+        :param key_column: столбец с ключом шардирования
+        :param step: сколько строк отправлять за раз
+        :param single_commit: один коммит на шард или коммит после каждой порции
+        :return: ничего
+        '''
+        self.__load('bulk_insert', rows, key_column,
+                    table=table, columns_names=columns_names, step=step, single_commit=single_commit)
+        return
+
+    def bulk_upsert(self, table: str,
+                    columns_names: list,
+                    rows,
+                    key_column: str,
+                    key_columns: list,
+                    update_columns: list = None,
+                    step: int = 500,
+                    single_commit: bool = True):
+        '''
+        Как bulk_insert, но через CommonAdapterInterface.bulk_upsert.
+
+        :param key_column: столбец с ключом шардирования
+        :param key_columns: столбцы уникального ключа таблицы
+        :return: ничего
+        '''
+        self.__load('bulk_upsert', rows, key_column,
+                    table=table, columns_names=columns_names, key_columns=key_columns,
+                    update_columns=update_columns, step=step, single_commit=single_commit)
+        return
+
+    def __load(self, method: str,
+               rows,
+               key_column: str,
+               **kwargs):
+        try:
+            position = list(kwargs['columns_names']).index(key_column)
+        except ValueError:
+            raise ValueError(f'Key column {key_column} must be among columns {kwargs["columns_names"]}.') from None
+
+        groups = [[] for _ in self.__Shards]
+        for row in rows:
+            groups[self.shard_index(row[position])].append(row)
+
+        futures = [self.__executor.submit(getattr(shard, method), rows=group, **kwargs)
+                   for shard, group in zip(self.__Shards, groups) if group]
+        concurrent.futures.wait(futures)
+        for future in futures:
+            future.result()
+        return
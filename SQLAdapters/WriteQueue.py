@@ -0,0 +1,272 @@
+from .ResultCache import written_tables
+
+import concurrent.futures
+import queue
+import re
+import threading
+
+
+class WriteQueueFullError(Exception):
+    pass
+
+
+class WriteQueueClosedError(Exception):
+    pass
+
+
+_insert_pattern = re.compile(r'^\s*INSERT\s+INTO\s+([\w.`"\[\]]+)\s*(\([^()]*\))\s*VALUES\s*(\(.*\))\s*;?\s*$',
+                             re.IGNORECASE | re.DOTALL)
+_tail_pattern = re.compile(r'\)\s*(?:ON\s+(?:CONFLICT|DUPLICATE)|RETURNING)\b', re.IGNORECASE)
+
+
+def split_insert(request: str) -> (tuple, str, str) or (None, None, None):
+    '''
+    Разбирает "INSERT INTO таблица (столбцы) VALUES (...), ..." для склейки с соседними вставками.
+
+    :param request: запрос
+    :return: (ключ склейки (таблица, столбцы), начало запроса до строк значений, строки значений)
+        или (None, None, None), если запрос склеивать нельзя
+        (не вставка, INSERT ... SELECT, ON CONFLICT / ON DUPLICATE KEY / RETURNING)
+    '''
+    match = _insert_pattern.match(request)
+    if match is None or _tail_pattern.search(match.group(3)):
+        return None, None, None
+    table, columns, values = match.groups()
+    return (table.lower(), re.sub(r'\s+', '', columns).lower()), request[:match.start(3)], values
+
+
+_stop = object()  # Сигнал писателю остановиться
+
+
+class _Write:
+    __slots__ = ('request', 'params', 'future', 'key', 'prefix', 'values')
+
+    def __init__(self, request: str,
+                 params):
+        self.request = request
+        self.params = params
+        self.future = concurrent.futures.Future()
+        if isinstance(params, dict):  # Именованные параметры не склеиваются
+            self.key, self.prefix, self.values = None, None, None
+        else:
+            self.key, self.prefix, self.values = split_insert(request)
+
+
+class WriteQueue:
+    '''
+    Очередь записей "выстрелил и забыл" для CommonAdapterInterface: submit() кладёт запрос в ограниченную очередь
+        и сразу возвращает Future, а запросы выполняют фоновые потоки-писатели.
+    У писателей свой пул соединений (по одному на поток), поэтому они не занимают соединения адаптера.
+        Остальные настройки (таймаут запроса, повторы, кэш запросов) берутся у адаптера, а события запросов
+        уходят его хукам.
+    Подряд идущие вставки в одну таблицу с одинаковым списком столбцов склеиваются в один многострочный
+        INSERT. Если склеенный запрос не прошёл, вставки повторяются по одной, чтобы ошибка досталась только
+        своему Future. Повтор рассчитывает на то, что неудачный запрос не оставил строк. Для нетранзакционных
+        таблиц MySQL (MyISAM) это не так: строки до ошибочной останутся, и повтор вставит их второй раз.
+        Для таких таблиц склейку нужно выключить (coalesce=1).
+    Порядок выполнения сохраняется только при одном писателе.
+
+    Методы и свойства:
+        Adapter - адаптер писателей
+
+        size - запросов в очереди
+
+        submit() - поставить запрос в очередь
+
+        flush() - дождаться выполнения всех поставленных запросов
+
+        close() - выполнить оставшееся и остановить писателей
+    '''
+
+    def __init__(self, adapter,
+                 workers: int = 2,
+                 max_size: int = 10000,
+                 coalesce: int = 500,
+                 put_timeout: float or None = None):
+        '''
+
+        :param adapter: CommonAdapterInterface, от имени которого идут записи. Его кэш ответов сбрасывается
+            по изменённым таблицам.
+        :param workers: количество потоков-писателей
+        :param max_size: ёмкость очереди. Когда она заполнена, submit() ждёт (или падает, см. put_timeout).
+        :param coalesce: сколько вставок склеивать в один запрос. 1 - не склеивать.
+        :param put_timeout: сколько секунд submit() ждёт места в очереди. None - сколько потребуется,
+            0 - не ждать. Не дождался - WriteQueueFullError.
+        '''
+        if workers < 1:
+            raise ValueError(f'workers must be positive: {workers}')
+        if coalesce < 1:
+            raise ValueError(f'coalesce must be positive: {coalesce}')
+
+        self.__Owner = adapter
+        self.__Adapter = adapter.clone(min_connections=workers,
+                                       max_connections=workers,
+                                       per_process_pool=False)
+        self.__Adapter.add_hook(adapter.notify_hooks)  # Хуки владельца видят и фоновые записи
+        self.__coalesce = coalesce
+        self.__max_parameters = self.__Adapter.Driver.max_parameters
+        self.__put_timeout = put_timeout
+
+        self.__queue = queue.Queue(maxsize=max_size)
+        self.__closed = False
+        self.__running = workers  # Последний остановившийся писатель закрывает пул
+        self.__mutex = threading.Lock()
+        self.__workers = [threading.Thread(target=self.__work, name=f'WriteQueue-{number}', daemon=True)
+                          for number in range(workers)]
+        for worker in self.__workers:
+            worker.start()
+
+    @property
+    def Adapter(self):
+        return self.__Adapter
+
+    @property
+    def size(self) -> int:
+        return self.__queue.qsize()
+
+    @property
+    def closed(self) -> bool:
+        return self.__closed
+
+    def submit(self, request: str,
+               params: tuple or list or dict = None) -> concurrent.futures.Future:
+        '''
+        Ставит запрос с коммитом в очередь.
+
+        :param request: запрос, параметры обозначаются меткой адаптера
+        :param params: параметры запроса. None - запрос уже собран целиком.
+        :return: Future: результат None или исключение RequestExecutionError. Для asyncio - asyncio.wrap_future().
+        '''
+        if self.__closed:
+            raise WriteQueueClosedError('Write queue is closed.')
+
+        write = _Write(request=request, params=params)
+        try:
+            if self.__put_timeout == 0:
+                self.__queue.put_nowait(write)
+            else:
+                self.__queue.put(write, timeout=self.__put_timeout)
+        except queue.Full:
+            raise WriteQueueFullError(f'Write queue is full: {self.__queue.maxsize} requests.') from None
+        return write.future
+
+    def flush(self):
+        '''
+        Ждёт, пока выполнятся все поставленные в очередь запросы.
+
+        :return: ничего
+        '''
+        self.__queue.join()
+        return
+
+    def close(self, wait: bool = True):
+        '''
+        Перестаёт принимать запросы, выполняет оставшиеся и останавливает писателей. Пул писателей закрывает
+            последний остановившийся писатель, в том числе при wait=False.
+
+        :param wait: дождаться остановки писателей
+        :return: ничего
+        '''
+        with self.__mutex:
+            if self.__closed:
+                return
+            self.__closed = True
+
+        for _ in self.__workers:
+            self.__queue.put(_stop)
+        if wait:
+            for worker in self.__workers:
+                worker.join()
+        return
+
+    # ------------------------------------------------------------------------------------------------
+    # Писатели ---------------------------------------------------------------------------------------
+    # ------------------------------------------------------------------------------------------------
+    def __work(self):
+        try:
+            self.__drain()
+        finally:
+            with self.__mutex:
+                self.__running -= 1
+                last = self.__running == 0
+            if last:
+                self.__Adapter.close()
+        return
+
+    def __drain(self):
+        pending = None  # Запрос, взятый из очереди, но не подошедший к предыдущей склейке
+        while True:
+            first = pending if pending is not None else self.__queue.get()
+            pending = None
+            if first is _stop:
+                self.__queue.task_done()
+                break
+
+            group = [first]
+            if first.key is not None:
+                while len(group) < self.__coalesce:
+                    try:
+                        write = self.__queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if write is _stop or write.key != first.key or \
+                            (write.params is None) != (first.params is None) or \
+                            not self.__fits(group, write):
+                        pending = write
+                        break
+                    group.append(write)
+
+            try:
+                self.__write(group)
+            finally:
+                for _ in group:
+                    self.__queue.task_done()
+        return
+
+    def __fits(self, group: list,
+               write: _Write) -> bool:
+        if self.__max_parameters is None or write.params is None:
+            return True
+        used = sum(len(item.params) for item in group)
+        return used + len(write.params) <= self.__max_parameters
+
+    def __write(self, group: list):
+        group = [write for write in group if write.future.set_running_or_notify_cancel()]  # Без отменённых
+        if len(group) == 1:
+            self.__send(group[0])
+        if len(group) <= 1:
+            return
+
+        first = group[0]
+        request = first.prefix + ', '.join([write.values for write in group])
+        params = None
+        if first.params is not None:
+            params = [value for write in group for value in write.params]
+
+        try:
+            self.__Adapter.request_commit(request=request, params=params)
+        except BaseException:  # Найдём виноватую вставку
+            for write in group:
+                self.__send(write)
+            return
+
+        self.__invalidate(first.request)
+        for write in group:
+            write.future.set_result(None)
+        return
+
+    def __send(self, write: _Write):
+        try:
+            self.__Adapter.request_commit(request=write.request, params=write.params)
+        except BaseException as miss:
+            write.future.set_exception(miss)
+            return
+        self.__invalidate(write.request)
+        write.future.set_result(None)
+        return
+
+    def __invalidate(self, request: str):
+        cache = self.__Owner.Cache
+        if cache is not None:
+            cache.invalidate(written_tables(request))
+        return
@@ -1,2 +1,7 @@
 from .CommomAdapter import CommonAdapterInterface
-from .ConnectionData import RemoteConnectionData
\ No newline at end of file
+from .AsyncAdapter import AsyncAdapter
+from .ConnectionData import RemoteConnectionData
+from .ConnectionPool import ConnectionPool
+from .Drivers import Driver, register_driver
+from .ReplicatedAdapter import ReplicatedAdapter
+from .ShardedAdapter import ShardedAdapter
\ No newline at end of file
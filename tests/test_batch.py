@@ -0,0 +1,46 @@
+import os
+
+from SQLAdapters import CommonAdapterInterface
+
+
+def make_adapter(tmp_path):
+    adapter = CommonAdapterInterface(engine='SQLite', catalog=os.path.join(tmp_path, 'base.db'))
+    adapter.request_commit('CREATE TABLE t (x INTEGER)')
+    return adapter
+
+
+def values(adapter) -> list:
+    return [row[0] for row in adapter.request_fetch_all('SELECT x FROM t ORDER BY x')]
+
+
+def test_transaction_inside_batch_rolls_back_its_writes(tmp_path):
+    adapter = make_adapter(tmp_path)
+    with adapter.batch():
+        adapter.request_commit('INSERT INTO t VALUES (?)', (1,))
+        try:
+            with adapter.transaction():
+                adapter.request_commit('INSERT INTO t VALUES (?)', (2,))
+                raise KeyError
+        except KeyError:
+            pass
+        with adapter.transaction():
+            adapter.request_commit('INSERT INTO t VALUES (?)', (3,))
+    assert values(adapter) == [1, 3]
+    adapter.close()
+
+
+def test_nested_batch_rolls_back_its_writes(tmp_path):
+    adapter = make_adapter(tmp_path)
+    with adapter.batch():
+        adapter.request_commit('INSERT INTO t VALUES (?)', (1,))
+        try:
+            with adapter.batch():
+                adapter.request_commit('INSERT INTO t VALUES (?)', (2,))
+                adapter.bulk_insert('t', ['x'], [(3,)])
+                adapter.request_commit('INSERT INTO t VALUES (?)', (4,))
+                raise KeyError
+        except KeyError:
+            pass
+        adapter.request_commit('INSERT INTO t VALUES (?)', (5,))
+    assert values(adapter) == [1, 5]
+    adapter.close()